@@ -19,7 +19,35 @@ const sesClient = new SESClient({
   },
 });
 
-async function sendNotificationEmail(oldEndDate, newEndDate) {
+// Summarise the run_report.json written by process_all.py, one line per pipeline step
+async function readRunReport() {
+  try {
+    const report = JSON.parse(await fs.readFile("run_report.json", "utf-8"));
+    const steps = report.stages.filter((stage) => !stage.parent);
+    const lines = steps.map((stage) =>
+      stage.status === "skipped"
+        ? `${stage.name}: skipped (${stage.reason})`
+        : `${stage.name}: ${stage.status}, ${stage.wall_seconds}s wall, ` +
+          `${stage.cpu_seconds}s CPU, peak RSS +${stage.peak_rss_growth_mb} MB ` +
+          `(RSS ${stage.rss_start_mb ?? "-"} → ${stage.rss_end_mb ?? "-"} MB), ` +
+          `records ${stage.records_in ?? "-"} in / ${stage.records_out ?? "-"} out, ` +
+          `retries ${stage.retries}`
+    );
+    return { status: report.status, peak: report.peak_rss_mb, lines };
+  } catch (error) {
+    console.error("Could not read run_report.json:", error);
+    return null;
+  }
+}
+
+async function sendNotificationEmail(oldEndDate, newEndDate, runReport) {
+  const reportHtml = runReport
+    ? `<h3>Run report (${runReport.status}, peak ${runReport.peak} MB)</h3>
+            <ul>${runReport.lines.map((line) => `<li>${line}</li>`).join("")}</ul>`
+    : "";
+  const reportText = runReport
+    ? `\n\nRun report (${runReport.status}, peak ${runReport.peak} MB)\n${runReport.lines.join("\n")}`
+    : "";
   const params = {
     Source: process.env.AWS_SES_SENDER_EMAIL,
     Destination: {
@@ -36,10 +64,11 @@ async function sendNotificationEmail(oldEndDate, newEndDate) {
             <p>Tweet data has been updated. Check it worked correctly</p>
             <p><strong>Old End Date:</strong> ${oldEndDate}</p>
             <p><strong>New End Date:</strong> ${newEndDate}</p>
+            ${reportHtml}
           `,
         },
         Text: {
-          Data: `Data has been updated!\nOld End Date: ${oldEndDate}\nNew End Date: ${newEndDate}`,
+          Data: `Data has been updated!\nOld End Date: ${oldEndDate}\nNew End Date: ${newEndDate}${reportText}`,
         },
       },
     },
@@ -102,10 +131,20 @@ export default async function handler(req, res) {
         const lockFile = "/tmp/process_all.lock";
         await fs.writeFile(lockFile, Date.now().toString());
 
-        await execAsync("npm run process-data");
+        // A running watch.py already has the archive's analysis in memory;
+        // without one (or if its run fails) fall back to a cold run
+        try {
+          await execAsync("python3 watch.py --trigger fetch");
+        } catch {
+          await execAsync("npm run process-data");
+        }
 
         await fs.unlink(lockFile);
-        await sendNotificationEmail(currentEndDate, newEndDate);
+        await sendNotificationEmail(
+          currentEndDate,
+          newEndDate,
+          await readRunReport()
+        );
 
         return res.status(200).json({
           message: "Data updated and processing completed",
@@ -0,0 +1,228 @@
+import argparse
+import time
+import tracemalloc
+from collections import Counter
+
+from processTweets import (SELF_QUOTE_HANDLE, Analysis, SelfQuoteAnalysis, TweetIndex, default_tweets_file,
+                           link_domain, load_projected_tweets, projected, run_analyses, write_json_file)
+from sketches import HeavyHitters, HyperLogLog, Reservoir, quantiles
+
+APPROXIMATE_FILE = 'approximate_analytics.json'
+TOP = 100
+DISTRIBUTIONS = ('likes', 'retweets', 'text_length')
+# Sketch sizes, smallest to largest, for --compare
+CONFIGS = {
+    'small': {'epsilon': 0.002, 'precision': 10, 'reservoir': 1000},
+    'medium': {'epsilon': 0.0005, 'precision': 12, 'reservoir': 5000},
+    'large': {'epsilon': 0.0001, 'precision': 14, 'reservoir': 20000},
+}
+
+class StreamIndex(TweetIndex):
+    """Counts the tweets without keeping their records, so a sketch pass stays in fixed memory"""
+
+    def add(self, tweet):
+        record = projected(tweet)
+        if record.get('id_str') is not None:
+            self.tweet_count += 1
+        return record
+
+class SketchAnalysis(Analysis):
+    """The quote, link, mention and distribution counts shared by the exact and approximate modes.
+
+    Quoted ids come from the SelfQuoteAnalysis registered before it.
+    """
+
+    outputs = (APPROXIMATE_FILE,)
+
+    def __init__(self, self_quotes, top=TOP):
+        self.self_quotes = self_quotes
+        self.top = top
+
+    def add(self, tweet, record):
+        for quoted_id in self.self_quotes.current_quoted_ids:
+            self.count_quote(quoted_id)
+        for url in record.get('urls', []):
+            if url.get('expanded_url'):
+                self.count_domain(link_domain(url['expanded_url']))
+        for mention in record.get('user_mentions', []):
+            if mention.get('screen_name'):
+                self.count_mention(mention['screen_name'].lower())
+        self.sample('likes', int(record.get('favorite_count', 0) or 0))
+        self.sample('retweets', int(record.get('retweet_count', 0) or 0))
+        self.sample('text_length', len(record.get('full_text') or ''))
+
+    def finish(self, index, results):
+        return {APPROXIMATE_FILE: self.report()}
+
+class ApproximateAnalysis(SketchAnalysis):
+    """Most-quoted tweets, most-linked domains, distinct counts and distributions in fixed memory"""
+
+    def __init__(self, self_quotes, epsilon=0.0005, precision=12, reservoir=5000, top=TOP):
+        super().__init__(self_quotes, top)
+        self.quoted = HeavyHitters(top, epsilon)
+        self.domains = HeavyHitters(top, epsilon)
+        self.distinct_quoted = HyperLogLog(precision)
+        self.distinct_mentions = HyperLogLog(precision)
+        self.samples = {name: Reservoir(reservoir, seed=position) for position, name in enumerate(DISTRIBUTIONS)}
+
+    def count_quote(self, quoted_id):
+        self.quoted.add(quoted_id)
+        self.distinct_quoted.add(quoted_id)
+
+    def count_domain(self, domain):
+        self.domains.add(domain)
+
+    def count_mention(self, screen_name):
+        self.distinct_mentions.add(screen_name)
+
+    def sample(self, name, value):
+        self.samples[name].add(value)
+
+    def report(self):
+        return {
+            'mode': 'approximate',
+            'most_quoted': [{'tweet_id': tweet_id, 'count': count} for tweet_id, count in self.quoted.top()],
+            'most_linked_domains': [{'domain': domain, 'count': count} for domain, count in self.domains.top()],
+            'distinct_quoted_tweets': self.distinct_quoted.count(),
+            'distinct_mentions': self.distinct_mentions.count(),
+            'distributions': {name: sample.quantiles() for name, sample in self.samples.items()},
+            'error_bounds': {
+                # Count-Min never undercounts; this is the most it overcounts with probability 1 - delta
+                'most_quoted_overcount': self.quoted.sketch.error_bound(),
+                'most_linked_domains_overcount': self.domains.sketch.error_bound(),
+                'count_confidence': round(1 - self.quoted.sketch.delta, 4),
+                'distinct_relative_error': round(self.distinct_quoted.relative_error(), 4),
+                'quantile_rank_error': {name: round(sample.rank_error(), 4) for name, sample in self.samples.items()},
+            },
+            'sketch_bytes': (self.quoted.sketch.memory_bytes() + self.domains.sketch.memory_bytes()
+                             + self.distinct_quoted.memory_bytes() + self.distinct_mentions.memory_bytes()),
+        }
+
+class ExactAnalysis(SketchAnalysis):
+    """The same report from Counters, sets and full value lists, which grow with the archive"""
+
+    def __init__(self, self_quotes, top=TOP):
+        super().__init__(self_quotes, top)
+        self.quoted = Counter()
+        self.domains = Counter()
+        self.mentions = set()
+        self.values = {name: [] for name in DISTRIBUTIONS}
+
+    def count_quote(self, quoted_id):
+        self.quoted[quoted_id] += 1
+
+    def count_domain(self, domain):
+        self.domains[domain] += 1
+
+    def count_mention(self, screen_name):
+        self.mentions.add(screen_name)
+
+    def sample(self, name, value):
+        self.values[name].append(value)
+
+    def report(self):
+        ranked = lambda counter: sorted(counter.items(), key=lambda item: (-item[1], item[0]))[:self.top]
+        return {
+            'mode': 'exact',
+            'most_quoted': [{'tweet_id': tweet_id, 'count': count} for tweet_id, count in ranked(self.quoted)],
+            'most_linked_domains': [{'domain': domain, 'count': count} for domain, count in ranked(self.domains)],
+            'distinct_quoted_tweets': len(self.quoted),
+            'distinct_mentions': len(self.mentions),
+            'distributions': {name: quantiles(values) for name, values in self.values.items()},
+        }
+
+def analyse(tweets, make_analysis, handle=SELF_QUOTE_HANDLE):
+    """(analysis, report) of one pass of run_analyses, with the self-quote scan feeding make_analysis's"""
+    self_quotes = SelfQuoteAnalysis(handle, sort=False, collect=False)
+    analysis = make_analysis(self_quotes)
+    results, _ = run_analyses(tweets, [self_quotes, analysis], StreamIndex())
+    return analysis, results[APPROXIMATE_FILE]
+
+def analyse_approximate(filename=None, handle=SELF_QUOTE_HANDLE, **config):
+    """The approximate report over a tweets file, streamed so memory stays fixed"""
+    tweets = load_projected_tweets(filename or default_tweets_file())
+    return analyse(tweets, lambda self_quotes: ApproximateAnalysis(self_quotes, **config), handle)[1]
+
+def accuracy(true_counts, approximate):
+    """How well an approximate top list matches the true counts.
+
+    Ties make "the" exact top K ambiguous, so an entry counts as a hit when
+    its true count is at least the K-th largest true count.
+    """
+    if not approximate:
+        return {'precision': 1.0, 'max_overcount': 0}
+    threshold = sorted(true_counts.values(), reverse=True)[min(len(approximate), len(true_counts)) - 1]
+    hits = sum(1 for item, _ in approximate if true_counts.get(item, 0) >= threshold)
+    return {
+        'precision': round(hits / len(approximate), 3),
+        'max_overcount': max(estimate - true_counts.get(item, 0) for item, estimate in approximate),
+    }
+
+def relative_error(estimate, truth):
+    return round(abs(estimate - truth) / truth, 4) if truth else 0.0
+
+def measure(filename, make_analysis, handle=SELF_QUOTE_HANDLE):
+    """(analysis, report, seconds, peak traced MB) for one run over the file, the structures included"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    analysis, report = analyse(load_projected_tweets(filename), make_analysis, handle)
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return analysis, report, round(seconds, 2), round(peak / (1 << 20), 2)
+
+def compare(filename, handle=SELF_QUOTE_HANDLE):
+    """Run the exact path and every sketch size over the same file and tabulate memory against accuracy"""
+    exact, exact_report, seconds, peak = measure(filename, ExactAnalysis, handle)
+    rows = [{'mode': 'exact', 'seconds': seconds, 'peak_mb': peak}]
+    print(f"{'mode':<8} {'seconds':>8} {'peak MB':>8} {'quote prec':>10} {'overcount':>9} "
+          f"{'domain prec':>11} {'distinct err':>12} {'mention err':>11}", flush=True)
+    print(f"{'exact':<8} {seconds:>8} {peak:>8} {1.0:>10} {0:>9} {1.0:>11} {0.0:>12} {0.0:>11}", flush=True)
+    for name, config in CONFIGS.items():
+        approximate, report, seconds, peak = measure(
+            filename, lambda self_quotes: ApproximateAnalysis(self_quotes, **config), handle)
+        row = {
+            'mode': name,
+            'config': config,
+            'seconds': seconds,
+            'peak_mb': peak,
+            'sketch_bytes': report['sketch_bytes'],
+            'most_quoted': accuracy(exact.quoted, approximate.quoted.top()),
+            'most_linked_domains': accuracy(exact.domains, approximate.domains.top()),
+            'distinct_quoted_error': relative_error(report['distinct_quoted_tweets'],
+                                                    exact_report['distinct_quoted_tweets']),
+            'distinct_mentions_error': relative_error(report['distinct_mentions'], exact_report['distinct_mentions']),
+            'distributions': report['distributions'],
+            'error_bounds': report['error_bounds'],
+        }
+        rows.append(row)
+        print(f"{name:<8} {seconds:>8} {peak:>8} {row['most_quoted']['precision']:>10} "
+              f"{row['most_quoted']['max_overcount']:>9} {row['most_linked_domains']['precision']:>11} "
+              f"{row['distinct_quoted_error']:>12} {row['distinct_mentions_error']:>11}", flush=True)
+    return {
+        'tweets_file': filename,
+        'exact': {key: exact_report[key] for key in ('distinct_quoted_tweets', 'distinct_mentions', 'distributions')},
+        'runs': rows,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Quote, link and mention analytics in fixed memory with sketches")
+    parser.add_argument('--handle', default=SELF_QUOTE_HANDLE)
+    parser.add_argument('--size', choices=sorted(CONFIGS), default='medium', help="sketch size")
+    parser.add_argument('--compare', metavar='OUTPUT',
+                        help="benchmark every sketch size against the exact path and save the results here")
+    args = parser.parse_args()
+
+    filename = default_tweets_file()
+    if args.compare:
+        write_json_file(args.compare, compare(filename, args.handle))
+        print(f"✓ Saved {args.compare}", flush=True)
+        return
+
+    report = analyse_approximate(filename, args.handle, **CONFIGS[args.size])
+    write_json_file(APPROXIMATE_FILE, report)
+    print(f"✓ Saved {APPROXIMATE_FILE}: ~{report['distinct_quoted_tweets']} quoted tweets, "
+          f"counts within +{report['error_bounds']['most_quoted_overcount']}", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from download import ARCHIVE_URL, archive_url, downloadUserData
+
+ACCOUNTS_DIR = 'accounts'
+BATCH_REPORT_FILE = 'batch_report.json'
+DOWNLOAD_WORKERS = 4
+LOG_FILE = 'run.log'
+
+def read_accounts(filename):
+    """Usernames from a file, one per line; blank lines and # comments are ignored"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [line.split('#')[0].strip() for line in f if line.split('#')[0].strip()]
+
+def account_dir(username, root=ACCOUNTS_DIR):
+    return os.path.join(root, username.lower())
+
+def fetch_account(username, directory, url_template):
+    """Download one account's archive into its directory; I/O bound, so it runs on a thread"""
+    os.makedirs(directory, exist_ok=True)
+    downloadUserData(username, url=archive_url(username, url_template),
+                     output=os.path.join(directory, f'{username}.json'), workers=1)
+
+def run_account(username, directory, resume=False, force=False):
+    """Run the pipeline for one account inside its directory, logging to its own run.log.
+
+    Runs in a fresh worker process, so the working directory and the
+    telemetry collector belong to this account alone.
+    """
+    from process_all import build_pipeline
+    from telemetry import telemetry
+
+    os.chdir(directory)
+    # Workers are reused before Python 3.11, so start this account's report afresh
+    telemetry.reset()
+    log = open(LOG_FILE, 'w', encoding='utf-8')
+    os.dup2(log.fileno(), sys.stdout.fileno())
+    os.dup2(log.fileno(), sys.stderr.fileno())
+
+    started = time.time()
+    status, error = 'ok', None
+    try:
+        build_pipeline(username, fetch=False).run(resume=resume, force=force)
+    except Exception as e:
+        status, error = 'failed', str(e)
+        print(f"\n❌ Error: {error}", flush=True)
+    telemetry.write_report(status)
+    return {'status': status, 'error': error, 'seconds': round(time.time() - started, 1)}
+
+def run_batch(usernames, root=ACCOUNTS_DIR, workers=None, download_workers=DOWNLOAD_WORKERS,
+              url_template=ARCHIVE_URL, resume=False, force=False):
+    """Run every account's pipeline, downloading archives on threads while earlier ones are processed.
+
+    An account's pipeline is queued on the process pool as soon as its archive
+    is on disk. A failed download or pipeline is recorded and the rest go on.
+    Returns {username: {'status', 'error', 'seconds', 'directory'}}.
+    """
+    workers = workers or min(os.cpu_count() or 1, 4)
+    results = {}
+    # spawn and, from Python 3.11, one task per child: every account starts from a clean process
+    context = multiprocessing.get_context('spawn')
+    recycle = {'max_tasks_per_child': 1} if sys.version_info >= (3, 11) else {}
+    with ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context, **recycle) as pool:
+        fetches = {
+            downloads.submit(fetch_account, username, account_dir(username, root), url_template): username
+            for username in usernames
+        }
+        runs = {}
+        for future in as_completed(fetches):
+            username = fetches[future]
+            directory = os.path.abspath(account_dir(username, root))
+            try:
+                future.result()
+            except Exception as e:
+                print(f"❌ {username}: download failed: {str(e)}", flush=True)
+                results[username] = {'status': 'download failed', 'error': str(e), 'seconds': None}
+                continue
+            print(f"Queued {username} for processing", flush=True)
+            runs[pool.submit(run_account, username, directory, resume, force)] = username
+
+        for future in as_completed(runs):
+            username = runs[future]
+            try:
+                results[username] = future.result()
+            except Exception as e:
+                # The worker itself died, e.g. killed for running out of memory
+                results[username] = {'status': 'failed', 'error': f"{type(e).__name__}: {str(e)}", 'seconds': None}
+            result = results[username]
+            if result['status'] == 'ok':
+                print(f"✓ {username} processed in {result['seconds']}s", flush=True)
+            else:
+                print(f"❌ {username} failed: {result['error']}", flush=True)
+
+    for username in results:
+        results[username]['directory'] = account_dir(username, root)
+    return {username: results[username] for username in usernames}
+
+def write_batch_report(results, started, filename):
+    report = {
+        'started': started,
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'accounts': [dict(result, username=username) for username, result in results.items()],
+    }
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(temp_filename, filename)
+    print(f"✓ Saved {filename}", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the whole pipeline for several accounts")
+    parser.add_argument('accounts', nargs='*', help="usernames to process")
+    parser.add_argument('--accounts-file', help="file with one username per line")
+    parser.add_argument('--output-dir', default=ACCOUNTS_DIR,
+                        help=f"where each account gets its own directory (default: {ACCOUNTS_DIR})")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="accounts processed at once (default: cores, at most 4)")
+    parser.add_argument('--download-workers', type=int, default=DOWNLOAD_WORKERS,
+                        help="archives downloaded at once")
+    parser.add_argument('--url-template', default=ARCHIVE_URL,
+                        help="archive URL with a {username} placeholder (point it at a local server to test)")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip the steps each account completed before its last failed run")
+    parser.add_argument('--force', action='store_true',
+                        help="run every step even if its inputs haven't changed")
+    args = parser.parse_args()
+
+    usernames = list(args.accounts)
+    if args.accounts_file:
+        usernames += read_accounts(args.accounts_file)
+    # One run per account even if it is listed twice
+    usernames = list({username.lower(): username for username in usernames}.values())
+    if not usernames:
+        parser.error("no accounts given")
+
+    started = datetime.now().isoformat(timespec='seconds')
+    print(f"Processing {len(usernames)} accounts into {args.output_dir}/", flush=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+    results = run_batch(usernames, args.output_dir, args.workers, args.download_workers,
+                        args.url_template, args.resume, args.force)
+    write_batch_report(results, started, os.path.join(args.output_dir, BATCH_REPORT_FILE))
+
+    failed = [username for username, result in results.items() if result['status'] != 'ok']
+    print(f"\n{len(results) - len(failed)} of {len(results)} accounts processed", flush=True)
+    if failed:
+        print(f"❌ Failed: {', '.join(failed)}", flush=True)
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ARCHIVE_FILE = 'visakanv.json'
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_THRESHOLD = 0.2
+# Differences smaller than this are timer noise, not regressions
+MIN_SECONDS_DELTA = 0.05
+MIN_RSS_DELTA_MB = 5
+SHAPES = ('wrapped', 'bare', 'nested', 'mixed')
+WORDS = ['threads', 'writing', 'twitter', 'friends', 'ideas', 'cats', 'books', 'attention', 'learning', 'internet']
+MENTIONS = ['someone', 'friend', 'reader', 'writer', 'mutual']
+LINKS = ['https://example.com/post', 'https://www.nytimes.com/article', 'https://visakanv.com/blog/page']
+USER_ID = '16884623'
+# Snowflake ids count milliseconds from here, shifted past 22 bits of worker and sequence
+TWITTER_EPOCH_MS = 1288834974657
+
+def generate_archive(filename, tweets, seed=1, self_quote_ratio=0.2, reply_ratio=0.3, branching=0.1,
+                     thread_length=6, url_density=0.1, mention_density=0.1, shape='wrapped'):
+    """Write a synthetic archive in the format download.py fetches.
+
+    reply_ratio is the share of tweets that continue one of the open self-reply
+    threads, thread_length the mean number of tweets before a thread is closed
+    and branching the chance a reply goes to an earlier tweet of its thread
+    instead of the latest one. shape picks the tweet record layout:
+    {"tweet": ...} objects, bare tweets, lists of {"tweet": ...} objects, or a
+    mix of all three.
+    """
+    rng = random.Random(seed)
+    # Tweets from 2019 on, so ids have the 19 digits real ones have had since around 2015
+    start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+    ids = []
+    open_threads = []
+
+    def make_tweet(position):
+        created_at = start + timedelta(minutes=position * 5 + rng.randint(0, 4))
+        timestamp_ms = int(created_at.timestamp() * 1000) + rng.randint(0, 999)
+        tweet_id = str(((timestamp_ms - TWITTER_EPOCH_MS) << 22) | rng.getrandbits(22))
+        tweet = {
+            'id_str': tweet_id,
+            'id': tweet_id,
+            'created_at': created_at.strftime('%a %b %d %H:%M:%S +0000 %Y'),
+            'full_text': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 30))),
+            'favorite_count': str(int(rng.paretovariate(1.2)) - 1),
+            'retweet_count': str(int(rng.paretovariate(1.6)) - 1),
+            'retweeted': False,
+            'entities': {'hashtags': [], 'symbols': [], 'user_mentions': [], 'urls': []},
+            'display_text_range': ['0', '140'],
+        }
+
+        if open_threads and rng.random() < reply_ratio:
+            thread = rng.choice(open_threads)
+            parent = rng.choice(thread) if rng.random() < branching else thread[-1]
+            tweet.update({
+                'in_reply_to_status_id_str': parent,
+                'in_reply_to_status_id': parent,
+                'in_reply_to_user_id_str': USER_ID,
+                'in_reply_to_screen_name': 'visakanv',
+            })
+            thread.append(tweet_id)
+            if rng.random() < 1 / thread_length:
+                open_threads.remove(thread)
+        else:
+            open_threads.append([tweet_id])
+            # Keep the number of concurrently open threads bounded
+            if len(open_threads) > 50:
+                open_threads.pop(0)
+
+        if rng.random() < mention_density:
+            screen_name = rng.choice(MENTIONS)
+            tweet['entities']['user_mentions'].append({
+                'name': screen_name.title(), 'screen_name': screen_name,
+                'id_str': str(rng.randint(1, 10 ** 9)), 'indices': ['0', str(len(screen_name) + 1)]
+            })
+        if ids and rng.random() < self_quote_ratio:
+            # Quotes favour recent tweets; a few point at ids that aren't in the archive
+            quoted = ids[-1 - min(int(rng.expovariate(1 / 500)), len(ids) - 1)] \
+                if rng.random() < 0.95 else str(rng.randint(10 ** 18, 2 ** 63 - 1))
+            tweet['entities']['urls'].append({
+                'url': 'https://t.co/quote', 'expanded_url': f'https://twitter.com/visakanv/status/{quoted}',
+                'display_url': 'twitter.com/visakanv/statu…', 'indices': ['100', '123']
+            })
+        if rng.random() < url_density:
+            tweet['entities']['urls'].append({
+                'url': 'https://t.co/link', 'expanded_url': rng.choice(LINKS),
+                'display_url': 'example.com/…', 'indices': ['80', '103']
+            })
+        ids.append(tweet_id)
+        return tweet
+
+    def record(tweet, layout):
+        return tweet if layout == 'bare' else {'tweet': tweet}
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('{"account":[{"account":{"username":"visakanv","accountId":"%s"}}],' % USER_ID)
+        f.write('"profile":[{"profile":{"description":{"bio":"synthetic"}}}],"tweets":[')
+        position = 0
+        first = True
+        while position < tweets:
+            layout = rng.choice(SHAPES[:3]) if shape == 'mixed' else shape
+            if layout == 'nested':
+                group = [record(make_tweet(position + i), 'wrapped')
+                         for i in range(min(rng.randint(1, 5), tweets - position))]
+                position += len(group)
+                item = group
+            else:
+                item = record(make_tweet(position), layout)
+                position += 1
+            f.write(('' if first else ',') + json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+            first = False
+        end_date = (start + timedelta(minutes=tweets * 5 + 60)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        f.write('],"upload-options":{"keepPrivate":false,"uploadLikes":false,'
+                '"startDate":"%s","endDate":"%s"}}' % (start.strftime('%Y-%m-%dT%H:%M:%S.000Z'), end_date))
+
+def load_archive_tweets():
+    from processTweets import load_tweets
+    return list(load_tweets('tweets.ndjson'))
+
+def setup_nothing():
+    return None
+
+def run_create_files(_):
+    from createFiles import process_json_file
+    process_json_file(ARCHIVE_FILE, delete_input=False)
+
+def run_process_tweets(_):
+    from processTweets import process_tweets
+    process_tweets()
+
+def run_process_tweets_incremental(_):
+    from processTweets import process_tweets
+    process_tweets(incremental=True)
+
+def run_analyse_store(_):
+    from tweetStore import analyse_store
+    analyse_store()
+
+def run_find_self_quotes(tweets):
+    from processTweets import find_self_quotes
+    find_self_quotes(tweets)
+
+def setup_self_quotes():
+    from processTweets import find_self_quotes
+    return find_self_quotes(load_archive_tweets())
+
+def run_count_quote_tweets(self_quoted_tweets):
+    from processTweets import count_quote_tweets
+    count_quote_tweets(self_quoted_tweets)
+
+def setup_tweets_and_counts():
+    from processTweets import load_json_file
+    return load_archive_tweets(), load_json_file('countSelfQuotes.json')
+
+def run_extract_tweet_info(data):
+    from processTweets import extract_tweet_info
+    extract_tweet_info(*data)
+
+def run_find_threads(tweets):
+    from processTweets import find_threads
+    find_threads(tweets)
+
+def run_parallel_self_quotes(_):
+    from parallelQuotes import parallel_self_quotes
+    parallel_self_quotes('tweets.ndjson')
+
+def run_exact_analytics(_):
+    from approximateAnalytics import ExactAnalysis, analyse
+    from processTweets import load_projected_tweets
+    analyse(load_projected_tweets('tweets.ndjson'), ExactAnalysis)
+
+def run_approximate_analytics(_):
+    from approximateAnalytics import analyse_approximate
+    analyse_approximate('tweets.ndjson')
+
+def run_decode_tweets(_):
+    from processTweets import load_tweets, project_tweet
+    for _ in map(project_tweet, load_tweets('tweets.ndjson')):
+        pass
+
+def run_decode_projection(_):
+    from processTweets import load_records
+    for _ in load_records('tweets.ndjson'):
+        pass
+
+def run_related_tweets(_):
+    from processTweets import load_records
+    from relatedTweets import find_related, is_retweet
+    find_related([record.get('full_text') for record in load_records('tweets.ndjson') if not is_retweet(record)])
+
+def run_publish(_):
+    from process_all import ANALYSIS_FILES, ARCHIVE_FILES
+    from publish import publish
+    publish(['tweets.json'] + ANALYSIS_FILES + ARCHIVE_FILES)
+
+# name -> (untimed setup, timed stage), run in this order in one working directory
+STAGES = {
+    'createFiles': (setup_nothing, run_create_files),
+    'processTweets': (setup_nothing, run_process_tweets),
+    'processTweets --incremental': (setup_nothing, run_process_tweets_incremental),
+    'analyse_store': (setup_nothing, run_analyse_store),
+    'find_self_quotes': (load_archive_tweets, run_find_self_quotes),
+    'count_quote_tweets': (setup_self_quotes, run_count_quote_tweets),
+    'extract_tweet_info': (setup_tweets_and_counts, run_extract_tweet_info),
+    'find_threads': (load_archive_tweets, run_find_threads),
+    'parallel_self_quotes': (setup_nothing, run_parallel_self_quotes),
+    'decode_tweets': (setup_nothing, run_decode_tweets),
+    'decode_projection': (setup_nothing, run_decode_projection),
+    'exact_analytics': (setup_nothing, run_exact_analytics),
+    'approximate_analytics': (setup_nothing, run_approximate_analytics),
+    'related_tweets': (setup_nothing, run_related_tweets),
+    'publish': (setup_nothing, run_publish),
+}
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def stage_worker(name, workdir, package_dir, results):
+    """Run one stage in a fresh interpreter, so its peak memory is its own"""
+    sys.path.insert(0, package_dir)
+    os.chdir(workdir)
+    # Keep the stages' progress output out of the report
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    try:
+        setup, run = STAGES[name]
+        data = setup()
+        setup_rss = peak_rss_mb()
+        start = time.perf_counter()
+        run(data)
+        seconds = time.perf_counter() - start
+        results.put({'seconds': round(seconds, 4), 'setup_rss_mb': setup_rss, 'peak_rss_mb': peak_rss_mb()})
+    except Exception as e:
+        results.put({'error': f"{type(e).__name__}: {str(e)}"})
+
+def run_stage(name, workdir, tweets):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=stage_worker,
+                              args=(name, workdir, os.path.dirname(os.path.abspath(__file__)), results))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            # A stage killed for running out of memory never reports back
+            if not process.is_alive():
+                result = {'error': f"stage process exited with code {process.exitcode}"}
+                break
+    process.join()
+    if 'error' not in result:
+        result['tweets_per_second'] = round(tweets / result['seconds']) if result['seconds'] else None
+    return result
+
+def benchmark_size(tweets, options, stages):
+    workdir = tempfile.mkdtemp(prefix=f'bench-{tweets}-')
+    try:
+        print(f"\n=== {tweets} tweets ===", flush=True)
+        start = time.perf_counter()
+        generate_archive(os.path.join(workdir, ARCHIVE_FILE), tweets, **options)
+        generated = {
+            'seconds': round(time.perf_counter() - start, 4),
+            'archive_mb': round(os.path.getsize(os.path.join(workdir, ARCHIVE_FILE)) / (1 << 20), 1)
+        }
+        print(f"Generated a {generated['archive_mb']} MB archive in {generated['seconds']:.1f}s", flush=True)
+        results = {'generate': generated}
+        for name in stages:
+            result = run_stage(name, workdir, tweets)
+            results[name] = result
+            if 'error' in result:
+                print(f"❌ {name}: {result['error']}", flush=True)
+            else:
+                print(f"✓ {name}: {result['seconds']:.2f}s, {result['tweets_per_second']} tweets/s, "
+                      f"peak {result['peak_rss_mb']} MB", flush=True)
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def compare(baseline, current, threshold):
+    """Stage timings or peak memory that grew by more than threshold; returns the regressions found"""
+    regressions = []
+    for size, stages in current['results'].items():
+        for name, result in stages.items():
+            base = baseline['results'].get(size, {}).get(name)
+            if not base or 'error' in base or 'error' in result or name == 'generate':
+                continue
+            for metric, min_delta in (('seconds', MIN_SECONDS_DELTA), ('peak_rss_mb', MIN_RSS_DELTA_MB)):
+                before, after = base[metric], result[metric]
+                if after > before * (1 + threshold) and after - before > min_delta:
+                    regressions.append(f"{size} tweets, {name}: {metric} {before} -> {after} "
+                                       f"(+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on seeded synthetic archives")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="tweet counts to benchmark")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES),
+                        help="stages to run (createFiles always runs first to lay out the inputs)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--self-quote-ratio', type=float, default=0.2)
+    parser.add_argument('--reply-ratio', type=float, default=0.3, help="share of tweets that are self-replies")
+    parser.add_argument('--branching', type=float, default=0.1,
+                        help="chance a reply goes to an earlier tweet of its thread instead of the latest")
+    parser.add_argument('--thread-length', type=float, default=6, help="mean tweets per thread")
+    parser.add_argument('--url-density', type=float, default=0.1, help="share of tweets with an outside link")
+    parser.add_argument('--mention-density', type=float, default=0.1, help="share of tweets with a mention")
+    parser.add_argument('--shape', choices=SHAPES, default='wrapped', help="tweet record layout")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the results")
+    parser.add_argument('--baseline', help="earlier results to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown or memory growth reported as a regression")
+    parser.add_argument('--generate-only', metavar='FILE',
+                        help="only write a synthetic archive of the first size to FILE")
+    args = parser.parse_args()
+
+    options = {
+        'seed': args.seed,
+        'self_quote_ratio': args.self_quote_ratio,
+        'reply_ratio': args.reply_ratio,
+        'branching': args.branching,
+        'thread_length': args.thread_length,
+        'url_density': args.url_density,
+        'mention_density': args.mention_density,
+        'shape': args.shape,
+    }
+    if args.generate_only:
+        generate_archive(args.generate_only, args.sizes[0], **options)
+        print(f"✓ Wrote {args.sizes[0]} tweets to {args.generate_only}", flush=True)
+        return
+
+    stages = ['createFiles'] + [name for name in args.stages if name != 'createFiles']
+    current = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'options': options,
+        },
+        'results': {str(size): benchmark_size(size, options, stages) for size in args.sizes}
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(current, f, indent=2)
+    print(f"\n✓ Saved {args.output}", flush=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('options') != options:
+            print("! The baseline was generated with different archive options", flush=True)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) above {args.threshold * 100:.0f}% against {args.baseline}:")
+            for regression in regressions:
+                print(f"- {regression}")
+            raise SystemExit(1)
+        print(f"✓ No regressions above {args.threshold * 100:.0f}% against {args.baseline}", flush=True)
+
+if __name__ == "__main__":
+    main()
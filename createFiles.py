@@ -1,72 +1,319 @@
-import pandas as pd
+import codecs
 import json
 from tqdm import tqdm
 import os
+from processTweets import ProjectionWriter, iter_tweets, project_tweet, source_signature
+from tweetStore import TweetStoreWriter
 
-def process_json_file(input_file='visakanv.json'):
+WHITESPACE = ' \t\n\r'
+
+class JsonStreamReader:
+    """Incremental tokenizer over one large JSON document.
+
+    Only the structural characters of the containers we walk through are
+    tokenized here; every leaf value (a single tweet, the account record, ...)
+    is handed to json's raw_decode once enough of it is buffered.
+    """
+
+    def __init__(self, f, chunk_size=1 << 20, on_read=None):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.on_read = on_read
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.consumed = 0  # characters dropped from the front of the buffer
+        self.eof = False
+
+    def _fill(self, min_size=None):
+        """Read another chunk, dropping what has already been consumed"""
+        if self.eof:
+            return False
+        raw = self.f.read(min_size or self.chunk_size)
+        if self.on_read:
+            self.on_read(len(raw))
+        if not raw:
+            self.eof = True
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(b'', final=True)
+        else:
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(raw)
+        self.consumed += self.pos
+        self.pos = 0
+        return True
+
+    def position(self):
+        return self.consumed + self.pos
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(f"Expected '{char}'", found or '<EOF>', self.position())
+        self.pos += 1
+
+    def _truncated(self, error):
+        """Whether a decode error may only mean the value runs past the end of the buffer.
+
+        Anything else is a syntax error that more input can't fix, so it is
+        raised at once instead of reading on to the end of the file.
+        """
+        # An unterminated string is reported where it starts; an escape cut short within its 6 characters
+        return error.msg.startswith('Unterminated string') or error.pos >= len(self.buffer) - 6
+
+    def decode_value(self):
+        """Decode the next complete value, reading more input until it fits"""
+        self.peek()
+        read_size = self.chunk_size
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+                # A number or literal ending exactly at the buffer edge may be truncated
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof or not self._truncated(e):
+                    # Report the offset in the whole document, not in the buffer
+                    e.pos += self.consumed
+                    raise
+            # Grow reads geometrically so one large value isn't re-parsed per chunk
+            self._fill(read_size)
+            read_size *= 2
+
+    def iter_array(self):
+        """Yield the elements of the array at the cursor one at a time"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise json.JSONDecodeError("Expected ',' or ']'", separator or '<EOF>', self.position())
+
+    def iter_object_keys(self):
+        """Yield each key of the object at the cursor; the caller must consume its value"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(':')
+            yield key
+            separator = self.peek()
+            self.pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise json.JSONDecodeError("Expected ',' or '}'", separator or '<EOF>', self.position())
+
+    def skip_value(self):
+        """Consume the next value, streaming through arrays so big sections aren't materialised"""
+        if self.peek() == '[':
+            for _ in self.iter_array():
+                pass
+        else:
+            self.decode_value()
+
+class TweetChanges:
+    """The tweets an archive adds or changes against the projected records of an earlier run, and the ids it lost.
+
+    watch.py keeps the analysed records in memory and has createFiles fill
+    one of these in while it writes the projection, so processTweets only
+    applies what changed instead of reading the NDJSON file again.
+    """
+
+    def __init__(self, previous):
+        self.previous = previous
+        self.seen = set()
+        self.added = []
+        self.changed = []
+        # The NDJSON file this describes the change to, once it has been written
+        self.signature = None
+
+    def record(self, tweet, record):
+        tweet_id = record.get('id_str')
+        if tweet_id is None:
+            return
+        self.seen.add(tweet_id)
+        previous = self.previous.get(tweet_id)
+        if previous is None:
+            self.added.append((tweet, record))
+        elif previous != record:
+            self.changed.append((tweet, record, previous))
+
+    @property
+    def removed(self):
+        return [tweet_id for tweet_id in self.previous if tweet_id not in self.seen]
+
+class TweetSink:
+    """Writes tweets as they arrive: NDJSON for later stages with each tweet's projection
+    beside it and, when given a store writer, the columnar tweet store"""
+
+    def __init__(self, ndjson_file='tweets.ndjson', store=None, changes=None):
+        self.ndjson_file = ndjson_file
+        # Written beside the last run's file and swapped in by close(), so a crash never leaves it truncated
+        self.temp_file = f"{ndjson_file}.tmp"
+        self.store = store
+        self.changes = changes
+        self.ndjson = None
+        self.projection = None
+        self.offset = 0
+        self.count = 0
+
+    def start(self):
+        self.ndjson = open(self.temp_file, 'w', encoding='utf-8')
+        self.projection = ProjectionWriter(self.ndjson_file)
+
+    def write(self, tweet):
+        line = json.dumps(tweet, ensure_ascii=False)
+        if self.ndjson is None:
+            self.start()
+        self.ndjson.write(line + '\n')
+        length = len(line.encode('utf-8')) + 1
+        # The projection and the store take one bare tweet at a time, whatever shape the archive wraps them in
+        for item, bare_tweet in enumerate(iter_tweets([tweet])):
+            record = project_tweet(bare_tweet)
+            self.projection.write(self.offset, length, item, record)
+            if self.changes is not None:
+                self.changes.record(bare_tweet, record)
+            if self.store is not None:
+                self.store.write(bare_tweet)
+        self.offset += length
+        self.count += 1
+
+    def close(self, complete=True):
+        """Finish the files; an archive that wasn't read to the end gets no projection or store to trust.
+
+        A complete archive replaces the last run's tweets even when it holds none,
+        so later stages never analyse tweets it no longer has.
+        """
+        if complete and self.ndjson is None:
+            self.start()
+        if self.ndjson is not None:
+            self.ndjson.close()
+            if complete:
+                os.replace(self.temp_file, self.ndjson_file)
+                # Signed after the NDJSON is in place, so the projection is only used with this exact file
+                signature = source_signature(self.ndjson_file)
+                self.projection.close(dict(signature))
+                if self.changes is not None:
+                    self.changes.signature = signature
+            else:
+                os.remove(self.temp_file)
+                self.projection.abort()
+        if self.store is not None:
+            if complete:
+                self.store.close()
+            else:
+                self.store.abort()
+
+def iter_archive_sections(reader):
+    """Yield the top-level keys of the archive, whether it is one object or a list of objects"""
+    if reader.peek() == '[':
+        reader.expect('[')
+        if reader.peek() == ']':
+            reader.pos += 1
+            return
+        while True:
+            if reader.peek() == '{':
+                yield from reader.iter_object_keys()
+            else:
+                reader.skip_value()
+            separator = reader.peek()
+            reader.pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise json.JSONDecodeError("Expected ',' or ']'", separator or '<EOF>', reader.position())
+    else:
+        yield from reader.iter_object_keys()
+
+def stream_archive(f, tweet_sink, section_sinks, on_read=None):
+    """Route each archive section to its sink while reading, without building a tweet list"""
+    reader = JsonStreamReader(f, on_read=on_read)
+    for key in iter_archive_sections(reader):
+        if key == 'tweets':
+            if reader.peek() == '[':
+                for tweet in reader.iter_array():
+                    if tweet is not None:
+                        tweet_sink.write(tweet)
+            else:
+                tweet = reader.decode_value()
+                if tweet is not None:
+                    tweet_sink.write(tweet)
+        elif key in section_sinks:
+            value = reader.decode_value()
+            if value is not None:
+                section_sinks[key].append(value)
+        else:
+            reader.skip_value()
+
+def process_json_file(input_file='visakanv.json', delete_input=True, changes=None):
+    """Split the archive into tweets.ndjson, its projection, the tweet store and the small section files.
+
+    changes, a TweetChanges, is filled in with what the archive changed.
+    """
     print("Starting JSON processing...", flush=True)
-    
-    # Initialize empty lists to store data
-    tweets_data = []
+
+    # Small sections are collected; tweets are streamed straight to disk
     account_data = []
     profile_data = []
     upload_data = []
-    invalid_lines = []  # New list to store invalid JSON lines
+    section_sinks = {
+        'account': account_data,
+        'profile': profile_data,
+        'upload-options': upload_data,
+    }
+    tweet_sink = TweetSink(store=TweetStoreWriter(), changes=changes)
+    invalid_entries = []
 
     print("Reading and processing JSON file...", flush=True)
     # Create progress bar based on file size
     file_size = os.path.getsize(input_file)
     pbar = tqdm(total=file_size, desc="Processing", unit='B', unit_scale=True)
-    
-    # Process the file line by line
-    current_pos = 0
-    line_number = 0  # Track line numbers
-    with open(input_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            line_number += 1
-            # Update progress bar
-            current_pos += len(line.encode('utf-8'))
-            pbar.update(len(line.encode('utf-8')))
-            
-            try:
-                data = json.loads(line)
-                if 'tweets' in data and data['tweets'] is not None:
-                    # Extend the list instead of appending
-                    if isinstance(data['tweets'], list):
-                        tweets_data.extend(data['tweets'])
-                    else:
-                        tweets_data.append(data['tweets'])
-                if 'account' in data and data['account'] is not None:
-                    account_data.append(data['account'])
-                if 'profile' in data and data['profile'] is not None:
-                    profile_data.append(data['profile'])
-                if 'upload-options' in data and data['upload-options'] is not None:
-                    upload_data.append(data['upload-options'])
-            except json.JSONDecodeError as e:
-                invalid_entry = {
-                    'line_number': line_number,
-                    'line_content': line.strip(),
-                    'error': str(e)
-                }
-                invalid_lines.append(invalid_entry)
-                print(f"\nInvalid JSON at line {line_number}: {str(e)}", flush=True)
-                continue
-    
-    pbar.close()
-    
-    # Save invalid lines to a separate file
-    if invalid_lines:
-        print(f"\nFound {len(invalid_lines)} invalid JSON lines. Saving to invalid_lines.json", flush=True)
+
+    error = None
+    try:
+        with open(input_file, 'rb') as f:
+            stream_archive(f, tweet_sink, section_sinks, on_read=pbar.update)
+    except json.JSONDecodeError as e:
+        invalid_entries.append({
+            'position': e.pos,
+            'error': e.msg
+        })
+        print(f"\nInvalid JSON at character {e.pos}: {e.msg}", flush=True)
+        error = e
+    finally:
+        tweet_sink.close(complete=error is None)
+        pbar.close()
+
+    # Save the parse error to a separate file
+    if invalid_entries:
+        print(f"\nFound invalid JSON. Saving to invalid_lines.json", flush=True)
         with open('invalid_lines.json', 'w', encoding='utf-8') as f:
-            json.dump(invalid_lines, f, ensure_ascii=False, indent=2)
-    
+            json.dump(invalid_entries, f, ensure_ascii=False, indent=2)
+        # The stream can't be resynchronised after a syntax error, and a truncated archive mustn't be analysed
+        raise error
+
     print("\nSaving extracted data to separate files...", flush=True)
-    
-    if tweets_data:
-        print(f"Saving {len(tweets_data)} tweets...", flush=True)
-        with open('tweets.json', 'w', encoding='utf-8') as f:
-            json.dump(tweets_data, f, ensure_ascii=False, indent=2)
-        print("✓ Saved tweets.json", flush=True)
+
+    print(f"✓ Streamed {tweet_sink.count} tweets to tweets.ndjson", flush=True)
 
     if account_data:
         print("Saving account data...", flush=True)
@@ -86,23 +333,24 @@ def process_json_file(input_file='visakanv.json'):
             json.dump(upload_data, f, ensure_ascii=False, indent=2)
         print("✓ Saved upload.json", flush=True)
 
-    if tweets_data:
-        print("Saving total tweet count...", flush=True)
-        total_tweets_length = len(tweets_data)
-        with open('totalTweetLength.json', 'w', encoding='utf-8') as f:
-            json.dump(total_tweets_length, f, ensure_ascii=False, indent=2)
-        print(f"✓ Saved totalTweetLength.json with {total_tweets_length} tweets", flush=True)
+    # Saved even for an archive without tweets, so the last run's count isn't published again
+    print("Saving total tweet count...", flush=True)
+    total_tweets_length = tweet_sink.count
+    with open('totalTweetLength.json', 'w', encoding='utf-8') as f:
+        json.dump(total_tweets_length, f, ensure_ascii=False, indent=2)
+    print(f"✓ Saved totalTweetLength.json with {total_tweets_length} tweets", flush=True)
 
     # Check if all files have been successfully created
-    required_files = ['tweets.json', 'account.json', 'profile.json', 'upload.json', 'totalTweetLength.json']
+    required_files = ['tweets.ndjson', 'account.json', 'profile.json', 'upload.json', 'totalTweetLength.json']
     all_files_created = all(os.path.exists(file) for file in required_files)
-    
-    if all_files_created:
+
+    if delete_input and all_files_created:
         print("\nAll required files have been successfully created. Deleting the input file...", flush=True)
         os.remove(input_file)
         print(f"✓ Deleted {input_file}", flush=True)
 
     print("\nCreating files completed", flush=True)
+    return tweet_sink.count
 
 if __name__ == "__main__":
-    process_json_file()
\ No newline at end of file
+    process_json_file()
@@ -1,25 +1,276 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
 
 username = 'visakanv'
-url = f'https://fabxmporizzqflnftavs.supabase.co/storage/v1/object/public/archives/visakanv/archive.json'
+ARCHIVE_URL = 'https://fabxmporizzqflnftavs.supabase.co/storage/v1/object/public/archives/{username}/archive.json'
+
+
+def archive_url(username, template=ARCHIVE_URL):
+  # The community archive keys its files by lowercase username
+  return template.format(username=username.lower())
+
+
+url = archive_url(username)
+
+PART_SIZE = 16 << 20
+WORKERS = 4
+CHUNK_SIZE = 1 << 20
+PART_ATTEMPTS = 3
+# A strong ETag of 32 hex digits is the MD5 of the object (single-part uploads on S3-style storage)
+MD5_ETAG = re.compile(r'^"?([0-9a-f]{32})"?$')
+
+
+def make_session(workers=WORKERS):
+  """One pooled session, so parts reuse connections and transient errors are retried"""
+  session = requests.Session()
+  retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504],
+                allowed_methods=['HEAD', 'GET'])
+  adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+  session.mount('http://', adapter)
+  session.mount('https://', adapter)
+  return session
+
+
+class DownloadManifest:
+  """Sidecar describing a download: what version of the remote file it is and which parts are on disk"""
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.lock = threading.Lock()
+    self.data = {}
+    if os.path.exists(filename):
+      try:
+        with open(filename, 'r', encoding='utf-8') as f:
+          self.data = json.load(f)
+      except (OSError, json.JSONDecodeError):
+        self.data = {}
+
+  def matches(self, remote):
+    """Whether the manifest was written for the same version of the remote file"""
+    return all(self.data.get(key) == remote[key] for key in ('url', 'size', 'etag', 'last_modified'))
+
+  def start(self, remote, part_size):
+    self.data = dict(remote, part_size=part_size, part_sha256={}, complete=False)
+    self.save()
+
+  def part_done(self, part, sha256):
+    # Keyed by part number as a string, as JSON keys must be
+    with self.lock:
+      self.data['part_sha256'][str(part)] = sha256
+      self.save()
+
+  def forget_part(self, part):
+    with self.lock:
+      self.data['part_sha256'].pop(str(part), None)
+      self.save()
+
+  def save(self):
+    # Write to a temporary file first so an interrupted download never leaves half a manifest behind
+    temp_filename = f"{self.filename}.tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as f:
+      json.dump(self.data, f, indent=2)
+    os.replace(temp_filename, self.filename)
+
+
+def remote_info(session, url, headers=None):
+  response = session.head(url, headers=headers or {}, allow_redirects=True)
+  if response.status_code == 304:
+    return None
+  response.raise_for_status()
+  return {
+    'url': url,
+    'size': int(response.headers['Content-Length']) if 'Content-Length' in response.headers else None,
+    'etag': response.headers.get('ETag'),
+    'last_modified': response.headers.get('Last-Modified'),
+    'ranges': response.headers.get('Accept-Ranges', '').lower() == 'bytes',
+  }
+
+
+def file_digests(filename, parts=()):
+  """MD5 and sha256 of the file, and the sha256 of each of the contiguous (start, end) parts it starts with"""
+  md5 = hashlib.md5()
+  sha256 = hashlib.sha256()
+  part_digests = []
+  with open(filename, 'rb') as f:
+    for start, end in parts:
+      part = hashlib.sha256()
+      remaining = end - start + 1
+      while remaining:
+        chunk = f.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+          break
+        remaining -= len(chunk)
+        for digest in (md5, sha256, part):
+          digest.update(chunk)
+      part_digests.append(part.hexdigest())
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+      md5.update(chunk)
+      sha256.update(chunk)
+  return md5.hexdigest(), sha256.hexdigest(), part_digests
+
+
+def part_sha256(filename, start, end):
+  digest = hashlib.sha256()
+  remaining = end - start + 1
+  with open(filename, 'rb') as f:
+    f.seek(start)
+    while remaining:
+      chunk = f.read(min(CHUNK_SIZE, remaining))
+      if not chunk:
+        break
+      remaining -= len(chunk)
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def fetch_part(session, remote, part_file, start, end, progress_bar):
+  """Fetch bytes start..end inclusive into part_file at the same offset; returns the sha256 of what arrived"""
+  headers = {'Range': f'bytes={start}-{end}'}
+  if remote['etag']:
+    # If the file changed since HEAD the server sends all of it instead, which we reject
+    headers['If-Range'] = remote['etag']
+  for attempt in range(PART_ATTEMPTS):
+    written = 0
+    digest = hashlib.sha256()
+    try:
+      with session.get(remote['url'], headers=headers, stream=True) as response:
+        if response.status_code != 206:
+          raise IOError(f"Expected a partial response for bytes {start}-{end}, got {response.status_code}")
+        with open(part_file, 'r+b') as f:
+          f.seek(start)
+          for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            f.write(chunk)
+            digest.update(chunk)
+            written += len(chunk)
+            progress_bar.update(len(chunk))
+      if written != end - start + 1:
+        raise IOError(f"Received {written} of {end - start + 1} bytes for bytes {start}-{end}")
+      return digest.hexdigest()
+    except (requests.RequestException, IOError):
+      progress_bar.update(-written)
+      if attempt == PART_ATTEMPTS - 1:
+        raise
+
+
+def fetch_whole(session, remote, part_file, progress_bar):
+  """Single streaming request, for servers without Range support"""
+  with session.get(remote['url'], stream=True) as response:
+    response.raise_for_status()
+    with open(part_file, 'wb') as f:
+      for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        f.write(chunk)
+        progress_bar.update(len(chunk))
 
 
 # Helper function to downnload the data and display a progress bar
-def downloadUserData(username):
-  
+def downloadUserData(username, url=url, output=None, workers=WORKERS, part_size=PART_SIZE, session=None):
+  """Download the archive unless it is unchanged; returns True if a new copy was written.
+
+  Whenever the server takes Range requests the file is fetched in parts, even
+  with one worker, so a dropped connection only costs the part in flight.
+  Before the file is handed on, its size is checked against Content-Length
+  and every part against the sha256 the manifest recorded as it arrived,
+  including parts left by an earlier run. Only an ETag that is a plain MD5
+  checks the content against the server's own digest; other servers give
+  nothing to compare with. An unchanged archive is only skipped if it still
+  has the sha256 recorded when it was downloaded.
+  """
+  output = output or f'{username}.json'
+  part_file = f'{output}.part'
+  manifest = DownloadManifest(f'{output}.download.json')
+  session = session or make_session(workers)
+
   print("Downloading tweet data for:", username, flush=True)
-  response = requests.get(url, stream=True)
-  total_size = int(response.headers.get('content-length', 0))
-  progress_bar = tqdm(total=total_size, unit='B', unit_scale=True, desc="Downloading JSON")
-
-  # Download and save the file
-  with open(f'{username}.json', 'wb') as f:
-      for chunk in response.iter_content(chunk_size=8192):
-          if chunk:
-              f.write(chunk)
-              progress_bar.update(len(chunk))
-  
-  progress_bar.close()
-
-downloadUserData(username)
\ No newline at end of file
+
+  # Conditional request: only worth asking if we still have the file the manifest describes
+  conditional = {}
+  if os.path.exists(output) and manifest.data.get('complete') and manifest.data.get('url') == url \
+      and manifest.data.get('sha256') == file_digests(output)[1]:
+    if manifest.data.get('etag'):
+      conditional['If-None-Match'] = manifest.data['etag']
+    if manifest.data.get('last_modified'):
+      conditional['If-Modified-Since'] = manifest.data['last_modified']
+  remote = remote_info(session, url, conditional)
+  if remote is None or (conditional and manifest.matches(remote) and remote['size'] == os.path.getsize(output)):
+    print(f"✓ {output} is up to date, skipping download", flush=True)
+    return False
+
+  ranged = remote['ranges'] and remote['size']
+  parts = []
+  if ranged:
+    parts = [(start, min(start + part_size, remote['size']) - 1) for start in range(0, remote['size'], part_size)]
+    if manifest.matches(remote) and manifest.data.get('part_size') == part_size and os.path.exists(part_file) \
+        and not manifest.data.get('complete'):
+      # Parts whose bytes no longer match what arrived are fetched again
+      recorded = manifest.data.get('part_sha256', {})
+      done = {part for part, (start, end) in enumerate(parts)
+              if str(part) in recorded and recorded[str(part)] == part_sha256(part_file, start, end)}
+      print(f"Resuming download: {len(done)} of {len(parts)} parts already on disk", flush=True)
+    else:
+      done = set()
+      manifest.start(remote, part_size)
+      with open(part_file, 'wb') as f:
+        f.truncate(remote['size'])
+  else:
+    manifest.start(remote, None)
+
+  progress_bar = tqdm(total=remote['size'] or 0, unit='B', unit_scale=True, desc="Downloading JSON")
+  try:
+    if ranged:
+      progress_bar.update(sum(end - start + 1 for part, (start, end) in enumerate(parts) if part in done))
+
+      def fetch(part):
+        start, end = parts[part]
+        manifest.part_done(part, fetch_part(session, remote, part_file, start, end, progress_bar))
+
+      with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() re-raises the first failed part; finished parts stay recorded for the next run
+        list(executor.map(fetch, [part for part in range(len(parts)) if part not in done]))
+    else:
+      fetch_whole(session, remote, part_file, progress_bar)
+  finally:
+    progress_bar.close()
+
+  # Verify before handing the file on
+  size = os.path.getsize(part_file)
+  if remote['size'] is not None and size != remote['size']:
+    raise IOError(f"Downloaded {size} bytes but expected {remote['size']}")
+  md5, sha256, part_digests = file_digests(part_file, parts)
+  recorded = manifest.data.get('part_sha256', {})
+  corrupt = [part for part, digest in enumerate(part_digests) if recorded.get(str(part)) != digest]
+  if corrupt:
+    # Only the parts that changed on disk are fetched again next time
+    for part in corrupt:
+      manifest.forget_part(part)
+    raise IOError(f"Checksum mismatch: {len(corrupt)} parts differ from the bytes that were received")
+  etag_md5 = MD5_ETAG.match(remote['etag'] or '')
+  if etag_md5 and md5 != etag_md5.group(1):
+    os.remove(part_file)
+    manifest.start(remote, part_size if ranged else None)
+    raise IOError(f"Checksum mismatch: MD5 {md5} does not match ETag {remote['etag']}")
+
+  os.replace(part_file, output)
+  manifest.data.update(complete=True, sha256=sha256, part_sha256={})
+  manifest.save()
+  print(f"✓ Saved {output} ({size} bytes, sha256 {sha256[:12]}…)", flush=True)
+  return True
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Download the tweet archive, skipping it if unchanged")
+  parser.add_argument('--url', default=url, help="archive URL (point it at a local server to test)")
+  parser.add_argument('--output', default=None, help="where to save it (default: <username>.json)")
+  parser.add_argument('--workers', type=int, default=WORKERS, help="parallel Range requests")
+  parser.add_argument('--part-size', type=int, default=PART_SIZE, help="bytes per Range request")
+  args = parser.parse_args()
+  downloadUserData(username, url=args.url, output=args.output, workers=args.workers, part_size=args.part_size)
@@ -0,0 +1,187 @@
+import argparse
+import json
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from processTweets import MISSING_TIME, SELF_QUOTE_HANDLE, Analysis, parse_created_at
+
+GRAPH_FILE = 'interaction_graph.json'
+MENTION, REPLY = 0, 1
+
+class InteractionAnalysis(Analysis):
+    """Counts mentions of and replies to other accounts per month, with screen names interned to ids"""
+
+    outputs = (GRAPH_FILE,)
+
+    def __init__(self, handle=SELF_QUOTE_HANDLE):
+        self.handle = handle.lower()
+        self.names = []
+        self.name_ids = {}
+        # month -> {contact id: [mentions, replies]}
+        self.months = defaultdict(dict)
+
+    def intern(self, screen_name):
+        name = screen_name.lower()
+        contact = self.name_ids.get(name)
+        if contact is None:
+            contact = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return contact
+
+    def _count(self, month, screen_name, kind):
+        if not screen_name or screen_name.lower() == self.handle:
+            return
+        contact = self.intern(screen_name)
+        counts = self.months[month].get(contact)
+        if counts is None:
+            counts = self.months[month][contact] = [0, 0]
+        counts[kind] += 1
+
+    def add(self, tweet, record):
+        timestamp = parse_created_at(record.get('created_at'))
+        if timestamp == MISSING_TIME:
+            return
+        month = time.strftime('%Y-%m', time.gmtime(timestamp))
+        reply_to = record.get('in_reply_to_screen_name')
+        for mention in record.get('user_mentions', []):
+            # A reply's leading @mention is the reply itself, not a separate mention
+            if mention.get('screen_name') and mention['screen_name'].lower() != (reply_to or '').lower():
+                self._count(month, mention['screen_name'], MENTION)
+        self._count(month, reply_to, REPLY)
+
+    def finish(self, index, results):
+        months = sorted(self.months)
+        month_start = [0]
+        contacts, mentions, replies = [], [], []
+        for month in months:
+            for contact in sorted(self.months[month]):
+                counts = self.months[month][contact]
+                contacts.append(contact)
+                mentions.append(counts[MENTION])
+                replies.append(counts[REPLY])
+            month_start.append(len(contacts))
+        print(f"Interned {len(self.names)} accounts over {len(months)} months", flush=True)
+        return {
+            GRAPH_FILE: {
+                'names': self.names,
+                'months': months,
+                'month_start': month_start,
+                'contacts': contacts,
+                'mentions': mentions,
+                'replies': replies,
+            }
+        }
+
+    def to_state(self):
+        return {
+            'interactions': {
+                'names': self.names,
+                'months': {month: list(counts.items()) for month, counts in self.months.items()},
+            }
+        }
+
+    def load_state(self, state):
+        interactions = state['interactions']
+        self.names = interactions['names']
+        self.name_ids = {name: contact for contact, name in enumerate(self.names)}
+        self.months = defaultdict(dict, {
+            month: {contact: counts for contact, counts in entries}
+            for month, entries in interactions['months'].items()
+        })
+
+class InteractionGraph:
+    """Queries over interaction_graph.json: one CSR row of contacts per month.
+
+    A date range is a contiguous run of rows, so its totals come from
+    merging those rows' slices with bincount; nothing rescans tweets.
+    Ranges are months as 'YYYY-MM', start and end inclusive; a missing bound
+    means the start or end of the archive.
+    """
+
+    def __init__(self, data):
+        self.names = data['names']
+        self.months = data['months']
+        self.month_start = np.asarray(data['month_start'], dtype=np.int64)
+        self.contacts = np.asarray(data['contacts'], dtype=np.int64)
+        self.mentions = np.asarray(data['mentions'], dtype=np.int64)
+        self.replies = np.asarray(data['replies'], dtype=np.int64)
+        # First row each contact appears in, for telling new contacts from recurring ones
+        rows = np.repeat(np.arange(len(self.months)), np.diff(self.month_start))
+        self.first_row = np.full(len(self.names), len(self.months), dtype=np.int64)
+        np.minimum.at(self.first_row, self.contacts, rows)
+
+    @classmethod
+    def load(cls, filename=GRAPH_FILE):
+        with open(filename, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _rows(self, start=None, end=None):
+        first = np.searchsorted(self.months, start[:7], side='left') if start else 0
+        last = np.searchsorted(self.months, end[:7], side='right') if end else len(self.months)
+        return int(first), int(max(first, last))
+
+    def totals(self, start=None, end=None):
+        """(mentions, replies) per contact id over the range"""
+        first, last = self._rows(start, end)
+        lo, hi = self.month_start[first], self.month_start[last]
+        size = len(self.names)
+        return (np.bincount(self.contacts[lo:hi], self.mentions[lo:hi], size).astype(np.int64),
+                np.bincount(self.contacts[lo:hi], self.replies[lo:hi], size).astype(np.int64))
+
+    def top_interlocutors(self, start=None, end=None, n=20, kind='all'):
+        mentions, replies = self.totals(start, end)
+        counts = {'all': mentions + replies, 'mentions': mentions, 'replies': replies}[kind]
+        n = min(n, int(np.count_nonzero(counts)))
+        if not n:
+            return []
+        # partition finds the n-th count without sorting every contact; ties with it are all
+        # kept until the sort, so which of them make the cut doesn't depend on id order
+        threshold = np.partition(counts, len(counts) - n)[len(counts) - n]
+        top = sorted(np.flatnonzero(counts >= threshold).tolist(),
+                     key=lambda contact: (-counts[contact], self.names[contact]))[:n]
+        return [{'screen_name': self.names[c], 'interactions': int(counts[c]),
+                 'mentions': int(mentions[c]), 'replies': int(replies[c])} for c in top]
+
+    def new_and_recurring(self, start=None, end=None, n=20):
+        """Contacts first seen inside the range against those already seen before it"""
+        first, last = self._rows(start, end)
+        mentions, replies = self.totals(start, end)
+        active = np.flatnonzero(mentions + replies)
+        new = active[self.first_row[active] >= first]
+        recurring = active[self.first_row[active] < first]
+        ranked_new = sorted(new.tolist(), key=lambda c: (-(mentions[c] + replies[c]), self.names[c]))[:n]
+        return {
+            'new': len(new),
+            'recurring': len(recurring),
+            'top_new': [{'screen_name': self.names[c], 'interactions': int(mentions[c] + replies[c])}
+                        for c in ranked_new],
+        }
+
+    def degree_distribution(self, start=None, end=None):
+        """How many contacts had 1, 2-3, 4-7, ... interactions in the range"""
+        mentions, replies = self.totals(start, end)
+        counts = (mentions + replies)[(mentions + replies) > 0]
+        buckets = np.bincount(np.log2(counts).astype(np.int64)) if len(counts) else np.zeros(0, dtype=np.int64)
+        return {f"{1 << b}-{(1 << (b + 1)) - 1}": int(count) for b, count in enumerate(buckets.tolist())}
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the mention and reply graph written by processTweets")
+    parser.add_argument('--start', help="first month, YYYY-MM")
+    parser.add_argument('--end', help="last month, YYYY-MM")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--kind', choices=['all', 'mentions', 'replies'], default='all')
+    args = parser.parse_args()
+
+    graph = InteractionGraph.load()
+    print(json.dumps({
+        'start': args.start or graph.months[0] if graph.months else None,
+        'end': args.end or graph.months[-1] if graph.months else None,
+        'top_interlocutors': graph.top_interlocutors(args.start, args.end, args.top, args.kind),
+        'contacts': graph.new_and_recurring(args.start, args.end, args.top),
+        'degree_distribution': graph.degree_distribution(args.start, args.end),
+    }, indent=2), flush=True)
+
+if __name__ == "__main__":
+    main()
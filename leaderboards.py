@@ -0,0 +1,139 @@
+import heapq
+import time
+from collections import defaultdict
+
+from processTweets import MISSING_TIME, Analysis, parse_created_at
+from temporalAggregates import MIN_MONTHS_FOR_RATE
+
+TOP_K = 200
+YEAR_TOP_K = 50
+
+class TopK:
+    """The k largest values pushed so far, kept in a min-heap so each push costs O(log k).
+
+    Ties go to the older tweet, so rankings don't depend on archive order.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+
+    def push(self, value, tweet_id):
+        item = (value, -int(tweet_id), tweet_id)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def ranked(self):
+        # Only the k survivors are sorted
+        return [[tweet_id, value] for value, _, tweet_id in sorted(self.heap, reverse=True)]
+
+class Leaderboard:
+    """One metric's top K overall plus a smaller top K for every year"""
+
+    def __init__(self, k=TOP_K, year_k=YEAR_TOP_K):
+        self.overall = TopK(k)
+        self.by_year = defaultdict(lambda: TopK(year_k))
+
+    def push(self, value, tweet_id, year):
+        self.overall.push(value, tweet_id)
+        if year is not None:
+            self.by_year[year].push(value, tweet_id)
+
+    def to_dict(self):
+        return {
+            'overall': self.overall.ranked(),
+            'by_year': {year: self.by_year[year].ranked() for year in sorted(self.by_year)},
+        }
+
+def year_of(created_at):
+    timestamp = parse_created_at(created_at)
+    return None if timestamp == MISSING_TIME else time.strftime('%Y', time.gmtime(timestamp))
+
+def to_int(value):
+    return int(value or 0)
+
+class LeaderboardAnalysis(Analysis):
+    """Ranks tweets and threads on several metrics with bounded heaps, overall and per year.
+
+    Runs after the analyses whose outputs it ranks; each input is walked once
+    and only the entries that make a leaderboard are kept.
+    """
+
+    outputs = ('leaderboards.json',)
+
+    def __init__(self, k=TOP_K, year_k=YEAR_TOP_K):
+        self.k = k
+        self.year_k = year_k
+
+    def finish(self, index, results):
+        print("Ranking leaderboards", flush=True)
+        boards = {metric: Leaderboard(self.k, self.year_k) for metric in (
+            'quote_count', 'quotes_per_month', 'likes', 'retweets', 'thread_length', 'thread_engagement')}
+        tweets_by_id = index.tweets_by_id
+
+        years = {}
+        for tweet_id, record in tweets_by_id.items():
+            year = years[tweet_id] = year_of(record.get('created_at'))
+            boards['likes'].push(to_int(record.get('favorite_count')), tweet_id, year)
+            boards['retweets'].push(to_int(record.get('retweet_count')), tweet_id, year)
+
+        timelines = results.get('quote_timelines.json', {}).get('tweets', {})
+        for entry in results['countSelfQuotes.json']['tweet_counts']:
+            tweet_id = entry['tweet_id']
+            if tweet_id not in tweets_by_id:
+                continue
+            boards['quote_count'].push(entry['count'], tweet_id, years[tweet_id])
+            timeline = timelines.get(tweet_id, {})
+            if timeline.get('months_since', 0) >= MIN_MONTHS_FOR_RATE:
+                boards['quotes_per_month'].push(timeline['quotes_per_month'], tweet_id, years[tweet_id])
+
+        threads = results.get('twitter_threads.json', {})
+        for start_id, thread in threads.items():
+            metadata = thread['metadata']
+            year = years.get(start_id)
+            boards['thread_length'].push(metadata['length'], start_id, year)
+            boards['thread_engagement'].push(metadata['total_likes'] + metadata['total_retweets'], start_id, year)
+
+        rankings = {metric: board.to_dict() for metric, board in boards.items()}
+        ranked_ids = {
+            tweet_id
+            for ranking in rankings.values()
+            for entries in [ranking['overall'], *ranking['by_year'].values()]
+            for tweet_id, _ in entries
+        }
+        counts = {entry['tweet_id']: entry['count'] for entry in results['countSelfQuotes.json']['tweet_counts']
+                  if entry['tweet_id'] in ranked_ids}
+        return {
+            'leaderboards.json': {
+                'k': self.k,
+                'year_k': self.year_k,
+                'metrics': rankings,
+                'tweets': {
+                    tweet_id: leaderboard_entry(tweet_id, tweets_by_id.get(tweet_id, {}), counts.get(tweet_id, 0),
+                                                timelines.get(tweet_id), threads.get(tweet_id))
+                    for tweet_id in sorted(ranked_ids, key=int)
+                },
+            }
+        }
+
+def leaderboard_entry(tweet_id, record, count, timeline, thread):
+    """What the pages show for a ranked tweet, once however many leaderboards it is on"""
+    entry = {
+        'tweet_id': tweet_id,
+        'tweet_text': record.get('full_text', ''),
+        'created_at': record.get('created_at'),
+        'favorite_count': record.get('favorite_count'),
+        'retweet_count': record.get('retweet_count'),
+        'in_reply_to_screen_name': record.get('in_reply_to_screen_name'),
+        'count': count,
+    }
+    if timeline and 'months_since' in timeline:
+        entry['months_since'] = timeline['months_since']
+        entry['quotes_per_month'] = timeline['quotes_per_month']
+    if thread:
+        entry['thread_length'] = thread['metadata']['length']
+        entry['thread_likes'] = thread['metadata']['total_likes']
+        entry['thread_retweets'] = thread['metadata']['total_retweets']
+    return entry
@@ -0,0 +1,201 @@
+import argparse
+import json
+import re
+import time
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from processTweets import MISSING_TIME, Analysis, link_domain, parse_created_at
+
+DOMAINS_FILE = 'link_domains.json'
+TRENDS_FILE = 'link_trends.json'
+TOP_DOMAINS = 100
+TOP_URLS = 100
+TREND_DOMAINS = 20
+# A link the archive never expanded still points at the shortener
+SHORTENED = re.compile(r'https?://t\.co/', re.IGNORECASE)
+
+def bump(counts, key, amount=1):
+    """Add to an array-backed counter, growing it to fit key"""
+    if key >= len(counts):
+        counts.extend([0] * (key + 1 - len(counts)))
+    counts[key] += amount
+
+def ranked(counts, names, n):
+    """Ids of the n largest counts, ties broken by name so the order doesn't depend on interning"""
+    counts = np.frombuffer(counts, dtype=np.int64) if len(counts) else np.zeros(0, dtype=np.int64)
+    n = min(n, int(np.count_nonzero(counts > 0)))
+    if not n:
+        return []
+    # Keep every count tied with the n-th one until the sort, as InteractionGraph does
+    threshold = np.partition(counts, len(counts) - n)[len(counts) - n]
+    return sorted(np.flatnonzero(counts >= threshold).tolist(), key=lambda i: (-counts[i], names[i]))[:n]
+
+class LinkAnalysis(Analysis):
+    """Counts outbound links per URL, per domain and per domain and month, with both interned to ids.
+
+    Links whose t.co URL was never expanded are kept apart: their domain is
+    unknown, so they are counted per month and listed by tweet instead.
+    Links to the account's own tweets are self-quotes, not outbound links;
+    they are the ones the SelfQuoteAnalysis registered before it matched.
+    """
+
+    outputs = (DOMAINS_FILE, TRENDS_FILE)
+
+    def __init__(self, self_quotes):
+        self.self_quotes = self_quotes
+        self.urls = []
+        self.url_ids = {}
+        self.url_domains = array('q')
+        self.domains = []
+        self.domain_ids = {}
+        self.url_counts = array('q')
+        self.domain_counts = array('q')
+        # month -> domain id -> links
+        self.months = {}
+        # month -> links with no expansion, and tweet id -> the t.co URLs behind them
+        self.unexpanded = Counter()
+        self.unexpanded_urls = {}
+
+    def intern(self, expanded_url):
+        url = self.url_ids.get(expanded_url)
+        if url is None:
+            url = self.url_ids[expanded_url] = len(self.urls)
+            self.urls.append(expanded_url)
+            domain_name = link_domain(expanded_url)
+            domain = self.domain_ids.get(domain_name)
+            if domain is None:
+                domain = self.domain_ids[domain_name] = len(self.domains)
+                self.domains.append(domain_name)
+            self.url_domains.append(domain)
+        return url
+
+    def _unexpanded(self, record):
+        return [url.get('url') or url.get('expanded_url') for url in record.get('urls', [])
+                if not url.get('expanded_url') or SHORTENED.match(url['expanded_url'])]
+
+    def add(self, tweet, record):
+        timestamp = parse_created_at(record.get('created_at'))
+        month = time.strftime('%Y-%m', time.gmtime(timestamp)) if timestamp != MISSING_TIME else None
+        for url in record.get('urls', []):
+            expanded_url = url.get('expanded_url')
+            if not expanded_url or SHORTENED.match(expanded_url):
+                if month is not None:
+                    self.unexpanded[month] += 1
+                continue
+            if expanded_url in self.self_quotes.current_quote_urls:
+                continue
+            url_id = self.intern(expanded_url)
+            domain = self.url_domains[url_id]
+            bump(self.url_counts, url_id)
+            bump(self.domain_counts, domain)
+            if month is not None:
+                bump(self.months.setdefault(month, array('q')), domain)
+        self.restore(tweet, record)
+
+    def restore(self, tweet, record):
+        # The counters are saved, the per-tweet list of unexpanded links is re-derived
+        unexpanded = self._unexpanded(record)
+        if unexpanded and record.get('id_str'):
+            self.unexpanded_urls[record['id_str']] = unexpanded
+
+    def finish(self, index, results):
+        top_domains = ranked(self.domain_counts, self.domains, TOP_DOMAINS)
+        top_urls = ranked(self.url_counts, self.urls, TOP_URLS)
+        linked = np.frombuffer(self.url_counts, dtype=np.int64) > 0 if len(self.url_counts) else []
+        distinct_urls = np.bincount(np.frombuffer(self.url_domains, dtype=np.int64)[linked],
+                                    minlength=len(self.domains)) if len(self.url_domains) else []
+        months = sorted(self.months.keys() | {month for month, count in self.unexpanded.items() if count})
+        trend_domains = top_domains[:TREND_DOMAINS]
+
+        series = {self.domains[domain]: [] for domain in trend_domains}
+        totals, others, unexpanded = [], [], []
+        for month in months:
+            counts = self.months.get(month, array('q'))
+            total = sum(counts)
+            shown = 0
+            for domain in trend_domains:
+                count = counts[domain] if domain < len(counts) else 0
+                series[self.domains[domain]].append(count)
+                shown += count
+            totals.append(total)
+            others.append(total - shown)
+            unexpanded.append(self.unexpanded[month])
+
+        print(f"Interned {len(self.urls)} URLs on {len(self.domains)} domains; "
+              f"{len(self.unexpanded_urls)} tweets have links with no expansion", flush=True)
+        return {
+            DOMAINS_FILE: {
+                'total_links': sum(self.domain_counts),
+                'distinct_urls': sum(1 for count in self.url_counts if count > 0),
+                'distinct_domains': sum(1 for count in self.domain_counts if count > 0),
+                'top_domains': [{'domain': self.domains[d], 'links': self.domain_counts[d],
+                                 'distinct_urls': int(distinct_urls[d])} for d in top_domains],
+                'top_urls': [{'url': self.urls[u], 'domain': self.domains[self.url_domains[u]],
+                              'links': self.url_counts[u]} for u in top_urls],
+                'unexpanded': {
+                    'links': sum(len(urls) for urls in self.unexpanded_urls.values()),
+                    'tweets': [{'tweet_id': tweet_id, 'urls': self.unexpanded_urls[tweet_id]}
+                               for tweet_id in sorted(self.unexpanded_urls, key=int)],
+                },
+            },
+            TRENDS_FILE: {
+                'months': months,
+                'links': totals,
+                'domains': series,
+                'other_domains': others,
+                'unexpanded': unexpanded,
+            },
+        }
+
+    def to_state(self):
+        return {
+            'links': {
+                'urls': self.urls,
+                'url_domains': self.url_domains.tolist(),
+                'domains': self.domains,
+                'url_counts': self.url_counts.tolist(),
+                'domain_counts': self.domain_counts.tolist(),
+                'months': {month: counts.tolist() for month, counts in self.months.items()},
+                'unexpanded': self.unexpanded,
+            }
+        }
+
+    def load_state(self, state):
+        links = state['links']
+        self.urls = links['urls']
+        self.url_ids = {url: url_id for url_id, url in enumerate(self.urls)}
+        self.url_domains = array('q', links['url_domains'])
+        self.domains = links['domains']
+        self.domain_ids = {domain: domain_id for domain_id, domain in enumerate(self.domains)}
+        self.url_counts = array('q', links['url_counts'])
+        self.domain_counts = array('q', links['domain_counts'])
+        self.months = {month: array('q', counts) for month, counts in links['months'].items()}
+        self.unexpanded = Counter(links['unexpanded'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the most linked domains written by processTweets")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--domain', help="print this domain's links per month instead")
+    args = parser.parse_args()
+
+    if args.domain:
+        with open(TRENDS_FILE, 'r', encoding='utf-8') as f:
+            trends = json.load(f)
+        if args.domain not in trends['domains']:
+            raise SystemExit(f"❌ {args.domain} isn't one of the {len(trends['domains'])} domains in {TRENDS_FILE}")
+        for month, count in zip(trends['months'], trends['domains'][args.domain]):
+            print(f"{month} {count:>6}", flush=True)
+        return
+
+    with open(DOMAINS_FILE, 'r', encoding='utf-8') as f:
+        domains = json.load(f)
+    print(f"{domains['total_links']} links to {domains['distinct_domains']} domains, "
+          f"{domains['unexpanded']['links']} never expanded", flush=True)
+    for entry in domains['top_domains'][:args.top]:
+        print(f"{entry['links']:>8} {entry['domain']} ({entry['distinct_urls']} URLs)", flush=True)
+
+if __name__ == "__main__":
+    main()
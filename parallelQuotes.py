@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from processTweets import (SELF_QUOTE_HANDLE, SelfQuoteAnalysis, TweetInfoAnalysis, TweetIndex,
+                           default_tweets_file, iter_tweets, load_tweets, project_tweet, run_analyses,
+                           write_json_file)
+
+CHUNKS_PER_WORKER = 4
+
+def chunk_ranges(filename, chunks):
+    """Split an NDJSON file into byte ranges that start and end on line boundaries"""
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, 'rb') as f:
+        for chunk in range(1, chunks):
+            f.seek(max(size * chunk // chunks, boundaries[-1]))
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+def match_chunk(job):
+    """Map step: match and extract quoted ids for one byte range in one pass over its tweets.
+
+    Also returns the id and line offset of every tweet, so the join step only
+    has to re-read the lines of tweets that turn out to be quoted.
+    """
+    filename, start, end, handle = job
+    analysis = SelfQuoteAnalysis(handle)
+    ids = array('q')
+    offsets = array('q')
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        offset = start
+        while offset < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                for tweet in iter_tweets([json.loads(line)]):
+                    analysis.add(tweet, None)
+                    if 'id_str' in tweet:
+                        ids.append(int(tweet['id_str']))
+                        offsets.append(offset)
+            offset += len(line)
+    return analysis.matching_tweets, analysis.quoted_ids, ids, offsets
+
+def lookup_lines(job):
+    """Join step: project the wanted tweets found on the given lines"""
+    filename, offsets, wanted = job
+    records = {}
+    with open(filename, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            for tweet in iter_tweets([json.loads(f.readline())]):
+                if tweet.get('id_str') in wanted:
+                    records[tweet['id_str']] = project_tweet(tweet)
+    return records
+
+def parallel_self_quotes(filename, workers=None, handle=SELF_QUOTE_HANDLE, sort=True):
+    """Self-quote and tweet result outputs of the serial pass for handle, computed on a process pool.
+
+    Chunks are merged in file order: matching tweets are concatenated and the
+    Counters are added chunk by chunk, so ids keep their first-seen order and
+    the count ranking breaks ties exactly as the serial pass does.
+    """
+    workers = workers or os.cpu_count()
+    ranges = chunk_ranges(filename, workers * CHUNKS_PER_WORKER)
+    print(f"Matching self-quotes in {len(ranges)} chunks on {workers} processes", flush=True)
+
+    self_quotes = SelfQuoteAnalysis(handle, sort=sort)
+    all_ids = []
+    all_offsets = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for matching_tweets, quoted_ids, ids, offsets in executor.map(
+                match_chunk, [(filename, start, end, handle) for start, end in ranges]):
+            self_quotes.matching_tweets.extend(matching_tweets)
+            self_quotes.quoted_ids.update(quoted_ids)
+            all_ids.append(np.frombuffer(ids, dtype=np.int64))
+            all_offsets.append(np.frombuffer(offsets, dtype=np.int64))
+        results = self_quotes.finish(None, {})
+
+        # The last copy of a duplicated id wins, as in the serial index
+        ids = np.concatenate(all_ids) if all_ids else np.zeros(0, dtype=np.int64)
+        offsets = np.concatenate(all_offsets) if all_offsets else np.zeros(0, dtype=np.int64)
+        wanted = np.fromiter((int(tweet_id) for tweet_id in self_quotes.quoted_ids), dtype=np.int64)
+        positions = np.flatnonzero(np.isin(ids, wanted))
+        reversed_ids = ids[positions][::-1]
+        _, last = np.unique(reversed_ids, return_index=True)
+        wanted_offsets = np.unique(offsets[positions[::-1][last]])
+
+        wanted_ids = set(self_quotes.quoted_ids)
+        jobs = [(filename, part.tolist(), wanted_ids)
+                for part in np.array_split(wanted_offsets, workers) if len(part)]
+        index = TweetIndex()
+        for records in executor.map(lookup_lines, jobs):
+            index.tweets_by_id.update(records)
+
+    results.update(TweetInfoAnalysis(sort=sort).finish(index, results))
+    return results
+
+class ParallelSelfQuoteAnalysis(SelfQuoteAnalysis):
+    """Stands in for SelfQuoteAnalysis and TweetInfoAnalysis in the single pass, with their outputs built on a process pool.
+
+    The pass still matches each tweet for the analyses that read
+    current_quoted_ids, but collects nothing; finish runs
+    parallel_self_quotes over the NDJSON file instead.
+    """
+
+    outputs = SelfQuoteAnalysis.outputs + TweetInfoAnalysis.outputs
+
+    def __init__(self, filename, workers, handle=SELF_QUOTE_HANDLE, sort=True):
+        super().__init__(handle, sort=sort, collect=False)
+        self.filename = filename
+        self.workers = workers
+
+    def finish(self, index, results):
+        return parallel_self_quotes(self.filename, self.workers, self.handle, self.sort)
+
+def serial_self_quotes(filename, handle=SELF_QUOTE_HANDLE):
+    results, _ = run_analyses(load_tweets(filename), [SelfQuoteAnalysis(handle), TweetInfoAnalysis()])
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and count self-quotes on every core")
+    parser.add_argument('--workers', type=int, default=None, help="processes to use (default: all cores)")
+    parser.add_argument('--handle', default=SELF_QUOTE_HANDLE,
+                        help=f"account whose self-quotes to find (default: {SELF_QUOTE_HANDLE})")
+    parser.add_argument('--verify', action='store_true',
+                        help="compare against the serial pass instead of writing the outputs")
+    args = parser.parse_args()
+
+    filename = default_tweets_file()
+    if not filename.endswith('.ndjson'):
+        raise SystemExit(f"❌ The parallel mode splits tweets.ndjson by line; {filename} can't be split")
+
+    results = parallel_self_quotes(filename, args.workers, args.handle)
+    if args.verify:
+        serial = serial_self_quotes(filename, args.handle)
+        matches = True
+        for output in serial:
+            # Identical, not just equivalent: same order and same values
+            if serial[output] == results[output]:
+                print(f"✓ {output} matches the serial pass", flush=True)
+            else:
+                print(f"❌ {output} differs from the serial pass", flush=True)
+                matches = False
+        if not matches:
+            raise SystemExit(1)
+        return
+
+    for filename, data in results.items():
+        write_json_file(filename, data)
+        print(f"✓ Saved {filename}", flush=True)
+
+if __name__ == "__main__":
+    main()
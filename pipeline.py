@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from telemetry import stage, telemetry
+
+PIPELINE_STATE_FILE = 'pipeline_state.json'
+PIPELINE_STATE_VERSION = 1
+HASH_CHUNK = 1 << 20
+
+class Node:
+    """One stage of the pipeline and the artifacts it reads and writes.
+
+    func is called with {dependency name: its return value}; a dependency
+    that was skipped because it was up to date passes None. Nodes that are
+    not cacheable (they read something outside the tree, like the network)
+    run on every pass except when resuming.
+    """
+
+    def __init__(self, name, func, after=(), inputs=(), outputs=(), code=(), cacheable=True):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.code = tuple(code)
+        self.cacheable = cacheable
+
+class FileHasher:
+    """sha256 of files and directories, remembered by size and mtime between runs"""
+
+    def __init__(self, known=None):
+        self.known = known or {}
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        cached = self.known.get(path)
+        if cached and cached[:2] == signature:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+        self.known[path] = signature + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def hash(self, path):
+        """Content hash of a file or a directory tree, or None if it doesn't exist"""
+        if os.path.isfile(path):
+            return self.file_hash(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+                digest.update(self.file_hash(file_path).encode('ascii'))
+        return digest.hexdigest()
+
+class Pipeline:
+    """Runs a DAG of nodes in one process, skipping the ones whose inputs haven't changed.
+
+    A node's fingerprint hashes its code and input artifacts. When it matches
+    the fingerprint recorded after the node last succeeded, and its outputs
+    are still the ones it wrote, the node is skipped. Nodes whose
+    dependencies are done run concurrently. The state is saved after every
+    node, so a failed run can be resumed from the last good node.
+    """
+
+    def __init__(self, nodes, state_file=PIPELINE_STATE_FILE, workers=2):
+        self.nodes = {node.name: node for node in nodes}
+        self.state_file = state_file
+        self.workers = workers
+        for node in nodes:
+            for dependency in node.after:
+                if dependency not in self.nodes:
+                    raise ValueError(f"Node {node.name} depends on unknown node {dependency}")
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order = []
+        visiting = set()
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through node {name}")
+            visiting.add(name)
+            for dependency in self.nodes[name].after:
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def load_state(self):
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') == PIPELINE_STATE_VERSION:
+                return state
+            print(f"Ignoring {self.state_file}: written by an older version", flush=True)
+        return {'version': PIPELINE_STATE_VERSION, 'nodes': {}, 'hashes': {}, 'last_run': {}}
+
+    def save_state(self, state):
+        # Write to a temporary file first so an interrupted run never leaves half a state behind
+        temp_filename = f"{self.state_file}.tmp"
+        with open(temp_filename, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(temp_filename, self.state_file)
+
+    def fingerprint(self, node, hasher):
+        digest = hashlib.sha256(node.name.encode('utf-8'))
+        for path in node.code + node.inputs:
+            digest.update(path.encode('utf-8'))
+            digest.update((hasher.hash(path) or 'missing').encode('ascii'))
+        return digest.hexdigest()
+
+    def skip_reason(self, node, record, hasher, resumable):
+        """Why node doesn't need to run, or None if it does"""
+        if node.name in resumable:
+            return "completed before the failed run"
+        if not node.cacheable or not record or record['fingerprint'] != self.fingerprint(node, hasher):
+            return None
+        if all(hasher.hash(path) == digest for path, digest in record['outputs'].items()):
+            return "up to date"
+        return None
+
+    def run(self, resume=False, force=False):
+        """Run every node that is out of date; returns {node name: return value or None}"""
+        state = self.load_state()
+        hasher = FileHasher(state['hashes'])
+        # Only a run that stopped on a failure has anything to resume
+        resumable = set(state['last_run'].get('completed', [])) if resume and state['last_run'].get('failed') else set()
+        state['last_run'] = {'started': datetime.now().isoformat(timespec='seconds'), 'completed': [], 'failed': None}
+
+        results = {}
+        done = set()
+        running = {}
+        failure = None
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                if failure is None:
+                    for name in self.order:
+                        node = self.nodes[name]
+                        if name in done or name in running or not all(d in done for d in node.after):
+                            continue
+                        reason = None if force else self.skip_reason(node, state['nodes'].get(name), hasher, resumable)
+                        if reason:
+                            print(f"\n↷ Skipping {name}: {reason}", flush=True)
+                            telemetry.skipped(name, reason)
+                            results[name] = None
+                            done.add(name)
+                            state['last_run']['completed'].append(name)
+                            continue
+                        upstream = {dependency: results[dependency] for dependency in node.after}
+                        print(f"\n{'='*50}")
+                        print(f"Starting {name} at {datetime.now().strftime('%H:%M:%S')}")
+                        print(f"{'='*50}", flush=True)
+                        running[name] = (executor.submit(self._run_node, node, upstream), time.time())
+                if not running:
+                    break
+
+                finished, _ = wait([future for future, _ in running.values()], return_when=FIRST_COMPLETED)
+                for name in [name for name, (future, _) in running.items() if future in finished]:
+                    future, started = running.pop(name)
+                    node = self.nodes[name]
+                    try:
+                        results[name] = future.result()
+                        outputs = {}
+                        for path in node.outputs:
+                            digest = hasher.hash(path)
+                            if digest is None:
+                                raise Exception(f"Expected output file {path} not found!")
+                            outputs[path] = digest
+                    except Exception as e:
+                        print(f"\n❌ {name} FAILED: {str(e)}", flush=True)
+                        if failure is None:
+                            failure = (name, e)
+                        state['last_run']['failed'] = name
+                        state['nodes'].pop(name, None)
+                        continue
+                    state['nodes'][name] = {
+                        'fingerprint': self.fingerprint(node, hasher) if node.cacheable else None,
+                        'outputs': outputs,
+                        'seconds': round(time.time() - started, 3)
+                    }
+                    done.add(name)
+                    state['last_run']['completed'].append(name)
+                    print(f"\n✓ Completed {name} in {time.time() - started:.1f}s", flush=True)
+                    self.save_state(state)
+
+        # Forget hashes of files that no longer exist, like shards from an earlier publish
+        state['hashes'] = {path: known for path, known in hasher.known.items() if os.path.exists(path)}
+        self.save_state(state)
+        if failure is not None:
+            name, error = failure
+            raise Exception(f"Node {name} failed: {str(error)}. Re-run with --resume to continue from it") from error
+        return results
+
+    def _run_node(self, node, upstream):
+        with stage(node.name):
+            return node.func(upstream)
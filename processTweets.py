@@ -1,21 +1,81 @@
 import json
-from collections import Counter, defaultdict
+from collections import Counter
 import re
 from tqdm import tqdm
 import time
+import os
+import argparse
+import calendar
+import zlib
+from datetime import datetime
+from urllib.parse import urlparse
+import numpy as np
+from telemetry import stage
+from threadForest import MISSING_TIME, ConversationForest
+
+SELF_QUOTE_HANDLE = 'visakanv'
+
+def quote_pattern(handle):
+    """Matches a link to one of handle's tweets and captures its id; screen names aren't case-sensitive"""
+    return re.compile(rf'/{re.escape(handle)}/status/(\d+)', re.IGNORECASE)
+
+QUOTE_PATTERN = quote_pattern(SELF_QUOTE_HANDLE)
+
+def link_domain(expanded_url):
+    """The host a link points at, lowercased and without www."""
+    domain = urlparse(expanded_url).netloc.lower()
+    return domain[4:] if domain.startswith('www.') else domain
+
+STATE_FILE = 'processing_state.json'
+TWEETS_FILE = 'tweets.ndjson'
+CREATED_AT_FORMAT = '%a %b %d %H:%M:%S %z %Y'
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+STATE_VERSION = 7
+PROJECTION_VERSION = 1
+
+# Fields kept from each raw tweet once it has been seen by the engine
+PROJECTED_FIELDS = (
+    'id_str',
+    'full_text',
+    'created_at',
+    'retweeted',
+    'favorite_count',
+    'retweet_count',
+    'in_reply_to_status_id_str',
+    'in_reply_to_user_id_str',
+    'in_reply_to_screen_name',
+)
+
+def parse_created_at(created_at):
+    """Epoch seconds from a 'Wed Oct 10 20:19:24 +0000 2018' timestamp"""
+    if not created_at:
+        return MISSING_TIME
+    try:
+        _, month, day, clock, offset, year = created_at.split()
+        hours, minutes, seconds = clock.split(':')
+        timestamp = calendar.timegm((int(year), MONTHS[month], int(day), int(hours), int(minutes), int(seconds)))
+        sign = -1 if offset[0] == '-' else 1
+        return timestamp - sign * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+    except (ValueError, KeyError):
+        return int(datetime.strptime(created_at, CREATED_AT_FORMAT).timestamp())
 
 def retry_on_failure(step_name, func, *args, **kwargs):
     """Wrapper to retry a function once if it fails"""
-    try:
-        return func(*args, **kwargs)
-    except Exception as e:
-        print(f"\nFirst attempt of {step_name} failed with error: {str(e)}")
-        print("Retrying in 2 seconds...", flush=True)
-        time.sleep(2)
+    with stage(step_name) as record:
         try:
             return func(*args, **kwargs)
         except Exception as e:
-            raise Exception(f"Step '{step_name}' failed after retry with error: {str(e)}")
+            print(f"\nFirst attempt of {step_name} failed with error: {str(e)}")
+            print("Retrying in 2 seconds...", flush=True)
+            time.sleep(2)
+            record.retries += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                raise Exception(f"Step '{step_name}' failed after retry with error: {str(e)}")
 
 def load_json_file(filename):
     print(f"Attempting to load {filename}...", flush=True)
@@ -31,110 +91,543 @@ def load_json_file(filename):
         print(f"❌ Error: Invalid JSON in file: {filename}", flush=True)
         raise
 
+def iter_ndjson_file(filename):
+    """Stream one JSON record per line, so the whole file is never held at once"""
+    print(f"Streaming {filename}...", flush=True)
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"❌ Error: Invalid JSON on line {line_number} of {filename}", flush=True)
+                        raise
+    except FileNotFoundError:
+        print(f"❌ Error: File not found: {filename}", flush=True)
+        raise
+
+def write_json_file(filename, data):
+    # Swapped in whole, so a reader (or a watch process's next run) never sees half a file
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(temp_filename, filename)
+
+def iter_tweets(tweets_data):
+    """Yield bare tweet dicts from {"tweet": ...} records, nested lists or bare dicts"""
+    for tweet_item in tweets_data:
+        if isinstance(tweet_item, list):
+            yield from iter_tweets(tweet_item)
+        elif isinstance(tweet_item, dict):
+            yield tweet_item['tweet'] if 'tweet' in tweet_item else tweet_item
+
+def project_tweet(tweet):
+    """Keep only the fields the analyses read, so the index doesn't hold whole raw tweets"""
+    record = {field: tweet[field] for field in PROJECTED_FIELDS if field in tweet}
+    entities = tweet.get('entities', {})
+    record['user_mentions'] = [
+        {
+            'name': mention.get('name'),
+            'screen_name': mention.get('screen_name')
+        }
+        for mention in entities.get('user_mentions', [])
+    ]
+    record['urls'] = [
+        {
+            'url': url.get('url'),
+            'expanded_url': url.get('expanded_url'),
+            'display_url': url.get('display_url')
+        }
+        for url in entities.get('urls', [])
+    ]
+    return record
+
+def projection_files(filename):
+    """The projected records kept beside an NDJSON file, and the meta file tying them to it"""
+    base = os.path.splitext(filename)[0]
+    return f"{base}.projected.ndjson", f"{base}.projected.json"
+
+def source_signature(filename):
+    stat = os.stat(filename)
+    return {'version': PROJECTION_VERSION, 'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+class ProjectionWriter:
+    """Writes one [offset, length, item, record] line per tweet: its projection and where its raw line is.
+
+    The file only counts once close() has recorded which NDJSON file it
+    describes, so an interrupted write is never read back.
+    """
+
+    def __init__(self, filename):
+        self.projected_file, self.meta_file = projection_files(filename)
+        if os.path.exists(self.meta_file):
+            os.remove(self.meta_file)
+        self.temp_file = f"{self.projected_file}.tmp"
+        self.f = open(self.temp_file, 'w', encoding='utf-8')
+        self.count = 0
+
+    def write(self, offset, length, item, record):
+        self.f.write(json.dumps([offset, length, item, record], ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self, signature):
+        self.f.close()
+        os.replace(self.temp_file, self.projected_file)
+        signature['count'] = self.count
+        write_json_file(self.meta_file, signature)
+
+    def abort(self):
+        self.f.close()
+        os.remove(self.temp_file)
+
+class TweetLines:
+    """Random access to the raw lines of an NDJSON file, open for one pass over it"""
+
+    def __init__(self, filename):
+        self.f = open(filename, 'rb')
+
+    def tweet(self, offset, length, item):
+        self.f.seek(offset)
+        return list(iter_tweets([json.loads(self.f.read(length))]))[item]
+
+    def close(self):
+        self.f.close()
+
+class ProjectedTweet:
+    """A tweet decoded only as far as the engine reads it.
+
+    record is its projection. The rest stays as its raw line in the NDJSON
+    file and is decoded the first time a field outside the projection is
+    read, or decode() is called. That has to happen during the pass, while
+    the file is still open.
+    """
+
+    __slots__ = ('record', 'lines', 'offset', 'length', 'item', '_tweet')
+
+    def __init__(self, record, lines, offset, length, item=0, tweet=None):
+        self.record = record
+        self.lines = lines
+        self.offset = offset
+        self.length = length
+        self.item = item
+        self._tweet = tweet
+
+    def decode(self):
+        if self._tweet is None:
+            self._tweet = self.lines.tweet(self.offset, self.length, self.item)
+        return self._tweet
+
+    def get(self, key, default=None):
+        if key in PROJECTED_FIELDS:
+            return self.record.get(key, default)
+        return self.decode().get(key, default)
+
+    def __getitem__(self, key):
+        if key in PROJECTED_FIELDS:
+            return self.record[key]
+        return self.decode()[key]
+
+    def __contains__(self, key):
+        if key in PROJECTED_FIELDS:
+            return key in self.record
+        return key in self.decode()
+
+def projected(tweet):
+    """The projected record of a raw or ProjectedTweet"""
+    return tweet.record if isinstance(tweet, ProjectedTweet) else project_tweet(tweet)
+
+def decoded(tweet):
+    """The whole tweet dict of a raw or ProjectedTweet"""
+    return tweet.decode() if isinstance(tweet, ProjectedTweet) else tweet
+
+def projection_is_current(filename):
+    _, meta_file = projection_files(filename)
+    if not os.path.exists(meta_file):
+        return False
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    meta.pop('count', None)
+    return meta == source_signature(filename)
+
+def project_ndjson_file(filename, lines):
+    """Decode every line of an NDJSON file, keeping each tweet's projection beside it for the next pass"""
+    print(f"Streaming {filename} and saving its projection...", flush=True)
+    signature = source_signature(filename)
+    writer = ProjectionWriter(filename)
+    completed = False
+    try:
+        with open(filename, 'rb') as f:
+            offset = 0
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        value = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"❌ Error: Invalid JSON on line {line_number} of {filename}", flush=True)
+                        raise
+                    for item, tweet in enumerate(iter_tweets([value])):
+                        record = project_tweet(tweet)
+                        writer.write(offset, len(line), item, record)
+                        yield ProjectedTweet(record, lines, offset, len(line), item, tweet)
+                offset += len(line)
+        completed = True
+    finally:
+        if completed:
+            writer.close(signature)
+        else:
+            writer.abort()
+
+def iter_projected_tweets(filename):
+    """Stream ProjectedTweets from an NDJSON file.
+
+    When the projection saved by an earlier pass (or by createFiles) still
+    matches the file, only those small records are parsed; the raw lines are
+    read back just for the tweets whose other fields are used.
+    """
+    lines = TweetLines(filename)
+    try:
+        if projection_is_current(filename):
+            projected_file, _ = projection_files(filename)
+            print(f"Streaming the projection of {filename}...", flush=True)
+            with open(projected_file, 'rb') as f:
+                for line in f:
+                    offset, length, item, record = json.loads(line)
+                    yield ProjectedTweet(record, lines, offset, length, item)
+        else:
+            yield from project_ndjson_file(filename, lines)
+    finally:
+        lines.close()
+
+class StaleStateError(Exception):
+    """The saved state no longer describes a prefix of the archive"""
+
+def metric_counts(record):
+    return int(record.get('favorite_count', 0) or 0), int(record.get('retweet_count', 0) or 0)
+
+def record_digest(record):
+    """Checksum of everything in a record except its likes and retweets"""
+    fields = {key: value for key, value in record.items() if key not in ('favorite_count', 'retweet_count')}
+    return zlib.crc32(json.dumps(fields, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+
+class TweetIndex:
+    """Lookup tables shared by every analysis, built once during the pass"""
+
+    def __init__(self):
+        self.tweets_by_id = {}
+        self.max_id = 0
+        self.tweet_count = 0
+        # id -> (likes, retweets, digest) of each tweet the saved state covers
+        self.saved = {}
+
+    def add(self, tweet):
+        record = projected(tweet)
+        tweet_id = record.get('id_str')
+        if tweet_id is None:
+            return record
+        self.tweets_by_id[tweet_id] = record
+        self.max_id = max(self.max_id, int(tweet_id))
+        self.tweet_count += 1
+        return record
+
+    def refresh(self, tweet):
+        """Index a tweet the saved state covers again, checking it against what was saved.
+
+        Returns (record, previous), where previous is the record as saved if
+        only its likes or retweets have moved, and None if nothing has. Any
+        other edit raises StaleStateError, since the counters built from the
+        old text, urls or mentions can't be corrected one tweet at a time.
+        """
+        record = projected(tweet)
+        tweet_id = record['id_str']
+        saved = self.saved.get(tweet_id)
+        if saved is None:
+            raise StaleStateError(f"Tweet {tweet_id} isn't in the saved state")
+        favorite_count, retweet_count, digest = saved
+        if record_digest(record) != digest:
+            raise StaleStateError(f"Tweet {tweet_id} was edited since the state was saved")
+        self.tweets_by_id[tweet_id] = record
+        if metric_counts(record) == (favorite_count, retweet_count):
+            return record, None
+        return record, dict(record, favorite_count=favorite_count, retweet_count=retweet_count)
+
+    def to_state(self):
+        # The records themselves are projected again from the archive on every run
+        records = self.tweets_by_id.values()
+        counts = [metric_counts(record) for record in records]
+        return {
+            'max_id': str(self.max_id),
+            'tweet_count': self.tweet_count,
+            'tweet_ids': list(self.tweets_by_id),
+            'favorite_counts': [likes for likes, _ in counts],
+            'retweet_counts': [retweets for _, retweets in counts],
+            'digests': [record_digest(record) for record in records],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.saved = dict(zip(state['tweet_ids'],
+                               zip(state['favorite_counts'], state['retweet_counts'], state['digests'])))
+        index.max_id = int(state['max_id'])
+        index.tweet_count = state['tweet_count']
+        return index
+
+class Analysis:
+    """An accumulator fed one tweet at a time by run_analyses"""
+
+    outputs = ()
+
+    def add(self, tweet, record):
+        pass
+
+    def restore(self, tweet, record):
+        """Called in incremental runs for each tweet the saved state covers, to re-derive what isn't saved"""
+        pass
+
+    def replace(self, tweet, record, previous):
+        """Called after restore when the likes or retweets of an already processed tweet have changed"""
+        pass
+
+    def finish(self, index, results):
+        raise NotImplementedError
+
+    def to_state(self):
+        return {}
+
+    def load_state(self, state):
+        pass
+
+class SelfQuoteAnalysis(Analysis):
+    """Collects self-quoting tweets and counts the ids they quote.
+
+    Nothing is saved: the urls are in every record, so an incremental run
+    finds the self-quotes among the older tweets again as it restores them.
+    """
+
+    outputs = ('selfQuotedTweets.json', 'countSelfQuotes.json')
+
+    def __init__(self, handle=SELF_QUOTE_HANDLE, sort=True, collect=True):
+        self.handle = handle.lower()
+        self.sort = sort
+        # Without collect only current_quoted_ids is kept, for analyses that count in fixed memory
+        self.collect = collect
+        self.pattern = quote_pattern(handle)
+        self.matching_tweets = []
+        # id -> position in matching_tweets, for replace()
+        self.positions = {}
+        self.quoted_ids = Counter()
+        # What the latest tweet matched, for analyses registered after this one
+        self.current_matched = False
+        self.current_quoted_ids = []
+        self.current_quote_urls = []
+
+    def add(self, tweet, record):
+        matched = False
+        quoted_ids = []
+        quote_urls = []
+        # The projection carries the urls, so a tweet is only decoded whole when it matches
+        urls = record['urls'] if record is not None else tweet.get('entities', {}).get('urls', [])
+        for url in urls:
+            expanded_url = url.get('expanded_url') or ''
+            if self.handle in expanded_url.lower():
+                matched = True
+                match = self.pattern.search(expanded_url)
+                if match:
+                    quoted_ids.append(match.group(1))
+                    quote_urls.append(expanded_url)
+        if self.collect:
+            self.quoted_ids.update(quoted_ids)
+            if matched:
+                self.positions[tweet.get('id_str')] = len(self.matching_tweets)
+                self.matching_tweets.append(decoded(tweet))
+        self.current_matched = matched
+        self.current_quoted_ids = quoted_ids
+        self.current_quote_urls = quote_urls
+
+    def restore(self, tweet, record):
+        self.add(tweet, record)
+
+    def replace(self, tweet, record, previous):
+        # A restored tweet was collected as it is now; one kept in memory by watch.py needs its new counts
+        position = self.positions.get(tweet.get('id_str'))
+        if position is not None:
+            self.matching_tweets[position] = decoded(tweet)
+
+    def finish(self, index, results):
+        if not self.collect:
+            return {}
+        print(f"Found {len(self.matching_tweets)} self-quoted tweets", flush=True)
+        count_data = {
+            "tweet_counts": [
+                {"tweet_id": tweet_id, "count": count}
+                for tweet_id, count in self.quoted_ids.items()
+            ]
+        }
+        if self.sort:
+            count_data['tweet_counts'].sort(key=lambda x: x['count'], reverse=True)
+        print(f"Processed {len(count_data['tweet_counts'])} unique quoted tweets", flush=True)
+        return {
+            'selfQuotedTweets.json': self.matching_tweets,
+            'countSelfQuotes.json': count_data,
+        }
+
+class TweetInfoAnalysis(Analysis):
+    """Joins the quote counts against the tweet index"""
+
+    outputs = ('tweet_results.json', 'not_found_tweets.json')
+
+    def __init__(self, sort=True):
+        self.sort = sort
+
+    def finish(self, index, results):
+        tweet_results, not_found_tweets = build_tweet_results(
+            results['countSelfQuotes.json'], index.tweets_by_id, sort=self.sort)
+        return {
+            'tweet_results.json': tweet_results,
+            'not_found_tweets.json': not_found_tweets,
+        }
+
+class ThreadAnalysis(Analysis):
+    """Follows reply chains from the tweet index into threads"""
+
+    outputs = ('twitter_threads.json', 'thread_statistics.json')
+
+    def finish(self, index, results):
+        records = list(index.tweets_by_id.values())
+        threads = build_threads(forest_from_records(records), records)
+        return {
+            'twitter_threads.json': threads,
+            'thread_statistics.json': thread_statistics(threads),
+        }
+
+def default_analyses(handle=SELF_QUOTE_HANDLE, sort=False, filename=None, workers=None):
+    """The pipeline's analyses; the pages rank with leaderboards.json, so full sorts are opt-in.
+
+    With workers set, the self-quote and tweet result outputs are built from
+    the NDJSON filename on that many processes (see parallelQuotes.py).
+    """
+    from interactionGraph import InteractionAnalysis
+    from leaderboards import LeaderboardAnalysis
+    from linkAnalytics import LinkAnalysis
+    from quoteGraph import QuoteGraphAnalysis
+    from relatedTweets import RelatedTweetsAnalysis
+    from searchIndex import SearchIndexAnalysis
+    from temporalAggregates import TemporalAnalysis
+
+    if workers:
+        from parallelQuotes import ParallelSelfQuoteAnalysis
+        if not filename.endswith('.ndjson'):
+            raise ValueError(f"The parallel mode splits tweets.ndjson by line; {filename} can't be split")
+        self_quotes = ParallelSelfQuoteAnalysis(filename, workers, handle, sort=sort)
+        self_quote_analyses = [self_quotes]
+    else:
+        self_quotes = SelfQuoteAnalysis(handle, sort=sort)
+        self_quote_analyses = [self_quotes, TweetInfoAnalysis(sort=sort)]
+    return self_quote_analyses + [ThreadAnalysis(), TemporalAnalysis(self_quotes),
+            QuoteGraphAnalysis(self_quotes), InteractionAnalysis(handle), LinkAnalysis(self_quotes),
+            LeaderboardAnalysis(), SearchIndexAnalysis(), RelatedTweetsAnalysis()]
+
+def run_analyses(tweets, analyses, index=None, since_id=None):
+    """Feed every tweet once to the shared index and each analysis, then finish them in order.
+
+    With since_id set the index and analyses were loaded from saved state:
+    tweets up to that id are restored and checked for changes, newer ones are added.
+    """
+    if index is None:
+        index = TweetIndex()
+    previous_count = index.tweet_count
+    seen_before = 0
+    seen = 0
+    with stage('Single pass') as pass_record:
+        for tweet in tqdm(tweets, desc="Analysing tweets", unit=" tweets"):
+            seen += 1
+            if since_id is not None and 'id_str' in tweet and int(tweet['id_str']) <= since_id:
+                seen_before += 1
+                record, previous = index.refresh(tweet)
+                for analysis in analyses:
+                    analysis.restore(tweet, record)
+                    if previous is not None:
+                        analysis.replace(tweet, record, previous)
+                continue
+            record = index.add(tweet)
+            for analysis in analyses:
+                analysis.add(tweet, record)
+        pass_record.records(records_in=seen, records_out=index.tweet_count - previous_count)
+
+    if since_id is not None and seen_before != previous_count:
+        raise StaleStateError(
+            f"Saved state covers {previous_count} tweets but the archive has {seen_before} of them")
+    return finish_analyses(index, analyses)
+
+def apply_changes(index, analyses, changes):
+    """Apply what the archive changed to an index and analyses kept in memory since the last run, then finish them.
+
+    changes is the createFiles.TweetChanges of the archive against
+    index.tweets_by_id. Like a run resumed from saved state, it can only take
+    new tweets and new likes or retweets; anything else raises StaleStateError.
+    """
+    if changes.removed:
+        raise StaleStateError(f"{len(changes.removed)} tweets are no longer in the archive")
+    for tweet, record, previous in changes.changed:
+        if record_digest(record) != record_digest(previous):
+            raise StaleStateError(f"Tweet {record['id_str']} was edited since the last run")
+    with stage('Apply changes') as changes_record:
+        for tweet, record, previous in changes.changed:
+            index.tweets_by_id[record['id_str']] = record
+            for analysis in analyses:
+                analysis.replace(tweet, record, previous)
+        for tweet, record in changes.added:
+            index.add(tweet)
+            for analysis in analyses:
+                analysis.add(tweet, record)
+        changes_record.records(records_in=len(changes.changed) + len(changes.added), records_out=len(changes.added))
+    print(f"Applied {len(changes.added)} new and {len(changes.changed)} changed tweets", flush=True)
+    return finish_analyses(index, analyses)
+
+def finish_analyses(index, analyses):
+    results = {}
+    for analysis in analyses:
+        with stage(type(analysis).__name__) as finish_record:
+            outputs = analysis.finish(index, results)
+            finish_record.records(records_in=index.tweet_count,
+                                  records_out=sum(len(data) for data in outputs.values()))
+        results.update(outputs)
+    return results, index
+
 def find_self_quotes(tweets_array):
     print("\n=== Finding self-quoted tweets ===", flush=True)
-    matching_tweets = []
-    
-    # Flatten and handle the nested tweet structure
-    flattened_tweets = []
-    for tweet_item in tweets_array:
-        if 'tweet' in tweet_item:
-            flattened_tweets.append(tweet_item['tweet'])
-        elif isinstance(tweet_item, list):
-            flattened_tweets.extend(tweet_item)
-        else:
-            flattened_tweets.append(tweet_item)
-    
-    for tweet_obj in flattened_tweets:
-        if 'entities' in tweet_obj and 'urls' in tweet_obj['entities']:
-            urls = tweet_obj['entities']['urls']
-            for url in urls:
-                if 'expanded_url' in url and 'visakanv' in url['expanded_url']:
-                    matching_tweets.append(tweet_obj)
-                    break
-    
-    print(f"Found {len(matching_tweets)} self-quoted tweets", flush=True)
-    return matching_tweets
+    analysis = SelfQuoteAnalysis()
+    for tweet in iter_tweets(tweets_array):
+        analysis.add(tweet, None)
+    print(f"Found {len(analysis.matching_tweets)} self-quoted tweets", flush=True)
+    return analysis.matching_tweets
 
 def count_quote_tweets(self_quoted_tweets):
     print("\n=== Counting quote tweets ===", flush=True)
-    pattern = r'/visakanv/status/(\d+)'
-    tweet_ids = []
-    
+    analysis = SelfQuoteAnalysis()
     for tweet in self_quoted_tweets:
-        if 'entities' in tweet and 'urls' in tweet['entities']:
-            for url in tweet['entities']['urls']:
-                if 'expanded_url' in url and 'visakanv' in url['expanded_url']:
-                    match = re.search(pattern, url['expanded_url'])
-                    if match:
-                        tweet_ids.append(match.group(1))
-    
-    id_counts = Counter(tweet_ids)
-    result = {
-        "tweet_counts": sorted([
-            {"tweet_id": tweet_id, "count": count}
-            for tweet_id, count in id_counts.items()
-        ], key=lambda x: x['count'], reverse=True)
-    }
-    
-    print(f"Processed {len(result['tweet_counts'])} unique quoted tweets", flush=True)
-    return result
-
-def extract_tweet_info(tweets_data, count_data):
-    print("\n=== Extracting tweet info ===", flush=True)
-    
-    # Create a dictionary of tweets for faster lookup
-    print("\nCreating tweet dictionary...", flush=True)
-    tweets_dict = {}
-    tweet_count = 0
-    
-    for i, tweet_list in enumerate(tweets_data):
-        if isinstance(tweet_list, list):
-            print(f"Processing list {i} (length: {len(tweet_list)})", flush=True)
-            for tweet_obj in tweet_list:
-                if isinstance(tweet_obj, dict) and 'tweet' in tweet_obj:
-                    tweet = tweet_obj['tweet']
-                    if 'id_str' in tweet:
-                        tweets_dict[tweet['id_str']] = tweet
-                        tweet_count += 1
-        elif isinstance(tweet_list, dict) and 'tweet' in tweet_list:
-            tweet = tweet_list['tweet']
-            if 'id_str' in tweet:
-                tweets_dict[tweet['id_str']] = tweet
-                tweet_count += 1
-
-    print(f"✓ Processed {tweet_count} tweets into dictionary", flush=True)
+        analysis.add(tweet, None)
+    return analysis.finish(None, {})['countSelfQuotes.json']
 
+def build_tweet_results(count_data, tweets_by_id, sort=True):
     results = []
     not_found_tweets = []
     not_found_count = 0
-    
+
     for tweet_count in count_data['tweet_counts']:
         tweet_id = tweet_count['tweet_id']
         count = tweet_count['count']
-        tweet = tweets_dict.get(tweet_id)
-        
+        tweet = tweets_by_id.get(tweet_id)
+
         if tweet:
             result = {
                 'tweet_id': tweet_id,
                 'count': count,
                 'tweet_text': tweet.get('full_text', ''),
                 'retweeted': tweet.get('retweeted', False),
-                'user_mentions': [
-                    {
-                        'name': mention['name'],
-                        'screen_name': mention['screen_name']
-                    }
-                    for mention in tweet.get('entities', {}).get('user_mentions', [])
-                ],
-                'urls': [
-                    {
-                        'url': url['url'],
-                        'expanded_url': url['expanded_url'],
-                        'display_url': url['display_url']
-                    }
-                    for url in tweet.get('entities', {}).get('urls', [])
-                ],
+                'user_mentions': tweet['user_mentions'],
+                'urls': tweet['urls'],
                 'favorite_count': tweet.get('favorite_count', 0),
                 'retweet_count': tweet.get('retweet_count', 0),
                 'in_reply_to_screen_name': tweet.get('in_reply_to_screen_name'),
@@ -156,104 +649,94 @@ def extract_tweet_info(tweets_data, count_data):
             }
             not_found_tweets.append(not_found_tweet)
             results.append(not_found_tweet)
-    
-    results.sort(key=lambda x: x['count'], reverse=True)
+
+    if sort:
+        results.sort(key=lambda x: x['count'], reverse=True)
     print(f"\nTweets not found: {not_found_count}", flush=True)
     return results, not_found_tweets
 
-def find_threads(tweets_data):
-    print("\n=== Finding threads ===", flush=True)
-    
-    # Create a dictionary to store tweets by their ID
-    print("Creating tweets by id")
-    tweets_by_id = {tweet['tweet']['id_str']: tweet['tweet'] for tweet in tweets_data}
-    
-    print("Creating reply to tweet mapping")
-    # Create a dictionary to map reply tweets to their parent tweets
-    reply_to_tweet = defaultdict(list)
-    for tweet in tweets_data:
-        tweet_data = tweet['tweet']
-        if tweet_data.get('in_reply_to_status_id_str'):
-            reply_to_tweet[tweet_data['in_reply_to_status_id_str']].append(tweet_data)
+def extract_tweet_info(tweets_data, count_data):
+    print("\n=== Extracting tweet info ===", flush=True)
+    index = TweetIndex()
+    for tweet in iter_tweets(tweets_data):
+        index.add(tweet)
+    print(f"✓ Processed {len(index.tweets_by_id)} tweets into dictionary", flush=True)
+    return build_tweet_results(count_data, index.tweets_by_id)
 
-    print("Finding thread starts")
-    # Find thread starting points (original tweets that have replies)
-    thread_starts = set()
-    for tweet in tweets_data:
-        tweet_data = tweet['tweet']
-        tweet_id = tweet_data['id_str']
-        
-        # Only consider tweets that are not replies and have replies
-        if (not tweet_data.get('in_reply_to_status_id_str') and 
-            tweet_id in reply_to_tweet):
-            thread_starts.add(tweet_id)
+def forest_from_records(records):
+    """Build the reply forest over projected records, parsing each timestamp once"""
+    count = len(records)
+    return ConversationForest(
+        np.fromiter((int(r['id_str']) for r in records), dtype=np.int64, count=count),
+        np.fromiter((int(r.get('in_reply_to_status_id_str') or 0) for r in records), dtype=np.int64, count=count),
+        np.fromiter((parse_created_at(r.get('created_at')) for r in records), dtype=np.int64, count=count),
+        np.fromiter((int(r.get('favorite_count', 0) or 0) for r in records), dtype=np.int64, count=count),
+        np.fromiter((int(r.get('retweet_count', 0) or 0) for r in records), dtype=np.int64, count=count),
+    )
+
+def project_thread(forest, records, row):
+    """The thread shape of one conversation: its main chain plus whole-tree metrics"""
+    thread = [records[r] for r in forest.main_chain(row)]
+    return thread_entry(thread, forest.subtree_metrics(row))
+
+def thread_entry(thread, conversation=None):
+    """Project a chain of tweet records into the twitter_threads.json shape"""
+    # Calculate thread metrics
+    thread_length = len(thread)
+    total_likes = sum(int(t.get('favorite_count', 0) or 0) for t in thread)
+    total_retweets = sum(int(t.get('retweet_count', 0) or 0) for t in thread)
+    thread_start_date = thread[0]['created_at']
+    thread_end_date = thread[-1]['created_at']
 
+    metadata = {
+        'length': thread_length,
+        'total_likes': total_likes,
+        'total_retweets': total_retweets,
+        'start_date': thread_start_date,
+        'end_date': thread_end_date
+    }
+    if conversation is not None:
+        # Metrics over every branch of the conversation, not just the main chain
+        metadata['conversation'] = conversation
+
+    return {
+        'metadata': metadata,
+        'tweets': [{
+            'tweet_id': t['id_str'],
+            'text': t['full_text'],
+            'created_at': t['created_at'],
+            'order': idx + 1,
+            'favorite_count': int(t.get('favorite_count', 0) or 0),
+            'retweet_count': int(t.get('retweet_count', 0) or 0),
+            'urls': t['urls'],
+            'in_reply_to_status_id': t.get('in_reply_to_status_id_str'),
+            'in_reply_to_user_id_str': t.get('in_reply_to_user_id_str')
+        } for idx, t in enumerate(thread)]
+    }
+
+def build_threads(forest, records):
+    print("Finding thread starts")
+    # Thread starting points are original tweets that have replies
+    thread_starts = forest.thread_starts()
     print(f"Found {len(thread_starts)} thread starts")
 
     print("Building threads")
-    threads = {}
-    for start_id in tqdm(thread_starts, desc="Building threads"):
-        thread = []
-        current_tweet = tweets_by_id[start_id]
-        thread.append(current_tweet)
-        
-        # Follow the reply chain
-        current_id = start_id
-        while current_id in reply_to_tweet:
-            replies = reply_to_tweet[current_id]
-            # Sort replies by timestamp
-            replies.sort(key=lambda x: x['created_at'])
-            # Take the first reply
-            next_tweet = replies[0]
-            thread.append(next_tweet)
-            current_id = next_tweet['id_str']
-        
-        if len(thread) > 1:
-            # Calculate thread metrics
-            thread_length = len(thread)
-            total_likes = sum(int(t.get('favorite_count', 0) or 0) for t in thread)
-            total_retweets = sum(int(t.get('retweet_count', 0) or 0) for t in thread)
-            thread_start_date = thread[0]['created_at']
-            thread_end_date = thread[-1]['created_at']
-            
-            threads[start_id] = {
-                'metadata': {
-                    'length': thread_length,
-                    'total_likes': total_likes,
-                    'total_retweets': total_retweets,
-                    'start_date': thread_start_date,
-                    'end_date': thread_end_date
-                },
-                'tweets': [{
-                    'tweet_id': t['id_str'],
-                    'text': t['full_text'],
-                    'created_at': t['created_at'],
-                    'order': idx + 1,
-                    'favorite_count': int(t.get('favorite_count', 0) or 0),
-                    'retweet_count': int(t.get('retweet_count', 0) or 0),
-                    'urls': [
-                        {
-                            'url': url.get('url'),
-                            'expanded_url': url.get('expanded_url'),
-                            'display_url': url.get('display_url')
-                        }
-                        for url in t.get('entities', {}).get('urls', [])
-                    ],
-                    'in_reply_to_status_id': t.get('in_reply_to_status_id_str'),
-                    'in_reply_to_user_id_str': t.get('in_reply_to_user_id_str')
-                } for idx, t in enumerate(thread)]
-            }
+    return {
+        records[row]['id_str']: project_thread(forest, records, row)
+        for row in thread_starts.tolist()
+    }
 
-    # Calculate thread statistics
+def thread_statistics(threads):
     print("Calculating thread statistics")
     total_threads = len(threads)
-    
+
     if total_threads > 0:
         thread_lengths = [thread['metadata']['length'] for thread in threads.values()]
-        longest_thread_id = max(threads.keys(), key=lambda k: threads[k]['metadata']['length'])
+        # Ties go to the earliest thread so the result doesn't depend on input order
+        longest_thread_id = max(threads.keys(), key=lambda k: (threads[k]['metadata']['length'], -int(k)))
         longest_thread_length = threads[longest_thread_id]['metadata']['length']
         average_thread_length = sum(thread_lengths) / len(thread_lengths)
-        
+
         stats = {
             'total_threads': total_threads,
             'longest_thread': {
@@ -271,44 +754,197 @@ def find_threads(tweets_data):
             'longest_thread': None,
             'average_thread_length': 0
         }
-    
-    return threads, stats
 
-def main():
+    return stats
+
+def find_threads(tweets_data):
+    print("\n=== Finding threads ===", flush=True)
+    index = TweetIndex()
+    for tweet in iter_tweets(tweets_data):
+        index.add(tweet)
+    records = list(index.tweets_by_id.values())
+    threads = build_threads(forest_from_records(records), records)
+    return threads, thread_statistics(threads)
+
+def load_tweets(filename):
+    """Stream tweets from NDJSON, or load a JSON array written by older runs"""
+    if filename.endswith('.ndjson'):
+        return iter_tweets(iter_ndjson_file(filename))
+    return iter_tweets(load_json_file(filename))
+
+def load_projected_tweets(filename):
+    """Tweets for run_analyses: ProjectedTweets from NDJSON, whole tweets from an older JSON array"""
+    if filename.endswith('.ndjson'):
+        return iter_projected_tweets(filename)
+    return load_tweets(filename)
+
+def load_records(filename):
+    """Stream just the projected record of every tweet"""
+    return map(projected, load_projected_tweets(filename))
+
+def default_tweets_file():
+    return TWEETS_FILE
+
+def analyse_tweets(filename, handle=SELF_QUOTE_HANDLE, sort=False, workers=None):
+    analyses = default_analyses(handle, sort, filename, workers)
+    results, index = run_analyses(load_projected_tweets(filename), analyses)
+    return results, index, analyses
+
+def load_state(filename=STATE_FILE):
+    if not os.path.exists(filename):
+        return None
+    state = load_json_file(filename)
+    if state.get('version') != STATE_VERSION:
+        print(f"Ignoring {filename}: written by an older version", flush=True)
+        return None
+    return state
+
+def save_state(index, analyses, filename=STATE_FILE):
+    state = {'version': STATE_VERSION}
+    state.update(index.to_state())
+    for analysis in analyses:
+        state.update(analysis.to_state())
+    # Write to a temporary file first so an interrupted run never leaves half a state behind
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp_filename, filename)
+    print(f"✓ Saved {filename} (max id {state['max_id']})", flush=True)
+    return state
+
+def analyse_incremental(filename, state, handle=SELF_QUOTE_HANDLE, sort=False, workers=None):
+    """Resume from saved state, processing only tweets newer than its max id"""
+    index = TweetIndex.from_state(state)
+    analyses = default_analyses(handle, sort, filename, workers)
+    for analysis in analyses:
+        analysis.load_state(state)
+    print(f"Resuming from {index.tweet_count} tweets up to id {index.max_id}", flush=True)
+    results, index = run_analyses(load_projected_tweets(filename), analyses, index, since_id=index.max_id)
+    return results, index, analyses
+
+def canonical_output(filename, data):
+    """Order-independent form of an output, for comparing runs fed tweets in different orders"""
+    if filename == 'selfQuotedTweets.json':
+        return sorted(data, key=lambda t: t.get('id_str', ''))
+    if filename == 'countSelfQuotes.json':
+        return sorted(data['tweet_counts'], key=lambda x: (-x['count'], x['tweet_id']))
+    if filename in ('tweet_results.json', 'not_found_tweets.json'):
+        return sorted(data, key=lambda x: (-x['count'], x['tweet_id']))
+    if filename == 'interaction_graph.json':
+        # Interned ids follow the order names were first seen in, so compare by name
+        rows = zip(data['months'], data['month_start'], data['month_start'][1:])
+        return sorted((month, data['names'][data['contacts'][i]], data['mentions'][i], data['replies'][i])
+                      for month, lo, hi in rows for i in range(lo, hi))
+    return data
+
+def verify_incremental(filename, handle=SELF_QUOTE_HANDLE):
+    """Check that resuming from the saved state gives the same outputs as a full rebuild"""
+    state = load_state()
+    if state is None:
+        print(f"❌ No usable {STATE_FILE} to verify against", flush=True)
+        return False
+    print("\n=== Incremental run ===", flush=True)
+    incremental, _, _ = analyse_incremental(filename, state, handle)
+    print("\n=== Full rebuild ===", flush=True)
+    full, _, _ = analyse_tweets(filename, handle)
+
+    matches = True
+    for output in full:
+        if canonical_output(output, full[output]) == canonical_output(output, incremental[output]):
+            print(f"✓ {output} matches", flush=True)
+        else:
+            print(f"❌ {output} differs from the full rebuild", flush=True)
+            matches = False
+    return matches
+
+def resident_analyses(resident, tweets_file):
+    """(index, analyses, changes) a long-running process kept from its last run, if they still fit tweets_file.
+
+    changes is the createFiles.TweetChanges of this run's archive, or None
+    when createFiles didn't run and tweets_file is the one last analysed.
+    """
+    index = resident.pop('index', None)
+    analyses = resident.pop('analyses', None)
+    signature = resident.pop('signature', None)
+    changes = resident.pop('changes', None)
+    if index is None:
+        return None
+    current = source_signature(tweets_file)
+    if changes is None and signature == current:
+        return index, analyses, None
+    if changes is not None and changes.signature == current:
+        return index, analyses, changes
+    return None
+
+def process_tweets(incremental=False, store=False, handle=SELF_QUOTE_HANDLE, sort=False, resident=None,
+                   workers=None):
+    """Run the analyses, write their outputs and save state; returns (results, index).
+
+    workers, when set, builds the self-quote outputs on that many processes.
+
+    resident is a dict a long-running process keeps between runs (see watch.py).
+    It holds the index and analyses of the last run, and createFiles adds the
+    tweets the archive changed since, so only those are applied. Without them
+    its 'state' is resumed from instead of reading STATE_FILE back.
+    """
     try:
-        # Load tweets.json once
-        tweets_data = retry_on_failure("Load tweets.json", load_json_file, 'tweets.json')
-        
-        # Find self-quoted tweets
-        print("\n=== Finding self-quoted tweets ===", flush=True)
-        self_quoted_tweets = retry_on_failure("Find self-quoted tweets", find_self_quotes, tweets_data)
-        with open('selfQuotedTweets.json', 'w', encoding='utf-8') as f:
-            json.dump(self_quoted_tweets, f, indent=2, ensure_ascii=False)
-        
-        # Count quote tweets
-        print("\n=== Counting quote tweets ===", flush=True)
-        count_data = retry_on_failure("Count quote tweets", count_quote_tweets, self_quoted_tweets)
-        with open('countSelfQuotes.json', 'w', encoding='utf-8') as f:
-            json.dump(count_data, f, indent=2, ensure_ascii=False)
-        
-        # Extract tweet info
-        print("\n=== Extracting tweet info ===", flush=True)
-        results, not_found_tweets = retry_on_failure("Extract tweet info", extract_tweet_info, tweets_data, count_data)
-        with open('tweet_results.json', 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
-        with open('not_found_tweets.json', 'w', encoding='utf-8') as f:
-            json.dump(not_found_tweets, f, indent=2, ensure_ascii=False)
-        
-        # Find threads
-        print("\n=== Finding threads ===", flush=True)
-        threads, thread_stats = retry_on_failure("Find threads", find_threads, tweets_data)
-        with open('twitter_threads.json', 'w', encoding='utf-8') as f:
-            json.dump(threads, f, indent=2, ensure_ascii=False)
-        with open('thread_statistics.json', 'w', encoding='utf-8') as f:
-            json.dump(thread_stats, f, indent=2, ensure_ascii=False)
-        
+        # Read the tweets once and run every analysis in a single pass
+        print("\n=== Analysing tweets ===", flush=True)
+        tweets_file = default_tweets_file()
+        state = None
+        live = None
+        if incremental:
+            live = resident_analyses(resident, tweets_file) if resident is not None else None
+            if live is None:
+                state = resident.pop('state', None) if resident is not None else None
+                state = state or load_state()
+        if store:
+            from tweetStore import analyse_store
+            results = retry_on_failure("Analyse tweet store", analyse_store, handle=handle)
+            index = None
+        elif live is not None:
+            index, analyses, changes = live
+            try:
+                if changes is None:
+                    print("No changes since the last run", flush=True)
+                    results, index = finish_analyses(index, analyses)
+                else:
+                    results, index = apply_changes(index, analyses, changes)
+            except StaleStateError as e:
+                print(f"\n{str(e)}. Falling back to a full rebuild...", flush=True)
+                results, index, analyses = retry_on_failure("Analyse tweets", analyse_tweets, tweets_file,
+                                                            handle, sort, workers)
+        elif state is None:
+            results, index, analyses = retry_on_failure("Analyse tweets", analyse_tweets, tweets_file,
+                                                        handle, sort, workers)
+        else:
+            try:
+                with stage("Analyse new tweets"):
+                    results, index, analyses = analyse_incremental(tweets_file, state, handle, sort, workers)
+            except StaleStateError as e:
+                print(f"\n{str(e)}. Falling back to a full rebuild...", flush=True)
+                results, index, analyses = retry_on_failure("Analyse tweets", analyse_tweets, tweets_file,
+                                                            handle, sort, workers)
+
+        with stage("Write outputs") as record:
+            for filename, data in results.items():
+                if hasattr(data, 'save'):
+                    # Binary outputs like the quote graph write themselves
+                    data.save(filename)
+                else:
+                    write_json_file(filename, data)
+                print(f"✓ Saved {filename}", flush=True)
+            record.records(records_out=len(results))
+        if index is not None:
+            with stage("Save state"):
+                save_state(index, analyses)
+            if resident is not None:
+                # The analyses themselves stay in memory, so the next run only applies what changed
+                resident.update(index=index, analyses=analyses, signature=source_signature(tweets_file))
+
         print("\n✨ Processing complete!", flush=True)
-        
+        return results, index
+
     except Exception as e:
         print("\n" + "="*50)
         print("❌ PROCESSING FAILED")
@@ -317,5 +953,31 @@ def main():
         print("\nPartial outputs may have been created for steps that completed successfully.")
         raise
 
+def main():
+    parser = argparse.ArgumentParser(description="Analyse self-quotes and threads in the tweet archive")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"only process tweets newer than those recorded in {STATE_FILE}")
+    parser.add_argument('--store', action='store_true',
+                        help="run the analyses on the memory-mapped columnar store built by createFiles")
+    parser.add_argument('--verify-incremental', action='store_true',
+                        help="compare an incremental run against a full rebuild without writing outputs")
+    parser.add_argument('--handle', default=SELF_QUOTE_HANDLE,
+                        help=f"account whose self-quotes to find (default: {SELF_QUOTE_HANDLE})")
+    parser.add_argument('--sorted', action='store_true',
+                        help="sort countSelfQuotes.json and tweet_results.json by count (leaderboards.json "
+                             "already holds the top tweets)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="find and count self-quotes on this many processes; parallelQuotes.py --verify "
+                             "checks the parallel mode against the serial pass")
+    args = parser.parse_args()
+
+    if args.verify_incremental:
+        if not verify_incremental(default_tweets_file(), args.handle):
+            raise SystemExit(1)
+        return
+
+    process_tweets(incremental=args.incremental, store=args.store, handle=args.handle, sort=args.sorted,
+                   workers=args.workers)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
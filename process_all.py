@@ -1,96 +1,211 @@
+import argparse
 import os
-import time
-from datetime import datetime
-
-def run_step(step_name, script_name):
-    print(f"\n{'='*50}")
-    print(f"Starting {step_name} at {datetime.now().strftime('%H:%M:%S')}")
-    print(f"{'='*50}")
-    
-    # Clear any existing error status
-    _ = os.system('exit 0')
-    
-    # Try python3 first
-    print(f"Attempting with python3...", flush=True)
-    result = os.system(f'python3 {script_name}')
-    
-    # If python3 fails, try python
-    if result != 0:
-        print(f"\nPython3 attempt failed. Trying with python...", flush=True)
-        time.sleep(2)
-        # Clear error status before retry
-        _ = os.system('exit 0')
-        result = os.system(f'python {script_name}')
-    
-    # If both attempts fail
-    if result != 0:
-        print("\n" + "="*50)
-        print(f"❌ {step_name} FAILED")
-        print("="*50)
-        print(f"Both python3 and python attempts failed for {script_name}")
-        raise Exception(f"Error running {script_name} after both attempts")
-    
-    print(f"\n✓ Completed {step_name}")
-    time.sleep(1)  # Small pause between steps for readability
-
-def check_file_exists(filename):
-    if not os.path.exists(filename):
-        raise Exception(f"Expected output file {filename} not found!")
+from functools import partial
+
+from pipeline import Node, Pipeline
+from publish import PUBLIC_DIR, publish, published_path
+from telemetry import PROFILE_ENV, current_stage, telemetry
+
+USERNAME = 'visakanv'
+# Code is fingerprinted where it lives, so the pipeline can run from an account's own directory
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Files createFiles splits out of the archive
+ARCHIVE_FILES = ['account.json', 'profile.json', 'upload.json', 'totalTweetLength.json']
+CREATED_FILES = ['tweets.ndjson', 'tweets.projected.ndjson', 'tweets.projected.json', 'tweet_store'] + ARCHIVE_FILES
+
+# Files processTweets writes, besides its incremental state
+ANALYSIS_FILES = [
+    'selfQuotedTweets.json',
+    'countSelfQuotes.json',
+    'tweet_results.json',
+    'not_found_tweets.json',
+    'twitter_threads.json',
+    'thread_statistics.json',  # Added new statistics file
+    'temporal_aggregates.json',
+    'quote_timelines.json',
+    'temporal_top_tweets.json',
+    'leaderboards.json',
+    'interaction_graph.json',
+    'search_index',
+    'related_tweets.json',
+    'link_domains.json',
+    'link_trends.json'
+]
+# Written by processTweets but not published: read by the Python query API or the next run
+INDEX_FILES = ['quote_graph', 'related_signatures']
+# processTweets resumes from the state it saved last time, so it is an input as well as an output
+STATE_FILE = 'processing_state.json'
+DATABASE_FILE = 'tweets.db'
+RESOLVED_FILE = 'resolved_tweets.json'
+
+def code(*filenames):
+    return [os.path.join(CODE_DIR, filename) for filename in filenames]
+
+def download(username, url, upstream):
+    from download import archive_url, downloadUserData
+    downloadUserData(username, url=url or archive_url(username))
+
+def create_files(archive_file, resident, upstream):
+    from createFiles import TweetChanges, process_json_file
+    from processTweets import source_signature
+    changes = None
+    if resident is not None and 'index' in resident and os.path.exists('tweets.ndjson') \
+            and resident.get('signature') == source_signature('tweets.ndjson'):
+        # The records in memory are the current file's, so diff the archive against them while it's read
+        changes = TweetChanges(resident['index'].tweets_by_id)
+    # Keep the archive: it is the cached input that tells us whether this node can be skipped
+    count = process_json_file(archive_file, delete_input=False, changes=changes)
+    if changes is not None:
+        resident['changes'] = changes
+    current_stage().records(records_out=count)
+    return count
+
+def process_tweets(handle, resident, workers, upstream):
+    from processTweets import process_tweets
+    results, index = process_tweets(incremental=True, handle=handle, resident=resident, workers=workers)
+    current_stage().records(records_in=index.tweet_count, records_out=len(results))
+    return {'results': results, 'records': list(index.tweets_by_id.values())}
+
+def publish_archive(upstream):
+    report = publish(ARCHIVE_FILES)
+    current_stage().records(records_in=len(ARCHIVE_FILES), records_out=len(report))
+
+def resolve_tweets(upstream):
+    from processTweets import load_json_file, write_json_file
+    from resolveTweets import RESOLVED_FILE, resolve_tweets
+    resolved = resolve_tweets([tweet['tweet_id'] for tweet in load_json_file('not_found_tweets.json')])
+    write_json_file(RESOLVED_FILE, resolved)
+    current_stage().records(records_out=len(resolved))
+
+def publish_analysis(handle, resolve, upstream):
+    # Hand over what processTweets still holds in memory instead of reading its files back
+    analysed = upstream['processTweets']
+    data = {}
+    if analysed is not None:
+        data.update(analysed['results'])
+        data['tweets.json'] = analysed['records']
+    if resolve:
+        from processTweets import load_json_file
+        from resolveTweets import apply_resolved, load_resolved
+        for filename in ('tweet_results.json', 'not_found_tweets.json'):
+            if filename not in data:
+                data[filename] = load_json_file(filename)
+        data['tweet_results.json'], data['not_found_tweets.json'] = apply_resolved(
+            data['tweet_results.json'], data['not_found_tweets.json'], load_resolved())
+    report = publish(['tweets.json'] + ANALYSIS_FILES, data=data, handle=handle)
+    current_stage().records(records_in=len(ANALYSIS_FILES) + 1, records_out=len(report))
+
+def build_database(upstream):
+    from processTweets import load_json_file, load_records
+    from tweetDatabase import build_database
+    analysed = upstream['processTweets']
+    if analysed is not None:
+        records = analysed['records']
+        threads = analysed['results']['twitter_threads.json']
+    else:
+        records = load_records('tweets.ndjson')
+        threads = load_json_file('twitter_threads.json')
+    count = build_database(records, threads)
+    current_stage().records(records_out=count)
+
+def build_pipeline(username=USERNAME, url=None, fetch=True, database=False, resolve=False, resident=None,
+                   workers=None):
+    """The pipeline for one account, run in the current directory.
+
+    With fetch=False the archive must already be in place, as when a batch
+    run downloads it ahead of the CPU work. With database=True the analysed
+    tweets are also loaded into tweets.db for queryServer.py. With
+    resolve=True quoted tweets missing from the archive are looked up on the
+    archive's REST endpoint and published as found. resident is the dict a
+    watch process keeps the analysis state in between runs. workers, when
+    set, finds and counts self-quotes on that many processes.
+    """
+    archive_file = f'{username}.json'
+    nodes = []
+    if fetch:
+        # The archive lives outside the tree, so it is fetched on every run
+        nodes.append(Node('download', partial(download, username, url), outputs=[archive_file],
+                          code=code('download.py'), cacheable=False))
+    if database:
+        nodes.append(Node('buildDatabase', build_database, after=['processTweets'],
+                          inputs=['tweets.ndjson', 'twitter_threads.json', 'quote_graph'],
+                          outputs=[DATABASE_FILE], code=code('tweetDatabase.py')))
+    if resolve:
+        # Asks the network, so it runs every time; its cache keeps repeat runs cheap
+        nodes.append(Node('resolveTweets', resolve_tweets, after=['processTweets'],
+                          inputs=['not_found_tweets.json'], outputs=[RESOLVED_FILE],
+                          code=code('resolveTweets.py'), cacheable=False))
+    return Pipeline(nodes + [
+        Node('createFiles', partial(create_files, archive_file, resident), after=['download'] if fetch else [],
+             inputs=[archive_file], outputs=CREATED_FILES, code=code('createFiles.py', 'tweetStore.py')),
+        Node('processTweets', partial(process_tweets, username, resident, workers), after=['createFiles'],
+             inputs=['tweets.ndjson', 'upload.json', STATE_FILE], outputs=ANALYSIS_FILES + INDEX_FILES + [STATE_FILE],
+             code=code('processTweets.py', 'temporalAggregates.py', 'threadForest.py', 'quoteGraph.py',
+                       'interactionGraph.py', 'leaderboards.py', 'searchIndex.py',
+                       'relatedTweets.py', 'linkAnalytics.py', 'parallelQuotes.py')),
+        Node('publishArchive', publish_archive, after=['createFiles'],
+             inputs=ARCHIVE_FILES, outputs=[published_path(f) for f in ARCHIVE_FILES],
+             code=code('publish.py')),
+        Node('publishAnalysis', partial(publish_analysis, username, resolve),
+             after=['processTweets'] + (['resolveTweets'] if resolve else []),
+             inputs=['tweets.ndjson'] + ANALYSIS_FILES + ([RESOLVED_FILE] if resolve else []),
+             outputs=[published_path(f) for f in ['tweets.json'] + ANALYSIS_FILES],
+             code=code('publish.py')),
+    ])
 
 def main():
+    parser = argparse.ArgumentParser(description="Download, analyse and publish the tweet archive")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip the steps that completed before the last failed run")
+    parser.add_argument('--force', action='store_true',
+                        help="run every step even if its inputs haven't changed")
+    parser.add_argument('--profile', metavar='STAGE',
+                        help=f"sample the stacks of one stage (like processTweets) into profile_<STAGE>.txt; "
+                             f"also settable with {PROFILE_ENV}")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="report each stage's peak Python allocations with tracemalloc (slower)")
+    parser.add_argument('--username', default=USERNAME,
+                        help=f"account to download and analyse (default: {USERNAME}); see batch.py for several")
+    parser.add_argument('--database', action='store_true',
+                        help=f"also build {DATABASE_FILE}, the SQLite database queryServer.py answers from")
+    parser.add_argument('--resolve', action='store_true',
+                        help="look up quoted tweets missing from the archive on its REST endpoint")
+    parser.add_argument('--skip-download', action='store_true',
+                        help="work offline from the archive already in this directory instead of downloading it")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="find and count self-quotes on this many processes (see parallelQuotes.py --verify)")
+    args = parser.parse_args()
+    if args.skip_download and not os.path.exists(f'{args.username}.json'):
+        parser.error(f"--skip-download needs {args.username}.json in this directory")
+    if args.profile:
+        telemetry.profile_stage = args.profile
+    if args.trace_memory:
+        telemetry.enable_memory_tracing()
+
     print("Starting Twitter data processing pipeline...")
-    
+
     # Create data directory if it doesn't exist
-    os.makedirs('public', exist_ok=True)
-    
-    # Step 1: Download the data
-    run_step("Download", "download.py")
-    check_file_exists("visakanv.json")
-    
-    # Step 2: Create separate files from the raw data
-    run_step("Create Files", "createFiles.py")
-    check_file_exists("tweets.json")
-    
-    # Step 3: Process tweets
-    run_step("Process Tweets", "processTweets.py")
-    check_file_exists("tweet_results.json")
-    
-
-    
-    # Move JSON files to public directory
-    json_files = [
-        'tweets.json',
-        'selfQuotedTweets.json',
-        'countSelfQuotes.json',
-        'tweet_results.json',
-        'totalTweetLength.json',
-        'upload.json',
-        'account.json',
-        'profile.json',
-        'not_found_tweets.json',
-        'twitter_threads.json',
-        'thread_statistics.json'  # Added new statistics file
-    ]
-    
-    print("\nMoving JSON files to public directory...")
-    for file in json_files:
-        try:
-            if os.path.exists(file):
-                os.rename(file, f'public/{file}')
-                print(f"✓ Moved {file} to public/")
-        except Exception as e:
-            print(f"! Error moving {file}: {str(e)}")
-    
+    os.makedirs(PUBLIC_DIR, exist_ok=True)
+
+    pipeline = build_pipeline(args.username, fetch=not args.skip_download, database=args.database,
+                              resolve=args.resolve, workers=args.workers)
+    try:
+        pipeline.run(resume=args.resume, force=args.force)
+    except BaseException:
+        telemetry.write_report('failed')
+        raise
+    telemetry.write_report('ok')
+
     print("\n✨ All processing completed successfully! ✨")
+    # Listed from the nodes themselves, so it can't fall behind what the pipeline writes
     print("\nOutput files created:")
-    print("- visakanv.json (raw data)")
-    print("- tweets.json (processed tweets)")
-    print("- selfQuotedTweets.json (tweets with self-quotes)")
-    print("- countSelfQuotes.json (quote counts)")
-    print("- tweet_results.json (final results)")
-    print("- not_found_tweets.json (missing tweets)")
-    print("- twitter_threads.json (thread data)")
-    print("- thread_statistics.json (thread metrics)")
+    for name in pipeline.order:
+        outputs = pipeline.nodes[name].outputs
+        if outputs:
+            print(f"{name}:")
+            for path in outputs:
+                print(f"- {path}/" if os.path.isdir(path) else f"- {path}")
 
 if __name__ == "__main__":
     try:
@@ -98,4 +213,4 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"\n❌ Error: {str(e)}")
         print("Processing pipeline failed!")
-        exit(1) 
\ No newline at end of file
+        exit(1)
@@ -0,0 +1,278 @@
+import gzip
+import json
+import os
+import shutil
+from functools import partial
+
+from processTweets import QUOTE_PATTERN, SELF_QUOTE_HANDLE, iter_tweets, load_json_file, load_tweets, quote_pattern
+
+try:
+    import brotli
+except ImportError:  # .br copies are skipped without the optional brotli package
+    brotli = None
+
+PUBLIC_DIR = 'public'
+SHARD_SIZE = 5000
+COMPACT = (',', ':')
+
+def slim_tweet(tweet):
+    return {
+        'id_str': tweet.get('id_str'),
+        'created_at': tweet.get('created_at'),
+        'full_text': tweet.get('full_text', ''),
+        'favorite_count': tweet.get('favorite_count', 0),
+        'retweet_count': tweet.get('retweet_count', 0),
+    }
+
+def slim_self_quote(tweet, pattern=QUOTE_PATTERN):
+    """What QuoteDistributions shows for a quoting tweet, with the quoted id already extracted"""
+    quoted_id = None
+    for url in tweet.get('entities', {}).get('urls', []):
+        match = pattern.search(url.get('expanded_url') or '')
+        if match:
+            quoted_id = match.group(1)
+            break
+    return {
+        'id_str': tweet.get('id_str'),
+        'created_at': tweet.get('created_at'),
+        'full_text': tweet.get('full_text', ''),
+        'favorite_count': tweet.get('favorite_count', 0),
+        'retweet_count': tweet.get('retweet_count', 0),
+        'in_reply_to_screen_name': tweet.get('in_reply_to_screen_name'),
+        'quoted_id': quoted_id,
+    }
+
+def slim_tweet_result(result):
+    return {
+        'tweet_id': result['tweet_id'],
+        'count': result['count'],
+        'tweet_text': result['tweet_text'],
+        'favorite_count': result.get('favorite_count'),
+        'retweet_count': result.get('retweet_count'),
+        'in_reply_to_screen_name': result.get('in_reply_to_screen_name'),
+        'created_at': result.get('created_at'),
+    }
+
+def slim_thread(thread):
+    return {
+        'metadata': thread['metadata'],
+        'tweets': [{
+            'tweet_id': t['tweet_id'],
+            'text': t['text'],
+            'created_at': t['created_at'],
+            'order': t['order'],
+            'favorite_count': t['favorite_count'],
+            'retweet_count': t['retweet_count'],
+        } for t in thread['tweets']]
+    }
+
+# Collections the pages load record by record: source file -> (projection, id field).
+# A None id field means the collection is an object keyed by id.
+COLLECTIONS = {
+    'tweets.json': (slim_tweet, 'id_str'),
+    'selfQuotedTweets.json': (slim_self_quote, 'id_str'),
+    'tweet_results.json': (slim_tweet_result, 'tweet_id'),
+    'twitter_threads.json': (slim_thread, None),
+}
+
+# Counts the pages show without loading a whole collection: source file -> {manifest key: record test}
+MANIFEST_COUNTS = {
+    'tweet_results.json': {'found': lambda result: result['tweet_text'] != 'Tweet not found'},
+}
+
+# Published under one name but read from another file: the tweets collection is built from the NDJSON
+SOURCE_FILES = {'tweets.json': 'tweets.ndjson'}
+
+def source_file(filename):
+    return SOURCE_FILES.get(filename, filename)
+
+def encode(data):
+    return json.dumps(data, ensure_ascii=False, separators=COMPACT).encode('utf-8')
+
+def write_file(path, payload):
+    # Swapped in whole, so the site never serves half a file while a run rewrites it
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(temp_path, path)
+
+def write_published(path, payload):
+    """Write a file with its .gz and .br copies; returns the bytes written for each encoding"""
+    sizes = {'json': len(payload), 'gz': 0, 'br': 0}
+    write_file(path, payload)
+    # mtime=0 keeps the .gz byte-identical across runs with the same content
+    compressed = gzip.compress(payload, compresslevel=9, mtime=0)
+    write_file(path + '.gz', compressed)
+    sizes['gz'] = len(compressed)
+    if brotli is not None:
+        compressed = brotli.compress(payload, quality=11)
+        write_file(path + '.br', compressed)
+        sizes['br'] = len(compressed)
+    elif os.path.exists(path + '.br'):
+        # Don't leave a stale copy from a run that had brotli
+        os.remove(path + '.br')
+    return sizes
+
+def swap_directory(temp_directory, directory):
+    """Replace directory with the one built at temp_directory"""
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temp_directory, directory)
+
+def remove_published(path):
+    for suffix in ('', '.gz', '.br'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def shard(records, id_field):
+    """Order records by numeric id and cut them into SHARD_SIZE pieces.
+
+    records is a list, or an {id: record} dict when id_field is None.
+    Yields (first_id, last_id, shard) for each piece.
+    """
+    if id_field is None:
+        ordered = sorted(records.items(), key=lambda item: int(item[0]))
+        for start in range(0, len(ordered), SHARD_SIZE):
+            piece = ordered[start:start + SHARD_SIZE]
+            yield piece[0][0], piece[-1][0], dict(piece)
+    else:
+        ordered = sorted(records, key=lambda record: int(record[id_field]))
+        for start in range(0, len(ordered), SHARD_SIZE):
+            piece = ordered[start:start + SHARD_SIZE]
+            yield piece[0][id_field], piece[-1][id_field], piece
+
+def publish_collection(filename, records, project, id_field, public_dir=PUBLIC_DIR):
+    """Write public/<name>/manifest.json and its id-range shards"""
+    name = os.path.splitext(filename)[0]
+    target = os.path.join(public_dir, name)
+    # Shards are written next to the published ones and swapped in once the manifest is done
+    directory = f"{target}.tmp"
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+    if id_field is None:
+        records = {key: project(value) for key, value in records.items()}
+    else:
+        records = [project(record) for record in records]
+
+    totals = {'json': 0, 'gz': 0, 'br': 0}
+    shards = []
+    for number, (first_id, last_id, piece) in enumerate(shard(records, id_field)):
+        shard_file = f'shard-{number:04d}.json'
+        sizes = write_published(os.path.join(directory, shard_file), encode(piece))
+        shards.append({
+            'file': shard_file,
+            'count': len(piece),
+            'first_id': first_id,
+            'last_id': last_id,
+            'bytes': sizes['json']
+        })
+        for encoding, size in sizes.items():
+            totals[encoding] += size
+
+    manifest = {
+        'type': 'object' if id_field is None else 'list',
+        'id_field': id_field,
+        'count': len(records),
+        'shard_size': SHARD_SIZE,
+        'shards': shards
+    }
+    for key, test in MANIFEST_COUNTS.get(filename, {}).items():
+        manifest[key] = sum(1 for record in (records.values() if id_field is None else records) if test(record))
+    sizes = write_published(os.path.join(directory, 'manifest.json'), encode(manifest))
+    for encoding, size in sizes.items():
+        totals[encoding] += size
+    swap_directory(directory, target)
+    # The unsharded file from earlier runs would otherwise be served stale
+    remove_published(os.path.join(public_dir, filename))
+    return totals
+
+def publish_directory(directory, public_dir=PUBLIC_DIR):
+    """Copy a directory of index files the pages fetch piece by piece, each with its .gz and .br copies"""
+    target = os.path.join(public_dir, directory)
+    temp_target = f"{target}.tmp"
+    shutil.rmtree(temp_target, ignore_errors=True)
+    totals = {'json': 0, 'gz': 0, 'br': 0}
+    for root, _, files in os.walk(directory):
+        destination = os.path.join(temp_target, os.path.relpath(root, directory))
+        os.makedirs(destination, exist_ok=True)
+        for name in files:
+            with open(os.path.join(root, name), 'rb') as f:
+                sizes = write_published(os.path.join(destination, name), f.read())
+            for encoding, size in sizes.items():
+                totals[encoding] += size
+    swap_directory(temp_target, target)
+    return totals
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(directory) for name in files)
+
+def load_collection(filename):
+    if filename == 'tweets.json':
+        return list(iter_tweets(load_tweets(source_file(filename))))
+    return load_json_file(filename)
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def published_path(filename, public_dir=PUBLIC_DIR):
+    """Where filename ends up: a shard directory for collections, otherwise a single file"""
+    if filename in COLLECTIONS:
+        return os.path.join(public_dir, os.path.splitext(filename)[0])
+    return os.path.join(public_dir, filename)
+
+def publish(files, public_dir=PUBLIC_DIR, data=None, handle=SELF_QUOTE_HANDLE):
+    """Publish each output into public_dir in its compact form.
+
+    data maps filenames to contents already in memory, so they aren't read
+    back from disk; for tweets.json it can hold the projected tweet records.
+    handle is the account whose self-quotes selfQuotedTweets.json holds.
+    The source files are left in place as the pipeline's cached artifacts.
+
+    Returns {filename: {'source': bytes, 'json': bytes, 'gz': bytes, 'br': bytes}}.
+    """
+    data = data or {}
+    os.makedirs(public_dir, exist_ok=True)
+    if brotli is None:
+        print("! brotli is not installed, skipping .br copies", flush=True)
+
+    report = {}
+    for filename in files:
+        if not os.path.exists(source_file(filename)):
+            continue
+        if os.path.isdir(filename):
+            # Directories like the search index are already in their published form on disk
+            source_bytes = directory_size(filename)
+            sizes = publish_directory(filename, public_dir)
+        elif filename in COLLECTIONS:
+            source_bytes = os.path.getsize(source_file(filename))
+            project, id_field = COLLECTIONS[filename]
+            if project is slim_self_quote:
+                project = partial(slim_self_quote, pattern=quote_pattern(handle))
+            records = data[filename] if filename in data else load_collection(filename)
+            sizes = publish_collection(filename, records, project, id_field, public_dir)
+        else:
+            source_bytes = os.path.getsize(filename)
+            if filename in data:
+                content = data[filename]
+            else:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    content = json.load(f)
+            sizes = write_published(os.path.join(public_dir, filename), encode(content))
+
+        report[filename] = dict(sizes, source=source_bytes)
+        compressed = f"gz {format_bytes(sizes['gz'])}"
+        if sizes['br']:
+            compressed += f", br {format_bytes(sizes['br'])}"
+        print(f"✓ Published {filename}: {format_bytes(source_bytes)} -> "
+              f"{format_bytes(sizes['json'])} ({compressed})", flush=True)
+
+    if report:
+        source_total = sum(sizes['source'] for sizes in report.values())
+        wire_total = sum(sizes['br'] or sizes['gz'] for sizes in report.values())
+        print(f"Published {format_bytes(source_total)} of outputs as "
+              f"{format_bytes(wire_total)} compressed", flush=True)
+    return report
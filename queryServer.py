@@ -0,0 +1,85 @@
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from tweetDatabase import DATABASE_FILE, TweetDatabase
+
+PORT = 8000
+MAX_LIMIT = 1000
+
+def window(params):
+    """start/end from the query string; year=2019 is shorthand for that whole year"""
+    if 'year' in params:
+        year = int(params['year'])
+        return f"{year:04d}-01-01", f"{year:04d}-12-31"
+    return params.get('start'), params.get('end')
+
+def limit(params, default=10):
+    return max(1, min(int(params.get('limit', default)), MAX_LIMIT))
+
+# Path -> function of (database, query parameters) returning the JSON response
+ROUTES = {
+    '/totals': lambda db, params: db.window_totals(*window(params)),
+    '/daily': lambda db, params: db.daily(*window(params)),
+    '/top-quoted': lambda db, params: db.top_quoted(*window(params), limit=limit(params)),
+    '/top-tweets': lambda db, params: db.top_tweets(*window(params), by=params.get('by', 'likes'),
+                                                   limit=limit(params)),
+    '/threads': lambda db, params: db.thread_stats(*window(params)),
+    '/tweet': lambda db, params: db.tweet(params['id']),
+}
+
+class QueryHandler(BaseHTTPRequestHandler):
+    database = None
+
+    def send_json(self, status, data, elapsed=None):
+        body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if elapsed is not None:
+            self.send_header('Server-Timing', f"db;dur={elapsed * 1000:.2f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        route = ROUTES.get(url.path)
+        if route is None:
+            self.send_json(404, {'error': f"Unknown query {url.path}", 'queries': sorted(ROUTES)})
+            return
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        started = time.perf_counter()
+        try:
+            result = route(self.database, params)
+        except (KeyError, ValueError) as e:
+            self.send_json(400, {'error': f"Bad query: {str(e)}"})
+            return
+        if result is None:
+            self.send_json(404, {'error': "Not found"})
+            return
+        self.send_json(200, result, time.perf_counter() - started)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer range queries over the tweet database on localhost")
+    parser.add_argument('--database', default=DATABASE_FILE)
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+
+    QueryHandler.database = TweetDatabase(args.database)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), QueryHandler)
+    print(f"✓ Serving {args.database} at http://127.0.0.1:{args.port} ({', '.join(sorted(ROUTES))})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
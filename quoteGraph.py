@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import shutil
+from array import array
+from collections import deque
+
+import numpy as np
+
+from processTweets import Analysis, parse_created_at
+from tweetStore import _map_array
+
+GRAPH_DIR = 'quote_graph'
+GRAPH_VERSION = 1
+
+class QuoteGraphArrays:
+    """The quote edges in compressed sparse row form, both ways round.
+
+    Quoted side: quoted_ids is sorted, and the tweets quoting quoted_ids[i] are
+    quoting[quoted_start[i]:quoted_start[i + 1]], oldest first, with their
+    timestamps in quote_times. Quoting side: quoting_ids is sorted and the
+    tweets quoting_ids[i] quotes are quoted[quoting_start[i]:quoting_start[i + 1]].
+    """
+
+    def __init__(self, sources, targets, times):
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        times = np.asarray(times, dtype=np.int64)
+
+        order = np.lexsort((sources, times, targets))
+        self.quoted_ids, self.quoted_start = _rows(targets[order])
+        self.quoting = sources[order]
+        self.quote_times = times[order]
+
+        # Stable, so a tweet's quoted ids keep the order of its urls
+        order = np.argsort(sources, kind='stable')
+        self.quoting_ids, self.quoting_start = _rows(sources[order])
+        self.quoted = targets[order]
+
+    def __len__(self):
+        return len(self.quoting)
+
+    def __eq__(self, other):
+        return all(np.array_equal(getattr(self, name), getattr(other, name)) for name in COLUMNS)
+
+    def save(self, path=GRAPH_DIR):
+        # Build the new graph next to the old one, so readers never see half of it
+        temp_path = f"{path}.tmp"
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+        for name in COLUMNS:
+            getattr(self, name).tofile(os.path.join(temp_path, f"{name}.bin"))
+        meta = {
+            'version': GRAPH_VERSION,
+            'edge_count': len(self.quoting),
+            'quoted_count': len(self.quoted_ids),
+            'quoting_count': len(self.quoting_ids),
+        }
+        with open(os.path.join(temp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temp_path, path)
+
+# Column name -> which meta.json count sizes it
+COLUMNS = {
+    'quoted_ids': 'quoted_count',
+    'quoted_start': 'quoted_count',
+    'quoting': 'edge_count',
+    'quote_times': 'edge_count',
+    'quoting_ids': 'quoting_count',
+    'quoting_start': 'quoting_count',
+    'quoted': 'edge_count',
+}
+
+def _rows(keys):
+    """Unique sorted keys and the start offset of each one's run, plus a closing offset"""
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.append(starts, len(keys)).astype(np.int64)
+
+class QuoteGraphAnalysis(Analysis):
+    """Keeps every self-quote as a (quoting id, quoted id, time) edge for the quote graph"""
+
+    outputs = (GRAPH_DIR,)
+
+    def __init__(self, self_quotes):
+        self.self_quotes = self_quotes
+        self.sources = array('q')
+        self.targets = array('q')
+        self.times = array('q')
+
+    def add(self, tweet, record):
+        if not self.self_quotes.current_quoted_ids or not record.get('id_str'):
+            return
+        source = int(record['id_str'])
+        timestamp = parse_created_at(record.get('created_at'))
+        for quoted_id in self.self_quotes.current_quoted_ids:
+            self.sources.append(source)
+            self.targets.append(int(quoted_id))
+            self.times.append(timestamp)
+
+    def restore(self, tweet, record):
+        # The edges aren't saved; they come back from the self-quotes found while restoring
+        self.add(tweet, record)
+
+    def finish(self, index, results):
+        graph = QuoteGraphArrays(self.sources, self.targets, self.times)
+        print(f"Indexed {len(graph)} quotes of {len(graph.quoted_ids)} tweets", flush=True)
+        return {GRAPH_DIR: graph}
+
+class QuoteGraph:
+    """Read-only, memory-mapped view of the quote graph written by processTweets.
+
+    Every lookup is a binary search over the sorted ids plus a slice, so it
+    costs O(log n + degree) and never touches tweets.json.
+    """
+
+    def __init__(self, path=GRAPH_DIR):
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != GRAPH_VERSION:
+            raise Exception(f"Quote graph in {path} was written by an older version, rebuild it")
+        self.edge_count = meta['edge_count']
+        for name, count in COLUMNS.items():
+            length = meta[count] + (1 if name.endswith('_start') else 0)
+            setattr(self, name, _map_array(os.path.join(path, f"{name}.bin"), np.int64, length))
+
+    def _span(self, ids, starts, tweet_id):
+        row = np.searchsorted(ids, int(tweet_id))
+        if row == len(ids) or ids[row] != int(tweet_id):
+            return 0, 0
+        return int(starts[row]), int(starts[row + 1])
+
+    def quoted_by(self, tweet_id):
+        """[(quoting id, epoch seconds), ...] for every tweet quoting tweet_id, oldest first"""
+        start, end = self._span(self.quoted_ids, self.quoted_start, tweet_id)
+        return [(str(source), int(timestamp))
+                for source, timestamp in zip(self.quoting[start:end].tolist(), self.quote_times[start:end].tolist())]
+
+    def quotes(self, tweet_id):
+        """Ids of the tweets that tweet_id quotes"""
+        start, end = self._span(self.quoting_ids, self.quoting_start, tweet_id)
+        return [str(target) for target in self.quoted[start:end].tolist()]
+
+    def in_degree(self, tweet_id):
+        start, end = self._span(self.quoted_ids, self.quoted_start, tweet_id)
+        return end - start
+
+    def out_degree(self, tweet_id):
+        start, end = self._span(self.quoting_ids, self.quoting_start, tweet_id)
+        return end - start
+
+    def quote_chain(self, tweet_id):
+        """Follow the first quote of each tweet back to a tweet that quotes nothing"""
+        chain = [str(tweet_id)]
+        while True:
+            quoted = self.quotes(chain[-1])
+            if not quoted or quoted[0] in chain:
+                return chain
+            chain.append(quoted[0])
+
+    def quote_cascade(self, tweet_id, max_depth=None):
+        """{quoting id: depth} for every tweet that quotes tweet_id directly or through other quotes"""
+        depths = {str(tweet_id): 0}
+        queue = deque([str(tweet_id)])
+        while queue:
+            current = queue.popleft()
+            if max_depth is not None and depths[current] >= max_depth:
+                continue
+            for source, _ in self.quoted_by(current):
+                if source not in depths:
+                    depths[source] = depths[current] + 1
+                    queue.append(source)
+        del depths[str(tweet_id)]
+        return depths
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the quote graph written by processTweets")
+    parser.add_argument('tweet_id')
+    parser.add_argument('--path', default=GRAPH_DIR)
+    args = parser.parse_args()
+
+    graph = QuoteGraph(args.path)
+    print(json.dumps({
+        'tweet_id': args.tweet_id,
+        'in_degree': graph.in_degree(args.tweet_id),
+        'out_degree': graph.out_degree(args.tweet_id),
+        'quoted_by': graph.quoted_by(args.tweet_id),
+        'quotes': graph.quotes(args.tweet_id),
+        'quote_chain': graph.quote_chain(args.tweet_id),
+        'quote_cascade': graph.quote_cascade(args.tweet_id),
+    }, indent=2), flush=True)
+
+if __name__ == "__main__":
+    main()
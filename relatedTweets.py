@@ -0,0 +1,355 @@
+import argparse
+import json
+import os
+import shutil
+import time
+import zlib
+from array import array
+
+import numpy as np
+
+from processTweets import Analysis, default_tweets_file, load_records, write_json_file
+from searchIndex import tokenize
+from tweetStore import _map_array
+
+RELATED_FILE = 'related_tweets.json'
+SIGNATURES_DIR = 'related_signatures'
+SIGNATURES_VERSION = 1
+SHINGLE_SIZE = 2
+# Tweets with fewer shingles than this are too short to call anything a rephrasing of them
+MIN_SHINGLES = 4
+NUM_PERM = 128
+BANDS = 32
+RELATED_THRESHOLD = 0.5
+DUPLICATE_THRESHOLD = 0.8
+RELATED_LIMIT = 10
+# Only tweets this close together in a crowded bucket are compared; the rest are linked through them
+MAX_BUCKET = 20
+BATCH_SHINGLES = 1 << 15
+SEED = 42
+
+def shingles(text, size=SHINGLE_SIZE):
+    """CRC32s of the distinct word n-grams of a tweet"""
+    tokens = tokenize(text)
+    return {zlib.crc32(' '.join(tokens[i:i + size]).encode('utf-8')) for i in range(len(tokens) - size + 1)}
+
+def is_retweet(record):
+    return record.get('retweeted') or (record.get('full_text') or '').startswith('RT @')
+
+def shingle_arrays(texts, size=SHINGLE_SIZE, min_shingles=MIN_SHINGLES):
+    """(positions of the texts kept, their shingles flattened, each one's start offset plus a closing offset)"""
+    kept, hashes, starts = [], array('Q'), array('q', [0])
+    for position, text in enumerate(texts):
+        found = shingles(text, size)
+        if len(found) >= min_shingles:
+            kept.append(position)
+            hashes.extend(found)
+            starts.append(len(hashes))
+    return np.asarray(kept, dtype=np.int64), np.asarray(hashes, dtype=np.uint64), np.asarray(starts, dtype=np.int64)
+
+def minhash_signatures(hashes, starts, num_perm=NUM_PERM, seed=SEED):
+    """One row of num_perm minimum hashes per document, computed a batch of documents at a time"""
+    rng = np.random.default_rng(seed)
+    # Multiply-shift hashing: the top 32 bits of a * x + b, wrapping at 64 bits, with a odd.
+    # It needs no modulo, which is most of the cost of the textbook (a * x + b) mod p.
+    a = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+    signatures = np.empty((len(starts) - 1, num_perm), dtype=np.uint32)
+    first = 0
+    while first < len(starts) - 1:
+        # As many documents as fit in one batch of shingles, and always at least one
+        last = max(first + 1, int(np.searchsorted(starts, starts[first] + BATCH_SHINGLES, side='right')) - 1)
+        last = min(last, len(starts) - 1)
+        batch = hashes[starts[first]:starts[last]]
+        permuted = ((batch[:, None] * a + b) >> np.uint64(32)).astype(np.uint32)
+        signatures[first:last] = np.minimum.reduceat(permuted, starts[first:last] - starts[first], axis=0)
+        first = last
+    return signatures
+
+def sign(texts, num_perm=NUM_PERM):
+    """(positions of the texts with enough shingles, one MinHash signature row for each of them)"""
+    kept, hashes, starts = shingle_arrays(texts)
+    return kept, minhash_signatures(hashes, starts, num_perm)
+
+def text_digests(texts):
+    return np.fromiter((zlib.crc32((text or '').encode('utf-8')) for text in texts), dtype=np.uint32, count=len(texts))
+
+class Signatures:
+    """The MinHash signature of every tweet considered, by id, with a CRC32 of the text it was hashed from.
+
+    ids is sorted. rows[i] is the row of signatures holding ids[i]'s
+    signature, or -1 when its text has too few shingles to sign.
+    """
+
+    def __init__(self, ids, digests, rows, signatures):
+        self.ids = ids
+        self.digests = digests
+        self.rows = rows
+        self.signatures = signatures
+
+    @classmethod
+    def empty(cls, num_perm=NUM_PERM):
+        return cls(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint32),
+                   np.zeros(0, dtype=np.int64), np.zeros((0, num_perm), dtype=np.uint32))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __eq__(self, other):
+        return all(np.array_equal(getattr(self, name), getattr(other, name))
+                   for name in ('ids', 'digests', 'rows', 'signatures'))
+
+    def update(self, tweet_ids, texts):
+        """(kept, signatures) as sign(texts) returns them, hashing only the texts that aren't saved.
+
+        Also returns the Signatures to save for these tweets, and how many were hashed.
+        """
+        ids = np.fromiter((int(tweet_id) for tweet_id in tweet_ids), dtype=np.int64, count=len(tweet_ids))
+        digests = text_digests(texts)
+        positions = np.minimum(np.searchsorted(self.ids, ids), max(len(self.ids) - 1, 0))
+        saved = np.zeros(len(ids), dtype=bool)
+        if len(self.ids):
+            saved = (self.ids[positions] == ids) & (self.digests[positions] == digests)
+        # Row of each tweet's signature in self.signatures, or in the freshly hashed rows once offset
+        rows = np.where(saved, self.rows[positions] if len(self.ids) else -1, -1)
+
+        fresh = np.flatnonzero(~saved)
+        fresh_kept, fresh_signatures = sign([texts[i] for i in fresh.tolist()], self.signatures.shape[1])
+        rows[fresh[fresh_kept]] = len(self.signatures) + np.arange(len(fresh_kept))
+        pool = np.concatenate([self.signatures, fresh_signatures])
+
+        kept = np.flatnonzero(rows >= 0)
+        signatures = pool[rows[kept]]
+        order = np.argsort(ids, kind='stable')
+        # Rows of the saved copy follow kept, which is in the order of tweet_ids
+        saved_rows = np.full(len(ids), -1, dtype=np.int64)
+        saved_rows[kept] = np.arange(len(kept))
+        updated = Signatures(ids[order], digests[order], saved_rows[order], signatures)
+        return kept, signatures, updated, len(fresh)
+
+    def save(self, path=SIGNATURES_DIR):
+        # Written next to the old signatures and swapped in, like the quote graph
+        temp_path = f"{path}.tmp"
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+        for name in ('ids', 'digests', 'rows', 'signatures'):
+            getattr(self, name).tofile(os.path.join(temp_path, f"{name}.bin"))
+        meta = {
+            'version': SIGNATURES_VERSION,
+            'count': len(self.ids),
+            'signed': len(self.signatures),
+            'num_perm': self.signatures.shape[1],
+            'shingle_size': SHINGLE_SIZE,
+            'min_shingles': MIN_SHINGLES,
+            'seed': SEED,
+        }
+        with open(os.path.join(temp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=SIGNATURES_DIR, num_perm=NUM_PERM):
+        """The saved signatures, or none if they are missing or were hashed with other parameters"""
+        meta_file = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_file):
+            return cls.empty(num_perm)
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if (meta.get('version'), meta.get('num_perm'), meta.get('shingle_size'), meta.get('min_shingles'),
+                meta.get('seed')) != (SIGNATURES_VERSION, num_perm, SHINGLE_SIZE, MIN_SHINGLES, SEED):
+            print(f"Ignoring {path}: hashed with other parameters", flush=True)
+            return cls.empty(num_perm)
+        column = lambda name, dtype, length: np.array(_map_array(os.path.join(path, f"{name}.bin"), dtype, length))
+        signatures = column('signatures', np.uint32, meta['signed'] * num_perm).reshape(meta['signed'], num_perm)
+        return cls(column('ids', np.int64, meta['count']), column('digests', np.uint32, meta['count']),
+                   column('rows', np.int64, meta['count']), signatures)
+
+def candidate_pairs(signatures, bands=BANDS, max_bucket=MAX_BUCKET, seed=SEED):
+    """Unique (i, j) row pairs, i < j, that share every value in at least one band of their signatures"""
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    multipliers = np.random.default_rng(seed + 1).integers(1, 1 << 63, rows, dtype=np.uint64) | np.uint64(1)
+    codes = []
+    for band in range(bands):
+        # Wrapping multiply-add folds the band into one key; colliding keys are caught when pairs are scored
+        band_values = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = (band_values * multipliers).sum(axis=1, dtype=np.uint64)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        # Pair each document with the ones up to max_bucket places after it in its bucket
+        for distance in range(1, max_bucket):
+            same = keys[distance:] == keys[:-distance]
+            if not same.any():
+                break
+            left, right = order[:-distance][same], order[distance:][same]
+            codes.append(np.minimum(left, right) * count + np.maximum(left, right))
+    if not codes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    codes = np.unique(np.concatenate(codes))
+    return codes // count, codes % count
+
+def estimated_similarity(signatures, left, right, batch=1 << 16):
+    """Share of signature positions two rows agree on, which estimates their Jaccard similarity"""
+    similarity = np.empty(len(left), dtype=np.float64)
+    for start in range(0, len(left), batch):
+        end = start + batch
+        similarity[start:end] = (signatures[left[start:end]] == signatures[right[start:end]]).mean(axis=1)
+    return similarity
+
+def find_related(texts, threshold=RELATED_THRESHOLD, num_perm=NUM_PERM, bands=BANDS, signed=None):
+    """(left, right, similarity) arrays of the positions of text pairs estimated at least threshold similar.
+
+    signed is the (kept, signatures) of sign(texts), when they are already known.
+    """
+    kept, signatures = signed if signed is not None else sign(texts, num_perm)
+    left, right = candidate_pairs(signatures, bands)
+    similarity = estimated_similarity(signatures, left, right)
+    close = similarity >= threshold
+    return kept[left[close]], kept[right[close]], similarity[close]
+
+def clusters(pairs):
+    """Connected groups of ids, from (id, id) pairs"""
+    parent = {}
+
+    def root(item):
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    for left, right in pairs:
+        left, right = root(left), root(right)
+        if left != right:
+            parent[max(left, right, key=int)] = min(left, right, key=int)
+    groups = {}
+    for item in parent:
+        groups.setdefault(root(item), []).append(item)
+    return sorted((sorted(group, key=int) for group in groups.values()), key=lambda group: (-len(group), int(group[0])))
+
+def related_tweets(tweet_ids, texts, threshold=RELATED_THRESHOLD, duplicate_threshold=DUPLICATE_THRESHOLD,
+                   limit=RELATED_LIMIT, signed=None):
+    """The related_tweets.json shape: each tweet's closest tweets, and the clusters of near-duplicates"""
+    left, right, similarity = find_related(texts, threshold, signed=signed)
+    order = np.argsort(-similarity, kind='stable')
+    related = {}
+    duplicates = []
+    for i, j, score in zip(left[order].tolist(), right[order].tolist(), similarity[order].tolist()):
+        for tweet, other in ((tweet_ids[i], tweet_ids[j]), (tweet_ids[j], tweet_ids[i])):
+            entries = related.setdefault(tweet, [])
+            if len(entries) < limit:
+                entries.append({'tweet_id': other, 'similarity': round(score, 3)})
+        if score >= duplicate_threshold:
+            duplicates.append((tweet_ids[i], tweet_ids[j]))
+    return {
+        'num_perm': NUM_PERM,
+        'bands': BANDS,
+        'related_threshold': threshold,
+        'duplicate_threshold': duplicate_threshold,
+        'tweets': {tweet_id: related[tweet_id] for tweet_id in sorted(related, key=int)},
+        'duplicate_clusters': clusters(duplicates),
+    }
+
+def related_tweets_cached(tweet_ids, texts, path=SIGNATURES_DIR):
+    """related_tweets() with the signatures saved at path reused; returns it and the Signatures to save"""
+    kept, signatures, updated, hashed = Signatures.load(path).update(tweet_ids, texts)
+    print(f"Hashed {hashed} new or changed tweets, reused {len(tweet_ids) - hashed} signatures", flush=True)
+    return related_tweets(tweet_ids, texts, signed=(kept, signatures)), updated
+
+class RelatedTweetsAnalysis(Analysis):
+    """Finds near-duplicate and related tweets by their text with MinHash and LSH banding.
+
+    The pairs are rebuilt from the index's records on every run, like the
+    search index, but only new or edited tweets are hashed: the signatures
+    are saved in SIGNATURES_DIR with a checksum of the text they came from.
+    """
+
+    outputs = (RELATED_FILE, SIGNATURES_DIR)
+
+    def finish(self, index, results):
+        print("Finding related tweets", flush=True)
+        tweet_ids = [tweet_id for tweet_id in sorted(index.tweets_by_id, key=int)
+                     if not is_retweet(index.tweets_by_id[tweet_id])]
+        related, signatures = related_tweets_cached(
+            tweet_ids, [index.tweets_by_id[tweet_id].get('full_text') for tweet_id in tweet_ids])
+        print(f"Found related tweets for {len(related['tweets'])} tweets, "
+              f"{len(related['duplicate_clusters'])} near-duplicate clusters", flush=True)
+        return {RELATED_FILE: related, SIGNATURES_DIR: signatures}
+
+def jaccard_pairs(texts, threshold=RELATED_THRESHOLD):
+    """Every pair of texts at least threshold similar, by comparing each pair's shingle sets"""
+    sets = [shingles(text) for text in texts]
+    pairs = set()
+    for i in range(len(sets)):
+        if len(sets[i]) < MIN_SHINGLES:
+            continue
+        for j in range(i + 1, len(sets)):
+            if len(sets[j]) >= MIN_SHINGLES and len(sets[i] & sets[j]) >= threshold * len(sets[i] | sets[j]):
+                pairs.add((i, j))
+    return pairs
+
+def benchmark(filename, pairwise_limit=2000):
+    """Time MinHash LSH on growing samples up to the whole archive against pairwise comparison.
+
+    Pairwise comparison only runs up to pairwise_limit tweets; its time on
+    the full archive is extrapolated from the largest sample, as it grows with
+    the square of the number of tweets. LSH recall is measured there too.
+    Samples are the archive's first tweets, so rephrasings stay near what they rephrase.
+    """
+    texts = [record.get('full_text') for record in load_records(filename) if not is_retweet(record)]
+    sizes = sorted({min(size, len(texts)) for size in (1000, pairwise_limit, 10000, 100000)} | {len(texts)})
+    rows = []
+    print(f"{'tweets':>8} {'lsh s':>8} {'pairs':>8} {'pairwise s':>11} {'recall':>7}", flush=True)
+    for size in sizes:
+        sample = texts[:size]
+        started = time.perf_counter()
+        left, right, _ = find_related(sample)
+        lsh_seconds = time.perf_counter() - started
+        row = {'tweets': size, 'lsh_seconds': round(lsh_seconds, 3), 'related_pairs': len(left)}
+        if size <= pairwise_limit:
+            started = time.perf_counter()
+            exact = jaccard_pairs(sample)
+            row['pairwise_seconds'] = round(time.perf_counter() - started, 3)
+            found = set(zip(left.tolist(), right.tolist()))
+            row['recall'] = round(len(exact & found) / len(exact), 3) if exact else 1.0
+        rows.append(row)
+    measured = [row for row in rows if 'pairwise_seconds' in row]
+    if measured:
+        base = measured[-1]
+        for row in rows:
+            if 'pairwise_seconds' not in row:
+                row['pairwise_seconds_estimated'] = round(base['pairwise_seconds'] * (row['tweets'] / base['tweets']) ** 2)
+    for row in rows:
+        pairwise = row.get('pairwise_seconds', row.get('pairwise_seconds_estimated', '-'))
+        mark = '' if 'pairwise_seconds' in row else '~'
+        print(f"{row['tweets']:>8} {row['lsh_seconds']:>8} {row['related_pairs']:>8} "
+              f"{mark + str(pairwise):>11} {row.get('recall', '-'):>7}", flush=True)
+    return {'tweets_file': filename, 'num_perm': NUM_PERM, 'bands': BANDS,
+            'threshold': RELATED_THRESHOLD, 'runs': rows}
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate and related tweets with MinHash LSH")
+    parser.add_argument('--benchmark', metavar='OUTPUT',
+                        help="time LSH against pairwise comparison on growing samples and save the results here")
+    parser.add_argument('--pairwise-limit', type=int, default=2000,
+                        help="largest sample to compare pairwise in the benchmark")
+    args = parser.parse_args()
+
+    filename = default_tweets_file()
+    if args.benchmark:
+        write_json_file(args.benchmark, benchmark(filename, args.pairwise_limit))
+        print(f"✓ Saved {args.benchmark}", flush=True)
+        return
+
+    records = [record for record in load_records(filename) if not is_retweet(record)]
+    records.sort(key=lambda record: int(record['id_str']))
+    related, signatures = related_tweets_cached([record['id_str'] for record in records],
+                                                [record.get('full_text') for record in records])
+    write_json_file(RELATED_FILE, related)
+    signatures.save()
+    print(f"✓ Saved {RELATED_FILE}: {len(related['tweets'])} tweets with related tweets, "
+          f"{len(related['duplicate_clusters'])} near-duplicate clusters", flush=True)
+
+if __name__ == "__main__":
+    main()
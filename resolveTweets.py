@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from download import make_session
+from getTweetCount import SUPABASE_KEY, SUPABASE_URL
+from processTweets import CREATED_AT_FORMAT, load_json_file, write_json_file
+
+RESOLVED_FILE = 'resolved_tweets.json'
+CACHE_FILE = 'resolver_cache.db'
+BATCH_SIZE = 100
+CONCURRENCY = 4
+REQUESTS_PER_SECOND = 5
+FOUND_TTL = 30 * 86400
+# Tweets missing upstream may be uploaded later, so misses are asked about again sooner
+MISSING_TTL = 7 * 86400
+SELECT_FIELDS = 'tweet_id,full_text,created_at,favorite_count,retweet_count,reply_to_username'
+
+class ResolverCache:
+    """Lookups that have already been answered, hits and misses, each kept for its own TTL"""
+
+    def __init__(self, filename=CACHE_FILE, found_ttl=FOUND_TTL, missing_ttl=MISSING_TTL):
+        self.db = sqlite3.connect(filename)
+        self.db.execute("CREATE TABLE IF NOT EXISTS lookups "
+                        "(tweet_id TEXT PRIMARY KEY, tweet TEXT, fetched_at REAL)")
+        self.found_ttl = found_ttl
+        self.missing_ttl = missing_ttl
+
+    def fresh(self, tweet_ids, now=None):
+        """{tweet id: tweet, or None for a cached miss} for the ids with an unexpired answer"""
+        now = now or time.time()
+        answers = {}
+        ids = list(tweet_ids)
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT tweet_id, tweet, fetched_at FROM lookups WHERE tweet_id IN ({','.join('?' * len(part))})",
+                part)
+            for tweet_id, tweet, fetched_at in rows:
+                ttl = self.found_ttl if tweet is not None else self.missing_ttl
+                if now - fetched_at < ttl:
+                    answers[tweet_id] = json.loads(tweet) if tweet is not None else None
+        return answers
+
+    def store(self, answers, now=None):
+        now = now or time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO lookups VALUES (?, ?, ?)",
+            [(tweet_id, json.dumps(tweet) if tweet is not None else None, now) for tweet_id, tweet in answers.items()])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+class RateLimiter:
+    """Spaces out request starts so there are at most rate of them per second"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_start = 0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_start - now
+            self.next_start = max(now, self.next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def archive_record(row):
+    """A REST row in the shape tweet_results.json uses for a found tweet"""
+    created_at = row.get('created_at')
+    if created_at:
+        created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00')).strftime(CREATED_AT_FORMAT)
+    return {
+        'tweet_id': str(row['tweet_id']),
+        'tweet_text': row.get('full_text', ''),
+        'created_at': created_at,
+        'favorite_count': row.get('favorite_count'),
+        'retweet_count': row.get('retweet_count'),
+        'in_reply_to_screen_name': row.get('reply_to_username'),
+    }
+
+class TweetResolver:
+    """Looks tweet ids up on the archive's REST endpoint in batched id=in.(...) requests.
+
+    Batches run concurrently on a pooled session, at most concurrency at once
+    and at most rate started per second. The blocking requests run on a
+    thread pool of the same size, so asyncio only schedules them.
+    """
+
+    def __init__(self, base_url=SUPABASE_URL, key=SUPABASE_KEY, batch_size=BATCH_SIZE,
+                 concurrency=CONCURRENCY, rate=REQUESTS_PER_SECOND):
+        self.endpoint = f"{base_url.rstrip('/')}/rest/v1/tweets"
+        self.headers = {'apikey': key, 'Authorization': f"Bearer {key}"}
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.rate = rate
+        self.session = make_session(concurrency)
+        self.requests = 0
+
+    def fetch_batch(self, tweet_ids):
+        response = self.session.get(self.endpoint, headers=self.headers, timeout=30, params={
+            'tweet_id': f"in.({','.join(tweet_ids)})",
+            'select': SELECT_FIELDS,
+        })
+        response.raise_for_status()
+        self.requests += 1
+        found = {str(row['tweet_id']): archive_record(row) for row in response.json()}
+        return {tweet_id: found.get(tweet_id) for tweet_id in tweet_ids}
+
+    async def resolve(self, tweet_ids):
+        """({tweet id: record or None}, [ids of batches that failed])"""
+        tweet_ids = list(tweet_ids)
+        batches = [tweet_ids[start:start + self.batch_size] for start in range(0, len(tweet_ids), self.batch_size)]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = RateLimiter(self.rate)
+        loop = asyncio.get_running_loop()
+        answers = {}
+        failed = []
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            async def run(batch):
+                async with semaphore:
+                    await limiter.wait()
+                    try:
+                        answers.update(await loop.run_in_executor(executor, self.fetch_batch, batch))
+                    except Exception as e:
+                        # Left out of the cache, so the next run asks again
+                        print(f"❌ Batch of {len(batch)} ids failed: {str(e)[:200]}", flush=True)
+                        failed.extend(batch)
+
+            await asyncio.gather(*(run(batch) for batch in batches))
+        return answers, failed
+
+def resolve_tweets(tweet_ids, resolver=None, cache=None):
+    """{tweet id: record} for the ids the archive has, asking only about ids without a fresh cached answer"""
+    resolver = resolver or TweetResolver()
+    cache = cache or ResolverCache()
+    tweet_ids = list(dict.fromkeys(tweet_ids))
+    try:
+        answers = cache.fresh(tweet_ids)
+        missing = [tweet_id for tweet_id in tweet_ids if tweet_id not in answers]
+        print(f"Resolving {len(tweet_ids)} tweets: {len(answers)} cached, {len(missing)} to look up", flush=True)
+        if missing:
+            fetched, failed = asyncio.run(resolver.resolve(missing))
+            cache.store(fetched)
+            answers.update(fetched)
+            print(f"✓ Looked up {len(fetched)} tweets in {resolver.requests} requests"
+                  + (f", {len(failed)} failed" if failed else ""), flush=True)
+    finally:
+        cache.close()
+    resolved = {tweet_id: answers[tweet_id] for tweet_id in tweet_ids if answers.get(tweet_id)}
+    print(f"✓ Resolved {len(resolved)} of {len(tweet_ids)} tweets", flush=True)
+    return resolved
+
+def apply_resolved(tweet_results, not_found_tweets, resolved):
+    """tweet_results with resolved tweets filled in, and what is still not found"""
+    results = [dict(result, **resolved[result['tweet_id']]) if result['tweet_id'] in resolved else result
+               for result in tweet_results]
+    return results, [tweet for tweet in not_found_tweets if tweet['tweet_id'] not in resolved]
+
+def load_resolved(filename=RESOLVED_FILE):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up quoted tweets missing from the archive")
+    parser.add_argument('--base-url', default=SUPABASE_URL,
+                        help="REST server to ask (point it at a local stand-in to test)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="ids per request")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="requests in flight at once")
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND, help="requests started per second")
+    args = parser.parse_args()
+
+    not_found_tweets = load_json_file('not_found_tweets.json')
+    resolver = TweetResolver(args.base_url, batch_size=args.batch_size, concurrency=args.concurrency,
+                             rate=args.rate)
+    resolved = resolve_tweets([tweet['tweet_id'] for tweet in not_found_tweets], resolver)
+    write_json_file(RESOLVED_FILE, resolved)
+    print(f"✓ Saved {RESOLVED_FILE}", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import argparse
+import html
+import json
+import math
+import os
+import re
+import shutil
+import time
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from processTweets import Analysis
+from tweetStore import _map_array
+
+INDEX_DIR = 'search_index'
+INDEX_VERSION = 1
+# Documents per docs/ block, so a page showing results fetches only the ids it needs
+BLOCK_SIZE = 4096
+MAX_TOKEN_LENGTH = 40
+MAX_LENGTH = 0xFFFF
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+URL_PATTERN = re.compile(r'https?://\S+')
+TOKEN_PATTERN = re.compile(r'\w+')
+SHARD_KEY_PATTERN = re.compile(r'[a-z0-9]{1,2}')
+
+def tokenize(text):
+    """Lowercased word tokens of a tweet, with links dropped and apostrophes joined up"""
+    text = URL_PATTERN.sub(' ', html.unescape(text or '').lower())
+    text = text.replace("'", '').replace('’', '')
+    return [token for token in TOKEN_PATTERN.findall(text) if len(token) <= MAX_TOKEN_LENGTH]
+
+def shard_key(term):
+    """The shard a term's postings live in: its first two characters, or its first code point's hex"""
+    prefix = term[:2]
+    return prefix if SHARD_KEY_PATTERN.fullmatch(prefix) else f"u{ord(term[0]):x}"
+
+def encode_varints(values):
+    """LEB128 bytes of non-negative integers, and how many bytes each one took"""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += values >= (np.uint64(1) << np.uint64(shift))
+    out = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    starts = np.cumsum(sizes) - sizes
+    for position in range(int(sizes.max()) if len(sizes) else 0):
+        mask = sizes > position
+        chunk = (values[mask] >> np.uint64(7 * position)) & np.uint64(0x7F)
+        more = (sizes[mask] > position + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + position] = (chunk | more).astype(np.uint8)
+    return out, sizes
+
+def decode_varints(data):
+    """Integers from LEB128 bytes, decoded in one pass of array operations"""
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    position = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7F).astype(np.int64) << (7 * position)
+    return np.add.reduceat(parts, starts)
+
+class SearchIndexArrays:
+    """An inverted index over tweets and thread texts, ready to be saved as prefix shards.
+
+    Documents are numbered tweets first, in id order, then threads in the
+    order of their first tweet's id. A term's posting list is a run of
+    (document gap, term frequency) varint pairs; the first gap is from 0.
+    """
+
+    def __init__(self, vocabulary, tweet_ids, thread_ids, terms, documents, frequencies, lengths):
+        self.vocabulary = vocabulary
+        self.tweet_ids = tweet_ids
+        self.thread_ids = thread_ids
+        self.lengths = np.minimum(np.asarray(lengths, dtype=np.int64), MAX_LENGTH).astype(np.uint16)
+
+        term_ids = np.asarray(terms, dtype=np.int64)
+        documents = np.asarray(documents, dtype=np.int64)
+        frequencies = np.asarray(frequencies, dtype=np.int64)
+        order = np.lexsort((documents, term_ids))
+        term_ids, documents, frequencies = term_ids[order], documents[order], frequencies[order]
+        self.terms, first = np.unique(term_ids, return_index=True)
+        counts = np.diff(np.append(first, len(term_ids)))
+
+        gaps = np.diff(documents, prepend=0)
+        gaps[first] = documents[first]
+        values = np.empty(2 * len(gaps), dtype=np.int64)
+        values[0::2] = gaps
+        values[1::2] = frequencies
+        self.postings, sizes = encode_varints(values)
+        # Byte offset of each term's run in postings, plus a closing offset
+        ends = np.cumsum(sizes)[2 * (first + counts) - 1] if len(first) else np.zeros(0, dtype=np.int64)
+        self.offsets = np.concatenate(([0], ends)).astype(np.int64)
+        self.document_frequencies = counts
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __eq__(self, other):
+        return (self.tweet_ids == other.tweet_ids and self.thread_ids == other.thread_ids
+                and [self.vocabulary[t] for t in self.terms] == [other.vocabulary[t] for t in other.terms]
+                and all(np.array_equal(getattr(self, name), getattr(other, name))
+                        for name in ('lengths', 'postings', 'offsets')))
+
+    def save(self, path=INDEX_DIR):
+        """Write meta.json, lengths.bin, docs/ blocks and one terms/ and postings/ pair per prefix shard"""
+        temp_path = f"{path}.tmp"
+        shutil.rmtree(temp_path, ignore_errors=True)
+        for directory in ('docs', 'terms', 'postings'):
+            os.makedirs(os.path.join(temp_path, directory))
+
+        shards = {}
+        for position, term_id in enumerate(self.terms.tolist()):
+            term = self.vocabulary[term_id]
+            shards.setdefault(shard_key(term), []).append((term, position))
+        shard_meta = {}
+        for key in sorted(shards):
+            dictionary = {}
+            pieces = []
+            size = 0
+            for term, position in sorted(shards[key]):
+                start, end = self.offsets[position], self.offsets[position + 1]
+                dictionary[term] = [int(self.document_frequencies[position]), size, int(end - start)]
+                pieces.append(self.postings[start:end])
+                size += int(end - start)
+            np.concatenate(pieces).tofile(os.path.join(temp_path, 'postings', f"{key}.bin"))
+            with open(os.path.join(temp_path, 'terms', f"{key}.json"), 'w', encoding='utf-8') as f:
+                json.dump(dictionary, f, ensure_ascii=False, separators=(',', ':'))
+            shard_meta[key] = {'terms': len(dictionary), 'bytes': size}
+
+        ids = self.tweet_ids + self.thread_ids
+        for block, start in enumerate(range(0, len(ids), BLOCK_SIZE)):
+            with open(os.path.join(temp_path, 'docs', f"{block:04d}.json"), 'w', encoding='utf-8') as f:
+                json.dump(ids[start:start + BLOCK_SIZE], f, separators=(',', ':'))
+        self.lengths.astype('<u2').tofile(os.path.join(temp_path, 'lengths.bin'))
+
+        total_length = int(self.lengths.astype(np.int64).sum())
+        meta = {
+            'version': INDEX_VERSION,
+            'doc_count': len(ids),
+            'tweet_count': len(self.tweet_ids),
+            'thread_count': len(self.thread_ids),
+            'term_count': len(self.terms),
+            'total_length': total_length,
+            'average_length': total_length / len(ids) if ids else 0,
+            'block_size': BLOCK_SIZE,
+            'k1': BM25_K1,
+            'b': BM25_B,
+            'shards': shard_meta,
+        }
+        with open(os.path.join(temp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temp_path, path)
+
+class SearchIndexAnalysis(Analysis):
+    """Builds the full-text index from the index's records and the threads found earlier in the run.
+
+    Like the leaderboards it works from what the other analyses already
+    hold, so it keeps no state of its own and incremental runs rebuild it.
+    """
+
+    outputs = (INDEX_DIR,)
+
+    def finish(self, index, results):
+        print("Building the search index", flush=True)
+        tweets_by_id = index.tweets_by_id
+        tweet_ids = sorted(tweets_by_id, key=int)
+        threads = results.get('twitter_threads.json', {})
+        thread_ids = sorted(threads, key=int)
+
+        vocabulary = {}
+        terms, documents, frequencies = array('q'), array('q'), array('q')
+        lengths = array('q')
+
+        def add_document(number, text):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for token, count in Counter(tokens).items():
+                term = vocabulary.get(token)
+                if term is None:
+                    term = vocabulary[token] = len(vocabulary)
+                terms.append(term)
+                documents.append(number)
+                frequencies.append(count)
+
+        for number, tweet_id in enumerate(tweet_ids):
+            add_document(number, tweets_by_id[tweet_id].get('full_text'))
+        for number, start_id in enumerate(thread_ids, len(tweet_ids)):
+            add_document(number, ' '.join(t['text'] or '' for t in threads[start_id]['tweets']))
+
+        arrays = SearchIndexArrays(list(vocabulary), tweet_ids, thread_ids, terms, documents, frequencies, lengths)
+        print(f"Indexed {len(vocabulary)} terms over {len(tweet_ids)} tweets and {len(thread_ids)} threads",
+              flush=True)
+        return {INDEX_DIR: arrays}
+
+class SearchIndex:
+    """Read-only view of a saved search index that loads only the shards a query touches.
+
+    Results are ranked with BM25 over the stored term frequencies, document
+    lengths and document frequencies.
+    """
+
+    def __init__(self, path=INDEX_DIR):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != INDEX_VERSION:
+            raise Exception(f"Search index in {path} was written by an older version, rebuild it")
+        self.doc_count = self.meta['doc_count']
+        self.tweet_count = self.meta['tweet_count']
+        self.lengths = _map_array(os.path.join(path, 'lengths.bin'), np.dtype('<u2'), self.doc_count)
+        self.dictionaries = {}
+        self.postings = {}
+        self.blocks = {}
+
+    def _shard(self, key):
+        if key not in self.dictionaries:
+            if key not in self.meta['shards']:
+                return None, None
+            with open(os.path.join(self.path, 'terms', f"{key}.json"), 'r', encoding='utf-8') as f:
+                self.dictionaries[key] = json.load(f)
+            self.postings[key] = _map_array(os.path.join(self.path, 'postings', f"{key}.bin"), np.uint8,
+                                            self.meta['shards'][key]['bytes'])
+        return self.dictionaries[key], self.postings[key]
+
+    def posting_list(self, term):
+        """(document numbers, term frequencies) for one already tokenized term"""
+        dictionary, postings = self._shard(shard_key(term))
+        entry = dictionary.get(term) if dictionary else None
+        if entry is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        _, offset, size = entry
+        values = decode_varints(postings[offset:offset + size])
+        return np.cumsum(values[0::2]), values[1::2]
+
+    def document_id(self, number):
+        block, position = divmod(number, self.meta['block_size'])
+        if block not in self.blocks:
+            with open(os.path.join(self.path, 'docs', f"{block:04d}.json"), 'r', encoding='utf-8') as f:
+                self.blocks[block] = json.load(f)
+        return self.blocks[block][position]
+
+    def search(self, query, limit=20, kind=None, match_all=True):
+        """[{'id', 'kind', 'score'}] for the best matches, best first.
+
+        kind is 'tweet' or 'thread' to search only one of them. With match_all
+        a document must contain every query term, otherwise any one will do.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        k1, b = self.meta['k1'], self.meta['b']
+        average_length = self.meta['average_length'] or 1
+        matched, scores = [], []
+        for term in terms:
+            documents, frequencies = self.posting_list(term)
+            if kind == 'tweet':
+                keep = documents < self.tweet_count
+            elif kind == 'thread':
+                keep = documents >= self.tweet_count
+            else:
+                keep = slice(None)
+            documents, frequencies = documents[keep], frequencies[keep]
+            if match_all and not len(documents):
+                return []
+            df = len(documents)
+            idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            lengths = self.lengths[documents].astype(np.float64)
+            frequencies = frequencies.astype(np.float64)
+            matched.append(documents)
+            scores.append(idf * frequencies * (k1 + 1) / (frequencies + k1 * (1 - b + b * lengths / average_length)))
+
+        documents, position = np.unique(np.concatenate(matched), return_inverse=True)
+        totals = np.bincount(position, np.concatenate(scores))
+        if match_all:
+            keep = np.bincount(position) == len(terms)
+            documents, totals = documents[keep], totals[keep]
+        best = np.argsort(-totals, kind='stable')[:limit]
+        return [{
+            'id': self.document_id(int(documents[i])),
+            'kind': 'tweet' if documents[i] < self.tweet_count else 'thread',
+            'score': round(float(totals[i]), 4),
+        } for i in best]
+
+def main():
+    parser = argparse.ArgumentParser(description="Search tweets and threads with the index processTweets writes")
+    parser.add_argument('query')
+    parser.add_argument('--kind', choices=['tweet', 'thread'], help="search only tweets or only threads")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--any', action='store_true', help="match documents with any query term, not all")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = SearchIndex()
+    results = index.search(args.query, args.limit, args.kind, match_all=not args.any)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(json.dumps(results, indent=2), flush=True)
+    print(f"✓ {len(results)} results in {elapsed:.1f} ms", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import math
+import random
+from array import array
+from hashlib import blake2b
+
+MASK_64 = (1 << 64) - 1
+QUANTILES = (0.5, 0.9, 0.99)
+
+def hash64(value):
+    """Stable 64-bit hash of a string, the same in every process and run"""
+    return int.from_bytes(blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def quantiles(values, points=QUANTILES):
+    """{'p50': ..., 'p90': ...} of a list of values"""
+    values = sorted(values)
+    if not values:
+        return {}
+    return {f"p{round(point * 100)}": values[min(int(point * len(values)), len(values) - 1)] for point in points}
+
+class CountMinSketch:
+    """Approximate counts in a fixed depth x width table of counters.
+
+    Estimates never undercount. With width = ceil(e / epsilon) and
+    depth = ceil(ln(1 / delta)), an estimate exceeds the true count by more
+    than epsilon * total with probability at most delta.
+    """
+
+    def __init__(self, epsilon=0.0005, delta=0.01):
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.epsilon = math.e / self.width
+        self.delta = math.exp(-self.depth)
+        self.rows = [array('q', bytes(8 * self.width)) for _ in range(self.depth)]
+        self.total = 0
+
+    def _cells(self, item):
+        # Double hashing: depth indexes from the two halves of one 64-bit hash
+        h = hash64(item)
+        h1, h2 = h & 0xFFFFFFFF, h >> 32
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, item, count=1):
+        """Count item and return its new estimate"""
+        self.total += count
+        estimate = None
+        for row, cell in zip(self.rows, self._cells(item)):
+            row[cell] += count
+            estimate = row[cell] if estimate is None else min(estimate, row[cell])
+        return estimate
+
+    def estimate(self, item):
+        return min(row[cell] for row, cell in zip(self.rows, self._cells(item)))
+
+    def error_bound(self):
+        """Most an estimate overcounts by, with probability 1 - delta"""
+        return math.ceil(self.epsilon * self.total)
+
+    def memory_bytes(self):
+        return self.depth * self.width * 8
+
+class HeavyHitters:
+    """The k items with the highest Count-Min estimates, tracked while counting"""
+
+    def __init__(self, k=100, epsilon=0.0005, delta=0.01):
+        self.k = k
+        self.sketch = CountMinSketch(epsilon, delta)
+        self.candidates = {}
+        self.floor = 0
+
+    def add(self, item):
+        estimate = self.sketch.add(item)
+        if item in self.candidates or len(self.candidates) < self.k:
+            self.candidates[item] = estimate
+        elif estimate > self.floor:
+            # floor is a lower bound on the smallest candidate, refreshed only when it is beaten
+            smallest = min(self.candidates, key=self.candidates.get)
+            if estimate > self.candidates[smallest]:
+                del self.candidates[smallest]
+                self.candidates[item] = estimate
+            self.floor = min(self.candidates.values())
+
+    def top(self, n=None):
+        """[(item, estimated count)], highest first"""
+        ranked = sorted(self.candidates.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:n] if n else ranked
+
+class HyperLogLog:
+    """Approximate distinct count in 2^precision one-byte registers; standard error 1.04 / sqrt(registers)"""
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, item):
+        h = hash64(item)
+        register = h >> (64 - self.precision)
+        rest = (h << self.precision) & MASK_64
+        # Position of the first 1 bit in what is left of the hash
+        rank = 64 - rest.bit_length() + 1 if rest else 64 - self.precision + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -r for r in self.registers)
+        empty = self.registers.count(0)
+        if estimate <= 2.5 * self.size and empty:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = self.size * math.log(self.size / empty)
+        return round(estimate)
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.size)
+
+    def memory_bytes(self):
+        return self.size
+
+class Reservoir:
+    """A uniform random sample of at most size values from a stream of unknown length"""
+
+    def __init__(self, size=10000, seed=0):
+        self.size = size
+        self.values = []
+        self.seen = 0
+        self.random = random.Random(seed)
+
+    def add(self, value):
+        self.seen += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            slot = self.random.randrange(self.seen)
+            if slot < self.size:
+                self.values[slot] = value
+
+    def quantiles(self, points=QUANTILES):
+        return quantiles(self.values, points)
+
+    def rank_error(self, delta=0.01):
+        """Largest error in a quantile's rank, with probability 1 - delta (the DKW inequality)"""
+        if len(self.values) >= self.seen:
+            return 0.0
+        return math.sqrt(math.log(2 / delta) / (2 * len(self.values)))
@@ -6,6 +6,7 @@ import TemporalAnalysis from "./pages/TemporalAnalysis";
 import TweetGrowth from "./pages/TweetGrowth";
 import QuoteDistributions from "./pages/QuoteDistributions";
 import ThreadDistribution from "./pages/ThreadDistribution";
+import Search from "./pages/Search";
 import PropTypes from "prop-types";
 function App() {
   const [isMenuOpen, setIsMenuOpen] = useState(false);
@@ -16,6 +17,7 @@ function App() {
     { to: "/quote-distributions", label: "Quote Distributions" },
     { to: "/tweet-growth", label: "Tweet Growth" },
     { to: "/thread-distribution", label: "Thread Distribution" },
+    { to: "/search", label: "Search" },
   ];
 
   const toggleMenu = () => {
@@ -126,6 +128,7 @@ function App() {
               path="/thread-distribution"
               element={<ThreadDistribution />}
             />
+            <Route path="/search" element={<Search />} />
           </Routes>
         </main>
       </div>
@@ -1,5 +1,6 @@
 import { useState, useEffect } from "react";
 import { Link } from "react-router-dom";
+import { fetchManifest } from "../publishedData";
 
 function Home() {
   const [stats, setStats] = useState({
@@ -11,27 +12,24 @@ function Home() {
 
   useEffect(() => {
     Promise.all([
-      fetch("/tweet_results.json").then((res) => res.json()),
-      fetch("/selfQuotedTweets.json").then((res) => res.json()),
+      // The manifest counts the quoted tweets found in the archive, so no shard is fetched
+      fetchManifest("tweet_results"),
+      fetchManifest("selfQuotedTweets"),
       fetch("/totalTweetLength.json").then((res) => res.json()),
       fetch("/upload.json").then((res) => res.json()),
       fetch("/thread_statistics.json").then((res) => res.json()),
     ])
       .then(
         ([
-          tweetResults,
-          selfQuotedTweets,
+          tweetResultsManifest,
+          selfQuotedManifest,
           totalTweetLength,
           uploadDetails,
           threadStats,
         ]) => {
-          const validTweets = tweetResults.filter(
-            (tweet) => tweet.tweet_text !== "Tweet not found"
-          );
-
           setStats({
-            totalQuotes: selfQuotedTweets.length,
-            uniqueQuotedTweets: validTweets.length,
+            totalQuotes: selfQuotedManifest.count,
+            uniqueQuotedTweets: tweetResultsManifest.found,
             totalTweets: totalTweetLength,
             uploadStats: uploadDetails,
             threadStats: threadStats,
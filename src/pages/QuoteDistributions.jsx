@@ -13,6 +13,7 @@ import {
 import { Line } from "react-chartjs-2";
 import "chartjs-adapter-date-fns";
 import zoomPlugin from "chartjs-plugin-zoom";
+import { fetchCollection } from "../publishedData";
 
 ChartJS.register(
   CategoryScale,
@@ -111,11 +112,12 @@ function QuoteDistributions() {
 
   useEffect(() => {
     Promise.all([
-      fetch("/tweet_results.json").then((res) => res.json()),
+      fetchCollection("tweet_results"),
       fetch("/upload.json").then((res) => res.json()),
-      fetch("/selfQuotedTweets.json").then((res) => res.json()),
+      fetchCollection("selfQuotedTweets"),
+      fetch("/quote_timelines.json").then((res) => res.json()),
     ])
-      .then(([tweetData, uploadData, quotesData]) => {
+      .then(([tweetData, uploadData, quotesData, timelines]) => {
         const uploadDate = new Date(uploadData[0].endDate);
         setUploadDate(uploadDate);
 
@@ -125,12 +127,10 @@ function QuoteDistributions() {
         // Create a map of tweet_id to quoting tweets
         const quoteMap = {};
         quotesData.forEach((quote) => {
-          const quotedUrl = quote.entities.urls.find((url) =>
-            url.expanded_url.includes("twitter.com/visakanv/status/")
-          );
+          // The quoted id is extracted when the file is published
+          const quotedId = quote.quoted_id;
 
-          if (quotedUrl) {
-            const quotedId = quotedUrl.expanded_url.split("/").pop();
+          if (quotedId) {
             if (!quoteMap[quotedId]) {
               quoteMap[quotedId] = [];
             }
@@ -146,32 +146,18 @@ function QuoteDistributions() {
         });
         setQuoteData(quoteMap);
 
-        // Calculate age and quotes per month for each tweet
+        // Age, quotes per month and monthly quote counts come pre-bucketed
         const tweetsWithAge = tweetData
           .filter((tweet) => tweet.tweet_text !== "Tweet not found")
           .map((tweet) => {
-            const tweetDate = new Date(tweet.created_at);
-            const monthsSince =
-              (uploadDate.getFullYear() - tweetDate.getFullYear()) * 12 +
-              (uploadDate.getMonth() - tweetDate.getMonth());
-
-            // Calculate quotes per month only for tweets older than 3 months
-            const quotesPerMonth =
-              monthsSince >= 3 ? tweet.count / monthsSince : 0;
+            const timeline = timelines.tweets[tweet.tweet_id] || {};
 
             return {
               ...tweet,
-              created_at: tweetDate,
-              monthsSince,
-              quotesPerMonth,
-              quotesByMonth: (quoteMap[tweet.tweet_id] || []).reduce(
-                (acc, quote) => {
-                  const monthKey = quote.created_at.toISOString().slice(0, 7);
-                  acc[monthKey] = (acc[monthKey] || 0) + 1;
-                  return acc;
-                },
-                {}
-              ),
+              created_at: new Date(tweet.created_at),
+              monthsSince: timeline.months_since || 0,
+              quotesPerMonth: timeline.quotes_per_month || 0,
+              quotesByMonth: timeline.by_month || {},
             };
           });
 
@@ -0,0 +1,143 @@
+import { useEffect, useState } from "react";
+import { fetchRecords, fetchUsername, searchArchive } from "../publishedData";
+
+const KINDS = [
+  { value: null, label: "All" },
+  { value: "tweet", label: "Tweets" },
+  { value: "thread", label: "Threads" },
+];
+
+function Search() {
+  const [query, setQuery] = useState("");
+  const [kind, setKind] = useState(null);
+  const [results, setResults] = useState(null);
+  const [loading, setLoading] = useState(false);
+  const [username, setUsername] = useState(null);
+
+  useEffect(() => {
+    fetchUsername()
+      .then(setUsername)
+      .catch((error) => console.error("Error loading account:", error));
+  }, []);
+
+  const runSearch = (event) => {
+    event.preventDefault();
+    if (!query.trim()) return;
+    setLoading(true);
+    searchArchive(query, { kind, limit: 50 })
+      .then(async (hits) => {
+        // Only the shards holding the hits are fetched, not the whole collections
+        const idsOf = (wanted) => hits.filter((hit) => hit.kind === wanted).map((hit) => hit.id);
+        const [tweets, threads] = await Promise.all([
+          fetchRecords("tweets", idsOf("tweet")),
+          fetchRecords("twitter_threads", idsOf("thread")),
+        ]);
+        setResults(
+          hits.map((hit) => {
+            if (hit.kind === "tweet") {
+              const tweet = tweets[hit.id] ?? {};
+              return { ...hit, text: tweet.full_text, created_at: tweet.created_at };
+            }
+            const thread = threads[hit.id];
+            return {
+              ...hit,
+              text: thread?.tweets[0]?.text,
+              created_at: thread?.metadata.start_date,
+              length: thread?.metadata.length,
+            };
+          })
+        );
+        setLoading(false);
+      })
+      .catch((error) => {
+        console.error("Error searching tweets:", error);
+        setResults([]);
+        setLoading(false);
+      });
+  };
+
+  return (
+    <div className="container mx-auto py-8 px-4">
+      <h1 className="text-2xl mb-6">
+        Search {username ? `@${username}'s` : "the"} Tweets
+      </h1>
+      <form onSubmit={runSearch} className="md:flex gap-2 mb-8">
+        <input
+          type="search"
+          value={query}
+          onChange={(event) => setQuery(event.target.value)}
+          placeholder="Words to find"
+          className="w-full border rounded px-3 py-2 mb-2 md:mb-0"
+        />
+        <div className="flex gap-2">
+          {KINDS.map((option) => (
+            <button
+              key={option.label}
+              type="button"
+              onClick={() => setKind(option.value)}
+              className={`px-3 py-2 rounded border text-sm ${
+                kind === option.value
+                  ? "bg-blue-500 text-white"
+                  : "text-blue-500 hover:text-blue-600"
+              }`}
+            >
+              {option.label}
+            </button>
+          ))}
+          <button
+            type="submit"
+            className="bg-blue-500 hover:bg-blue-600 text-white px-4 py-2 rounded"
+          >
+            Search
+          </button>
+        </div>
+      </form>
+
+      {loading && (
+        <div className="animate-spin rounded-full h-8 w-8 border-b-2 border-gray-900 mx-auto"></div>
+      )}
+
+      {!loading && results?.length === 0 && (
+        <p className="text-gray-600">No tweets contain all of those words.</p>
+      )}
+
+      {!loading && results?.length > 0 && (
+        <div className="space-y-8">
+          {results.map((result) => (
+            <div
+              key={`${result.kind}-${result.id}`}
+              className="bg-white shadow-lg rounded-lg p-6"
+            >
+              <div className="border-l-4 border-blue-500 pl-4">
+                <p className="text-sm text-gray-500 mb-1">
+                  {result.kind === "thread"
+                    ? `Thread of ${result.length} tweets`
+                    : "Tweet"}
+                  {result.created_at &&
+                    ` • ${new Date(result.created_at).toLocaleDateString("en-US", {
+                      day: "2-digit",
+                      month: "short",
+                      year: "numeric",
+                    })}`}
+                </p>
+                <p className="text-lg">{result.text}</p>
+                <div className="mt-2">
+                  <a
+                    href={`https://twitter.com/${username ?? "i/web"}/status/${result.id}`}
+                    target="_blank"
+                    rel="noopener noreferrer"
+                    className="text-blue-500 hover:text-blue-600 text-sm"
+                  >
+                    View on Twitter →
+                  </a>
+                </div>
+              </div>
+            </div>
+          ))}
+        </div>
+      )}
+    </div>
+  );
+}
+
+export default Search;
@@ -28,6 +28,7 @@ ChartJS.register(
 
 function TemporalAnalysis() {
   const [tweets, setTweets] = useState([]);
+  const [buckets, setBuckets] = useState({ year: {}, month: {} });
   const [timeData, setTimeData] = useState({});
   const [loading, setLoading] = useState(true);
   const [viewMode, setViewMode] = useState("year");
@@ -42,7 +43,7 @@ function TemporalAnalysis() {
 
   useEffect(() => {
     Promise.all([
-      fetch("/tweet_results.json").then((res) => res.json()),
+      fetch("/temporal_top_tweets.json").then((res) => res.json()),
       fetch("/upload.json").then((res) => res.json()),
     ])
       .then(([data, uploadData]) => {
@@ -52,35 +53,17 @@ function TemporalAnalysis() {
         const startDate = new Date(uploadData[0].startDate);
         setStartDate(startDate);
 
-        // Calculate age and quotes per month for each tweet        // Calculate age and quotes per month for each tweet
-        const tweetsWithAge = data
-          .filter((tweet) => tweet.tweet_text !== "Tweet not found")
-          .map((tweet) => {
-            const tweetDate = new Date(tweet.created_at);
-            const monthsSince =
-              (uploadDate.getFullYear() - tweetDate.getFullYear()) * 12 +
-              (uploadDate.getMonth() - tweetDate.getMonth());
-            const quotesPerMonth = tweet.count / monthsSince;
-
-            return {
-              ...tweet,
-              monthsSince,
-              quotesPerMonth,
-            };
-          });
-
-        // Get top 1000 tweets based on either total quotes or normalized quotes
-        const topTweets = tweetsWithAge
-          .filter((tweet) => tweet.monthsSince >= 3)
-          .sort((a, b) =>
-            showNormalized
-              ? b.quotesPerMonth - a.quotesPerMonth
-              : b.count - a.count
-          )
-          .slice(0, 1000);
+        // Top 1000 tweets (at least 3 months old) by either total quotes or
+        // quotes per month, already ranked and bucketed by the pipeline
+        const ranking = showNormalized ? data.quotes_per_month : data.count;
+        const topTweets = ranking.tweets.map((tweet) => ({
+          ...tweet,
+          quotesPerMonth: tweet.quotes_per_month,
+        }));
 
         setTweets(topTweets);
-        updateTimeData(topTweets, viewMode);
+        setBuckets(ranking);
+        updateTimeData(ranking, viewMode);
         setLoading(false);
       })
       .catch((error) => {
@@ -89,47 +72,25 @@ function TemporalAnalysis() {
       });
   }, [viewMode, showNormalized]); // Added showNormalized as dependency
 
-  const updateTimeData = (tweetData, mode) => {
-    const counts = tweetData.reduce((acc, tweet) => {
-      const date = new Date(tweet.created_at);
-      let key;
-
-      if (mode === "year") {
-        key = date.getFullYear().toString();
-      } else {
-        key = `${date.getFullYear()}-${(date.getMonth() + 1)
-          .toString()
-          .padStart(2, "0")}`;
-      }
-
-      acc[key] = (acc[key] || 0) + 1;
-      return acc;
-    }, {});
-
-    setTimeData(counts);
+  const updateTimeData = (ranking, mode) => {
+    setTimeData(mode === "year" ? ranking.year : ranking.month);
     setSelectedPeriod(null);
     setFilteredTweets([]);
   };
 
   const handleViewChange = (mode) => {
     setViewMode(mode);
-    updateTimeData(tweets, mode);
+    updateTimeData(buckets, mode);
   };
 
   const handlePeriodClick = (period) => {
     setSelectedPeriod(period);
 
-    const filtered = tweets.filter((tweet) => {
-      const date = new Date(tweet.created_at);
-      if (viewMode === "year") {
-        return date.getFullYear().toString() === period;
-      } else {
-        const tweetPeriod = `${date.getFullYear()}-${(date.getMonth() + 1)
-          .toString()
-          .padStart(2, "0")}`;
-        return tweetPeriod === period;
-      }
-    });
+    const filtered = tweets.filter((tweet) =>
+      viewMode === "year"
+        ? tweet.month.slice(0, 4) === period
+        : tweet.month === period
+    );
 
     setFilteredTweets(filtered);
   };
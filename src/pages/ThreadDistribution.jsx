@@ -14,6 +14,7 @@ import { Line } from "react-chartjs-2";
 import "chartjs-adapter-date-fns";
 import zoomPlugin from "chartjs-plugin-zoom";
 import PropTypes from "prop-types";
+import { fetchCollection } from "../publishedData";
 
 ChartJS.register(
   CategoryScale,
@@ -425,7 +426,7 @@ function ThreadDistribution() {
 
   useEffect(() => {
     Promise.all([
-      fetch("/twitter_threads.json").then((res) => res.json()),
+      fetchCollection("twitter_threads"),
       fetch("/thread_statistics.json").then((res) => res.json()),
     ])
       .then(([threadData, statisticsData]) => {
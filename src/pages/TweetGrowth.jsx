@@ -35,65 +35,36 @@ function TweetGrowth() {
 
   useEffect(() => {
     Promise.all([
-      fetch("/tweets.json").then((res) => res.json()),
+      fetch("/temporal_aggregates.json").then((res) => res.json()),
       fetch("/upload.json").then((res) => res.json()),
-      fetch("/selfQuotedTweets.json").then((res) => res.json()),
     ])
-      .then(([tweets, uploadData, quotesData]) => {
+      .then(([aggregates, uploadData]) => {
         const uploadDate = new Date(uploadData[0].endDate);
         setUploadDate(uploadDate);
 
-        // Process regular tweets - handle nested structure and add validation
-        const sortedTweets = tweets
-          .filter((t) => t && t.tweet && t.tweet.created_at) // Validate tweet exists
-          .map((t) => new Date(t.tweet.created_at))
-          .filter((date) => !isNaN(date)) // Filter out invalid dates
-          .sort((a, b) => a - b);
-
-        // Process quoted tweets - handle nested structure and add validation
-        const sortedQuotes = quotesData
-          .filter((q) => q && q.created_at) // Validate tweet exists
-          .map((q) => new Date(q.created_at))
-          .filter((date) => !isNaN(date)) // Filter out invalid dates
-          .sort((a, b) => a - b);
+        // Tweets and quotes are already bucketed by month in the pipeline
+        const { keys, tweets, quotes } = aggregates.month;
 
         // Ensure we have valid tweets before proceeding
-        if (sortedTweets.length === 0) {
+        if (keys.length === 0) {
           throw new Error("No valid tweets found");
         }
 
         // Create monthly data
         const monthlyData = {};
-        const startDate = new Date(sortedTweets[0]);
-        const currentDate = new Date(startDate);
+        const currentDate = new Date(`${keys[0]}-01T00:00:00Z`);
 
         while (currentDate <= uploadDate) {
           const key = currentDate.toISOString().slice(0, 7);
           monthlyData[key] = { tweets: 0, quotes: 0 };
-          currentDate.setMonth(currentDate.getMonth() + 1);
+          currentDate.setUTCMonth(currentDate.getUTCMonth() + 1);
         }
 
-        // Count tweets per month
-        sortedTweets.forEach((date) => {
-          if (date && !isNaN(date)) {
-            // Add date validation
-            const key = date.toISOString().slice(0, 7);
-            if (monthlyData[key]) {
-              // Check if key exists
-              monthlyData[key].tweets += 1;
-            }
-          }
-        });
-
-        // Count quotes per month
-        sortedQuotes.forEach((date) => {
-          if (date && !isNaN(date)) {
-            // Add date validation
-            const key = date.toISOString().slice(0, 7);
-            if (monthlyData[key]) {
-              // Check if key exists
-              monthlyData[key].quotes += 1;
-            }
+        keys.forEach((key, index) => {
+          if (monthlyData[key]) {
+            // Check if key exists
+            monthlyData[key].tweets += tweets[index];
+            monthlyData[key].quotes += quotes[index];
           }
         });
 
@@ -1,4 +1,5 @@
 import { useState, useEffect } from "react";
+import { fetchJson } from "../publishedData";
 
 function TopTweets() {
   const [selfQuotes, setSelfQuotes] = useState([]);
@@ -6,48 +7,22 @@ function TopTweets() {
   const [showNormalized, setShowNormalized] = useState(false);
 
   useEffect(() => {
-    Promise.all([
-      fetch("/tweet_results.json").then((res) => res.json()),
-      fetch("/upload.json").then((res) => res.json()),
-    ])
-      .then(([tweetData, uploadData]) => {
-        // Filter out "Tweet not found" entries
-        const validTweets = tweetData.filter(
-          (tweet) => tweet.tweet_text !== "Tweet not found"
-        );
-
-        const uploadDate = new Date(uploadData[0].endDate);
-
-        // Calculate months since tweet for each tweet
-        const tweetsWithAge = validTweets.map((tweet) => {
-          const tweetDate = new Date(tweet.created_at);
-          const now = uploadDate;
-          const monthsSince =
-            (now.getFullYear() - tweetDate.getFullYear()) * 12 +
-            (now.getMonth() - tweetDate.getMonth());
-          const quotesPerMonth = tweet.count / monthsSince;
-
-          return {
-            ...tweet,
-            monthsSince,
-            quotesPerMonth,
-          };
-        });
-
-        // Filter tweets older than 3 months for normalized view
-        const normalizedTweets = tweetsWithAge
-          .filter((tweet) => tweet.monthsSince >= 3)
-          .sort((a, b) => b.quotesPerMonth - a.quotesPerMonth)
-          .slice(0, 200);
-
-        // Regular top 200 tweets
-        const topTweets = tweetsWithAge
-          .sort((a, b) => b.count - a.count)
-          .slice(0, 200);
+    // The pipeline already ranked the top tweets, so nothing is sorted here
+    fetchJson("/leaderboards.json")
+      .then((leaderboards) => {
+        const ranked = (metric) =>
+          leaderboards.metrics[metric].overall.map(([tweetId]) => {
+            const tweet = leaderboards.tweets[tweetId];
+            return {
+              ...tweet,
+              monthsSince: tweet.months_since,
+              quotesPerMonth: tweet.quotes_per_month,
+            };
+          });
 
         setSelfQuotes({
-          regular: topTweets,
-          normalized: normalizedTweets,
+          regular: ranked("quote_count"),
+          normalized: ranked("quotes_per_month"),
         });
         setLoading(false);
       })
@@ -0,0 +1,163 @@
+// Loaders for the files publish.py writes to public/.
+// Large collections are split into id-range shards listed in a manifest.
+
+export const fetchJson = (path) => fetch(path).then((res) => res.json());
+
+export const fetchManifest = (name) => fetchJson(`/${name}/manifest.json`);
+
+// Fetch every shard of a collection in parallel and join them back together
+export const fetchCollection = (name) =>
+  fetchManifest(name).then((manifest) =>
+    Promise.all(
+      manifest.shards.map((shard) => fetchJson(`/${name}/${shard.file}`))
+    ).then((shards) =>
+      manifest.type === "object" ? Object.assign({}, ...shards) : shards.flat()
+    )
+  );
+
+// Files fetched piece by piece are fetched once per page load
+const fileCache = {};
+const cached = (key, load) => (fileCache[key] ??= load());
+
+// The records with the given ids, fetching only the shards whose id range holds one of them
+export const fetchRecords = async (name, ids) => {
+  const manifest = await cached(`${name}/manifest`, () => fetchManifest(name));
+  const wanted = ids.map((id) => BigInt(id));
+  const shards = manifest.shards.filter((shard) =>
+    wanted.some((id) => BigInt(shard.first_id) <= id && id <= BigInt(shard.last_id))
+  );
+  const pieces = await Promise.all(
+    shards.map((shard) =>
+      cached(`${name}/${shard.file}`, () => fetchJson(`/${name}/${shard.file}`))
+    )
+  );
+  const records = {};
+  for (const piece of pieces) {
+    if (manifest.type === "object") {
+      Object.assign(records, piece);
+    } else {
+      for (const record of piece) records[record[manifest.id_field]] = record;
+    }
+  }
+  return records;
+};
+
+// The account the archive belongs to, from the account.json createFiles splits out of it
+export const fetchUsername = () =>
+  cached("account", () => fetchJson("/account.json")).then(
+    (sections) => sections.flat().find((entry) => entry.account)?.account.username
+  );
+
+// Full-text search over public/search_index/, written by searchIndex.py.
+// Only meta.json, the document lengths, the shards of the query's terms and
+// the id blocks of the results are fetched.
+const fetchBinary = (path) => fetch(path).then((res) => res.arrayBuffer());
+
+// Character references decoded as Python's html.unescape does: both follow
+// HTML5, and a textarea's content is parsed as text, so markup stays as typed
+const unescapeHtml = (text) => {
+  const textarea = document.createElement("textarea");
+  textarea.innerHTML = text;
+  return textarea.value;
+};
+
+// A link runs to the next character Python's \s matches, which isn't quite JavaScript's \s
+const urlPattern =
+  /https?:\/\/[^\t-\r\x1c-\x20\x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]+/g;
+
+// Must give the same tokens as tokenize() in searchIndex.py. Python's \w is
+// letters, numbers and _, without combining marks, and len() counts code points
+const tokenize = (text) =>
+  unescapeHtml(text || "")
+    .toLowerCase()
+    .replace(urlPattern, " ")
+    .replace(/['’]/g, "")
+    .match(/[\p{L}\p{N}_]+/gu)
+    ?.filter((token) => [...token].length <= 40) ?? [];
+
+const shardKey = (term) =>
+  /^[a-z0-9]{1,2}$/.test(term.slice(0, 2))
+    ? term.slice(0, 2)
+    : `u${term.codePointAt(0).toString(16)}`;
+
+// (document gap, term frequency) varint pairs -> [[document, frequency], ...]
+const decodePostings = (bytes) => {
+  const postings = [];
+  let document = 0;
+  let value = 0;
+  let shift = 0;
+  let gap = null;
+  for (const byte of bytes) {
+    value += (byte & 0x7f) * 2 ** shift;
+    shift += 7;
+    if (byte < 0x80) {
+      if (gap === null) {
+        gap = value;
+      } else {
+        document += gap;
+        postings.push([document, value]);
+        gap = null;
+      }
+      value = 0;
+      shift = 0;
+    }
+  }
+  return postings;
+};
+
+const searchFile = (file) => `/search_index/${file}`;
+
+const postingList = async (meta, term) => {
+  const key = shardKey(term);
+  if (!meta.shards[key]) return [];
+  const [terms, postings] = await Promise.all([
+    cached(`terms/${key}`, () => fetchJson(searchFile(`terms/${key}.json`))),
+    cached(`postings/${key}`, () => fetchBinary(searchFile(`postings/${key}.bin`))),
+  ]);
+  const entry = terms[term];
+  if (!entry) return [];
+  const [, offset, size] = entry;
+  return decodePostings(new Uint8Array(postings, offset, size));
+};
+
+// [{id, kind, score}] ranked with BM25; kind is "tweet", "thread" or null for both
+export const searchArchive = async (query, { limit = 20, kind = null, matchAll = true } = {}) => {
+  const terms = [...new Set(tokenize(query))];
+  if (!terms.length) return [];
+  const meta = await cached("meta", () => fetchJson(searchFile("meta.json")));
+  const [lengthsBuffer, lists] = await Promise.all([
+    cached("lengths", () => fetchBinary(searchFile("lengths.bin"))),
+    Promise.all(terms.map((term) => postingList(meta, term))),
+  ]);
+  const lengths = new Uint16Array(lengthsBuffer);
+  const wanted = (document) =>
+    kind === null || (kind === "tweet") === document < meta.tweet_count;
+
+  const scores = new Map();
+  for (const list of lists) {
+    const postings = list.filter(([document]) => wanted(document));
+    const idf = Math.log(1 + (meta.doc_count - postings.length + 0.5) / (postings.length + 0.5));
+    for (const [document, frequency] of postings) {
+      const norm = meta.k1 * (1 - meta.b + (meta.b * lengths[document]) / (meta.average_length || 1));
+      const [score, matched] = scores.get(document) ?? [0, 0];
+      scores.set(document, [score + (idf * frequency * (meta.k1 + 1)) / (frequency + norm), matched + 1]);
+    }
+  }
+
+  const ranked = [...scores]
+    .filter(([, [, matched]]) => !matchAll || matched === terms.length)
+    .sort((a, b) => b[1][0] - a[1][0])
+    .slice(0, limit);
+  return Promise.all(
+    ranked.map(async ([document, [score]]) => {
+      const block = Math.floor(document / meta.block_size);
+      const name = String(block).padStart(4, "0");
+      const ids = await cached(`docs/${name}`, () => fetchJson(searchFile(`docs/${name}.json`)));
+      return {
+        id: ids[document % meta.block_size],
+        kind: document < meta.tweet_count ? "tweet" : "thread",
+        score,
+      };
+    })
+  );
+};
@@ -0,0 +1,244 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+RUN_REPORT_FILE = 'run_report.json'
+PROFILE_INTERVAL = 0.005
+# Set to a stage name to sample that stage's stacks, e.g. PIPELINE_PROFILE_STAGE=processTweets
+PROFILE_ENV = 'PIPELINE_PROFILE_STAGE'
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def rss_mb():
+    """Resident memory right now, where the platform exposes it"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / (1 << 20), 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def io_counters():
+    """Bytes this process has read and written so far, where the platform exposes them.
+
+    The counters are per process, so stages that run at the same time see each other's I/O.
+    """
+    try:
+        with open('/proc/self/io', 'r') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+class StageRecord:
+    """What one stage did; the code inside the stage fills in its record counts"""
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.records_in = None
+        self.records_out = None
+        self.retries = 0
+        self.status = 'running'
+        self.error = None
+        self.metrics = {}
+        # Highest traced allocation while the stage was open, in bytes (see RunTelemetry.fold_traced_peak)
+        self.traced_peak = 0
+
+    def records(self, records_in=None, records_out=None):
+        if records_in is not None:
+            self.records_in = records_in
+        if records_out is not None:
+            self.records_out = records_out
+
+    def to_dict(self):
+        entry = {'name': self.name}
+        if self.parent:
+            entry['parent'] = self.parent
+        entry.update(self.metrics)
+        entry.update({
+            'records_in': self.records_in,
+            'records_out': self.records_out,
+            'retries': self.retries,
+            'status': self.status,
+        })
+        if self.error:
+            entry['error'] = self.error
+        return entry
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval and counts the stacks it sees.
+
+    The result is written in the collapsed "frame;frame;frame count" format
+    that flame graph tools read.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.running = False
+        self.thread = None
+
+    def _sample(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def stop(self, filename):
+        self.running = False
+        self.thread.join()
+        with open(filename, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return sum(self.stacks.values())
+
+class RunTelemetry:
+    """Collects a StageRecord for every instrumented stage of one run"""
+
+    def __init__(self):
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.stages = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profile_stage = os.environ.get(PROFILE_ENV)
+        self.profiles = {}
+        self.trace_memory = False
+        # Stages that haven't finished, on any thread
+        self.open_stages = []
+
+    def reset(self):
+        """Start a new report, for a process that runs the pipeline more than once"""
+        self.started = datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            self.stages = []
+        self.profiles = {}
+
+    def enable_memory_tracing(self):
+        """Also report each stage's peak of Python allocations; slower, so off by default"""
+        self.trace_memory = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def fold_traced_peak(self):
+        """Credit the traced peak so far to every open stage, then start a new peak.
+
+        tracemalloc keeps one peak for the whole process, so resetting it for a
+        stage would lose the peak of the stages around it and of stages on
+        other threads; folding it in first keeps their peaks. Called with the lock held.
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self.open_stages:
+            record.traced_peak = max(record.traced_peak, peak)
+        tracemalloc.reset_peak()
+
+    def current(self):
+        stack = getattr(self.local, 'stack', None)
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def stage(self, name):
+        parent = self.current()
+        record = StageRecord(name, parent.name if parent else None)
+        with self.lock:
+            self.stages.append(record)
+            if self.trace_memory:
+                self.fold_traced_peak()
+            self.open_stages.append(record)
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        self.local.stack.append(record)
+
+        profiler = None
+        if self.profile_stage == name:
+            profiler = SamplingProfiler(threading.get_ident())
+            profiler.start()
+        rss_start = rss_mb()
+        peak_start = peak_rss_mb()
+        io_before = io_counters()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield record
+            record.status = 'ok'
+        except BaseException as e:
+            record.status = 'failed'
+            record.error = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            # ru_maxrss only ever rises, so a stage's share of it is how far it rose while the stage ran
+            record.metrics = {
+                'wall_seconds': round(time.perf_counter() - wall_start, 4),
+                'cpu_seconds': round(time.thread_time() - cpu_start, 4),
+                'peak_rss_growth_mb': round(peak_rss_mb() - peak_start, 1),
+                'rss_start_mb': rss_start,
+                'rss_end_mb': rss_mb(),
+            }
+            with self.lock:
+                if self.trace_memory:
+                    self.fold_traced_peak()
+                    record.metrics['traced_peak_mb'] = round(record.traced_peak / (1 << 20), 1)
+                self.open_stages.remove(record)
+            io_after = io_counters()
+            if io_before and io_after:
+                record.metrics['bytes_read'] = io_after[0] - io_before[0]
+                record.metrics['bytes_written'] = io_after[1] - io_before[1]
+            self.local.stack.pop()
+            if profiler is not None:
+                filename = f"profile_{name.replace(' ', '_')}.txt"
+                samples = profiler.stop(filename)
+                self.profiles[name] = filename
+                print(f"✓ Wrote {samples} stack samples of {name} to {filename}", flush=True)
+
+    def skipped(self, name, reason):
+        record = StageRecord(name)
+        record.status = 'skipped'
+        record.metrics = {'reason': reason}
+        with self.lock:
+            self.stages.append(record)
+
+    def report(self, status):
+        return {
+            'started': self.started,
+            'finished': datetime.now().isoformat(timespec='seconds'),
+            'status': status,
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': [record.to_dict() for record in self.stages],
+            'profiles': self.profiles,
+        }
+
+    def write_report(self, status, filename=RUN_REPORT_FILE):
+        report = self.report(status)
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        os.replace(temp_filename, filename)
+        print(f"✓ Saved {filename}", flush=True)
+        return report
+
+# One collector per process; stages anywhere in the pipeline report into it
+telemetry = RunTelemetry()
+stage = telemetry.stage
+current_stage = telemetry.current
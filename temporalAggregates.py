@@ -0,0 +1,204 @@
+import heapq
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from processTweets import MISSING_TIME, Analysis, parse_created_at
+
+FIELDS = ('tweets', 'quotes', 'likes', 'retweets')
+PERIODS = {
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+    'year': '%Y',
+}
+HOURS_PER_WEEK = 7 * 24
+# Lower edges, in days, of the buckets for the delay between a tweet and its quotes
+LAG_BINS_DAYS = (0, 1, 7, 30, 90, 365, 730)
+TOP_TWEETS = 1000
+MIN_MONTHS_FOR_RATE = 3
+
+def load_upload_end_date(filename='upload.json'):
+    """Epoch seconds of the archive's endDate, or None if upload.json isn't available"""
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r', encoding='utf-8') as f:
+        upload_data = json.load(f)
+    try:
+        end_date = upload_data[0]['endDate']
+        return int(datetime.fromisoformat(end_date.replace('Z', '+00:00')).timestamp())
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+def months_between(start, end):
+    """Calendar months from start to end, as the dashboard counts them"""
+    start, end = time.gmtime(start), time.gmtime(end)
+    return (end.tm_year - start.tm_year) * 12 + (end.tm_mon - start.tm_mon)
+
+def lag_bin(lag_seconds):
+    days = lag_seconds / 86400
+    for position in range(len(LAG_BINS_DAYS) - 1, -1, -1):
+        if days >= LAG_BINS_DAYS[position]:
+            return position
+    return 0
+
+def columns(buckets):
+    """{key: [tweets, quotes, ...]} -> {"keys": [...], "tweets": [...], ...} sorted by key"""
+    keys = sorted(buckets)
+    result = {'keys': keys}
+    for position, field in enumerate(FIELDS):
+        result[field] = [buckets[key][position] for key in keys]
+    return result
+
+class TemporalAnalysis(Analysis):
+    """Parses each timestamp once and buckets activity and quotes over time.
+
+    The dashboard used to download whole tweet files and bucket them in the
+    browser; these outputs are the already-bucketed series.
+    """
+
+    outputs = ('temporal_aggregates.json', 'quote_timelines.json', 'temporal_top_tweets.json')
+
+    def __init__(self, self_quotes):
+        self.self_quotes = self_quotes
+        self.periods = {period: {} for period in PERIODS}
+        self.hour_of_week = [[0] * len(FIELDS) for _ in range(HOURS_PER_WEEK)]
+        self.quote_times = defaultdict(list)
+        self.latest_time = None
+
+    def _count(self, timestamp, values, sign=1):
+        moment = time.gmtime(timestamp)
+        for period, key_format in PERIODS.items():
+            key = time.strftime(key_format, moment)
+            bucket = self.periods[period].get(key)
+            if bucket is None:
+                bucket = self.periods[period][key] = [0] * len(FIELDS)
+            for position, value in enumerate(values):
+                bucket[position] += sign * value
+        bucket = self.hour_of_week[moment.tm_wday * 24 + moment.tm_hour]
+        for position, value in enumerate(values):
+            bucket[position] += sign * value
+
+    def add(self, tweet, record):
+        timestamp = parse_created_at(record.get('created_at'))
+        if timestamp == MISSING_TIME:
+            return
+        self.latest_time = timestamp if self.latest_time is None else max(self.latest_time, timestamp)
+        self._count(timestamp, (
+            1,
+            1 if self.self_quotes.current_matched else 0,
+            int(record.get('favorite_count', 0) or 0),
+            int(record.get('retweet_count', 0) or 0),
+        ))
+        for quoted_id in self.self_quotes.current_quoted_ids:
+            self.quote_times[quoted_id].append(timestamp)
+
+    def restore(self, tweet, record):
+        # The buckets are saved; the quote times are re-derived rather than saved per tweet
+        if not self.self_quotes.current_quoted_ids:
+            return
+        timestamp = parse_created_at(record.get('created_at'))
+        if timestamp == MISSING_TIME:
+            return
+        for quoted_id in self.self_quotes.current_quoted_ids:
+            self.quote_times[quoted_id].append(timestamp)
+
+    def replace(self, tweet, record, previous):
+        # Only likes and retweets move on an already processed tweet
+        timestamp = parse_created_at(record.get('created_at'))
+        if timestamp == MISSING_TIME or previous is None:
+            return
+        self._count(timestamp, (0, 0,
+                                int(previous.get('favorite_count', 0) or 0),
+                                int(previous.get('retweet_count', 0) or 0)), sign=-1)
+        self._count(timestamp, (0, 0,
+                                int(record.get('favorite_count', 0) or 0),
+                                int(record.get('retweet_count', 0) or 0)))
+
+    def finish(self, index, results):
+        print("Bucketing tweets and quotes over time", flush=True)
+        reference_time = load_upload_end_date() or self.latest_time or 0
+
+        aggregates = {period: columns(buckets) for period, buckets in self.periods.items()}
+        aggregates['hour_of_week'] = {
+            field: [bucket[position] for bucket in self.hour_of_week]
+            for position, field in enumerate(FIELDS)
+        }
+
+        timelines = {}
+        quoted_tweets = []
+        for quoted_id, quote_times in self.quote_times.items():
+            by_month = defaultdict(int)
+            for quote_time in quote_times:
+                by_month[time.strftime('%Y-%m', time.gmtime(quote_time))] += 1
+            timeline = {'by_month': dict(sorted(by_month.items()))}
+
+            quoted = index.tweets_by_id.get(quoted_id)
+            created_time = parse_created_at(quoted.get('created_at')) if quoted else MISSING_TIME
+            if created_time != MISSING_TIME:
+                lags = [0] * len(LAG_BINS_DAYS)
+                for quote_time in quote_times:
+                    lags[lag_bin(quote_time - created_time)] += 1
+                months_since = months_between(created_time, reference_time)
+                quotes_per_month = len(quote_times) / months_since if months_since >= MIN_MONTHS_FOR_RATE else 0
+                timeline.update({
+                    'month': time.strftime('%Y-%m', time.gmtime(created_time)),
+                    'months_since': months_since,
+                    'quotes_per_month': round(quotes_per_month, 4),
+                    'lag': lags,
+                })
+                quoted_tweets.append((quoted_id, quoted, len(quote_times), timeline))
+            timelines[quoted_id] = timeline
+
+        return {
+            'temporal_aggregates.json': aggregates,
+            'quote_timelines.json': {
+                'lag_bins_days': list(LAG_BINS_DAYS),
+                'tweets': timelines,
+            },
+            'temporal_top_tweets.json': {
+                'count': top_tweets(quoted_tweets, lambda item: item[2]),
+                'quotes_per_month': top_tweets(quoted_tweets, lambda item: item[3]['quotes_per_month']),
+            },
+        }
+
+    def to_state(self):
+        return {
+            'temporal': {
+                'periods': self.periods,
+                'hour_of_week': self.hour_of_week,
+                'latest_time': self.latest_time,
+            }
+        }
+
+    def load_state(self, state):
+        temporal = state['temporal']
+        self.periods = temporal['periods']
+        self.hour_of_week = temporal['hour_of_week']
+        self.latest_time = temporal['latest_time']
+
+def top_tweets(quoted_tweets, key):
+    """The TemporalAnalysis page's top tweets for one ranking, with their year and month buckets"""
+    eligible = [item for item in quoted_tweets if item[3]['months_since'] >= MIN_MONTHS_FOR_RATE]
+    # Ties go to the older tweet so the ranking doesn't depend on archive order
+    ranked = heapq.nlargest(TOP_TWEETS, eligible, key=lambda item: (key(item), -int(item[0])))
+    tweets = []
+    by_year = defaultdict(int)
+    by_month = defaultdict(int)
+    for quoted_id, quoted, count, timeline in ranked:
+        tweets.append({
+            'tweet_id': quoted_id,
+            'tweet_text': quoted.get('full_text', ''),
+            'count': count,
+            'created_at': quoted.get('created_at'),
+            'month': timeline['month'],
+            'quotes_per_month': timeline['quotes_per_month'],
+        })
+        by_year[timeline['month'][:4]] += 1
+        by_month[timeline['month']] += 1
+    return {
+        'tweets': tweets,
+        'year': dict(sorted(by_year.items())),
+        'month': dict(sorted(by_month.items())),
+    }
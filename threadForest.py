@@ -0,0 +1,104 @@
+import numpy as np
+
+MISSING_TIME = np.iinfo(np.int64).min
+
+class ConversationForest:
+    """The full reply forest of the archive, built level by level with NumPy.
+
+    Rows are tweets, parents are resolved through integer ids and children are
+    kept in CSR form ordered by posting time, so a branching conversation keeps
+    every branch. Subtree metrics come from one post-order sweep over the
+    levels, without recursion.
+    """
+
+    def __init__(self, ids, reply_to, created_at, likes, retweets):
+        count = len(ids)
+        self.count = count
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.reply_to = np.asarray(reply_to, dtype=np.int64)
+        self.created_at = np.asarray(created_at, dtype=np.int64)
+
+        # Resolve parents to rows in one pass; the last copy of a duplicated id wins
+        row_of = dict(zip(self.ids.tolist(), range(count)))
+        self.parent = np.fromiter(
+            (row_of.get(parent_id, -1) if parent_id else -1 for parent_id in self.reply_to.tolist()),
+            dtype=np.int64, count=count)
+
+        # Children of each row, earliest first (input order breaks ties)
+        child_rows = np.flatnonzero(self.parent >= 0)
+        order = np.lexsort((child_rows, self.created_at[child_rows], self.parent[child_rows]))
+        self.children = child_rows[order]
+        self.fan_out = np.bincount(self.parent[child_rows], minlength=count)
+        self.child_start = np.concatenate(([0], np.cumsum(self.fan_out)))
+        self.first_child = np.full(count, -1, dtype=np.int64)
+        has_children = self.fan_out > 0
+        self.first_child[has_children] = self.children[self.child_start[:-1][has_children]]
+
+        self.depth = np.full(count, -1, dtype=np.int64)
+        self.root = np.full(count, -1, dtype=np.int64)
+        self.levels = self._walk_levels()
+        self._sum_subtrees(np.asarray(likes, dtype=np.int64), np.asarray(retweets, dtype=np.int64))
+
+    def _walk_levels(self):
+        """Breadth-first from every root; rows caught in a reply cycle are never reached"""
+        frontier = np.flatnonzero(self.parent < 0)
+        self.root[frontier] = frontier
+        levels = []
+        depth = 0
+        while len(frontier):
+            self.depth[frontier] = depth
+            levels.append(frontier)
+            counts = self.fan_out[frontier]
+            total = int(counts.sum())
+            if total == 0:
+                break
+            # Gather every child range of the frontier in one indexing operation
+            starts = self.child_start[frontier] - (np.cumsum(counts) - counts)
+            children = self.children[np.repeat(starts, counts) + np.arange(total)]
+            self.root[children] = np.repeat(self.root[frontier], counts)
+            frontier = children
+            depth += 1
+        return levels
+
+    def _sum_subtrees(self, likes, retweets):
+        self.size = np.ones(self.count, dtype=np.int64)
+        self.height = np.ones(self.count, dtype=np.int64)
+        self.max_fan_out = self.fan_out.copy()
+        self.total_likes = likes.copy()
+        self.total_retweets = retweets.copy()
+        known = self.created_at != MISSING_TIME
+        self.first_time = np.where(known, self.created_at, np.iinfo(np.int64).max)
+        self.last_time = np.where(known, self.created_at, MISSING_TIME)
+
+        # Deepest level first, so every child is complete before it is folded into its parent
+        for level in reversed(self.levels[1:]):
+            parents = self.parent[level]
+            np.add.at(self.size, parents, self.size[level])
+            np.add.at(self.total_likes, parents, self.total_likes[level])
+            np.add.at(self.total_retweets, parents, self.total_retweets[level])
+            np.maximum.at(self.height, parents, self.height[level] + 1)
+            np.maximum.at(self.max_fan_out, parents, self.max_fan_out[level])
+            np.minimum.at(self.first_time, parents, self.first_time[level])
+            np.maximum.at(self.last_time, parents, self.last_time[level])
+
+    def thread_starts(self):
+        """Original tweets (not replies) that received at least one reply"""
+        return np.flatnonzero((self.reply_to == 0) & (self.parent < 0) & (self.fan_out > 0))
+
+    def main_chain(self, row):
+        """Rows of the thread from row, following the earliest reply at each step"""
+        chain = [row]
+        while self.first_child[chain[-1]] >= 0:
+            chain.append(int(self.first_child[chain[-1]]))
+        return chain
+
+    def subtree_metrics(self, row):
+        span = int(self.last_time[row] - self.first_time[row]) if self.last_time[row] != MISSING_TIME else 0
+        return {
+            'tweets': int(self.size[row]),
+            'depth': int(self.height[row]),
+            'max_fan_out': int(self.max_fan_out[row]),
+            'total_likes': int(self.total_likes[row]),
+            'total_retweets': int(self.total_retweets[row]),
+            'span_seconds': span
+        }
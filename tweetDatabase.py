@@ -0,0 +1,309 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from processTweets import MISSING_TIME, default_tweets_file, load_json_file, load_records, parse_created_at
+
+DATABASE_FILE = 'tweets.db'
+DATABASE_VERSION = 1
+SECONDS_PER_DAY = 86400
+BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE tweets (
+    id INTEGER PRIMARY KEY,
+    created_at INTEGER,
+    full_text TEXT,
+    favorite_count INTEGER,
+    retweet_count INTEGER,
+    retweeted INTEGER,
+    in_reply_to_status_id INTEGER,
+    in_reply_to_screen_name TEXT
+);
+CREATE TABLE quotes (tweet_id INTEGER, quoted_id INTEGER, created_at INTEGER);
+CREATE TABLE threads (
+    start_id INTEGER PRIMARY KEY,
+    created_at INTEGER,
+    length INTEGER,
+    total_likes INTEGER,
+    total_retweets INTEGER
+);
+-- One row per day from the first tweet to the last; the cum_ columns are running totals up to and
+-- including that day, so any window's totals are the difference of two rows
+CREATE TABLE daily (
+    day INTEGER PRIMARY KEY,
+    tweets INTEGER, quotes INTEGER, likes INTEGER, retweets INTEGER,
+    cum_tweets INTEGER, cum_quotes INTEGER, cum_likes INTEGER, cum_retweets INTEGER
+);
+"""
+
+INDEXES = """
+CREATE INDEX tweets_created_at ON tweets (created_at);
+CREATE INDEX tweets_in_reply_to ON tweets (in_reply_to_status_id);
+CREATE INDEX quotes_quoted_id ON quotes (quoted_id, created_at);
+CREATE INDEX quotes_tweet_id ON quotes (tweet_id);
+CREATE INDEX quotes_created_at ON quotes (created_at, quoted_id);
+CREATE INDEX threads_created_at ON threads (created_at);
+"""
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def tweet_row(record):
+    timestamp = parse_created_at(record.get('created_at'))
+    return (
+        int(record['id_str']),
+        None if timestamp == MISSING_TIME else timestamp,
+        record.get('full_text'),
+        to_int(record.get('favorite_count')) or 0,
+        to_int(record.get('retweet_count')) or 0,
+        1 if record.get('retweeted') else 0,
+        to_int(record.get('in_reply_to_status_id_str')),
+        record.get('in_reply_to_screen_name'),
+    )
+
+def quote_rows(graph_path):
+    """(quoting id, quoted id, quote time) for every edge of the quote graph processTweets wrote"""
+    from quoteGraph import QuoteGraph
+    graph = QuoteGraph(graph_path)
+    targets = np.repeat(graph.quoted_ids, np.diff(graph.quoted_start))
+    times = np.where(graph.quote_times == MISSING_TIME, -1, graph.quote_times)
+    for source, target, timestamp in zip(graph.quoting.tolist(), targets.tolist(), times.tolist()):
+        yield source, target, None if timestamp == -1 else timestamp
+
+def thread_rows(threads):
+    for start_id, thread in threads.items():
+        metadata = thread['metadata']
+        timestamp = parse_created_at(metadata.get('start_date'))
+        yield (int(start_id), None if timestamp == MISSING_TIME else timestamp, metadata['length'],
+               metadata['total_likes'], metadata['total_retweets'])
+
+def insert_batches(db, sql, rows):
+    batch = []
+    count = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    db.executemany(sql, batch)
+    return count + len(batch)
+
+def fill_daily(db):
+    """Dense per-day totals and their prefix sums"""
+    days = {}
+    for day, tweets, likes, retweets in db.execute(
+            "SELECT created_at / ?, COUNT(*), SUM(favorite_count), SUM(retweet_count) "
+            "FROM tweets WHERE created_at IS NOT NULL GROUP BY 1", (SECONDS_PER_DAY,)):
+        days[day] = [tweets, 0, likes, retweets]
+    for day, quotes in db.execute(
+            "SELECT created_at / ?, COUNT(*) FROM quotes WHERE created_at IS NOT NULL GROUP BY 1", (SECONDS_PER_DAY,)):
+        days.setdefault(day, [0, 0, 0, 0])[1] = quotes
+    if not days:
+        return 0
+    totals = [0, 0, 0, 0]
+    rows = []
+    for day in range(min(days), max(days) + 1):
+        values = days.get(day, [0, 0, 0, 0])
+        totals = [total + value for total, value in zip(totals, values)]
+        rows.append((day, *values, *totals))
+    db.executemany("INSERT INTO daily VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+def build_database(records, threads, graph_path='quote_graph', filename=DATABASE_FILE):
+    """Load projected tweet records, the threads and the quote graph into an indexed SQLite file.
+
+    The database is built under a temporary name and moved into place, so a
+    running query server never sees half of it.
+    """
+    temp_filename = f"{filename}.tmp"
+    if os.path.exists(temp_filename):
+        os.remove(temp_filename)
+    db = sqlite3.connect(temp_filename)
+    try:
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.executescript(SCHEMA)
+        db.execute("INSERT INTO meta VALUES ('version', ?)", (str(DATABASE_VERSION),))
+        db.execute("INSERT INTO meta VALUES ('built', ?)", (datetime.now().isoformat(timespec='seconds'),))
+        # Later copies of a duplicated id win, as in the tweet index
+        tweet_count = insert_batches(db, "INSERT OR REPLACE INTO tweets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (tweet_row(r) for r in records if r.get('id_str')))
+        quote_count = 0
+        if os.path.isdir(graph_path):
+            quote_count = insert_batches(db, "INSERT INTO quotes VALUES (?, ?, ?)", quote_rows(graph_path))
+        thread_count = insert_batches(db, "INSERT INTO threads VALUES (?, ?, ?, ?, ?)", thread_rows(threads))
+        # Indexes are cheaper to build once over the loaded rows than to maintain row by row
+        db.executescript(INDEXES)
+        day_count = fill_daily(db)
+        db.commit()
+        db.execute("ANALYZE")
+    finally:
+        db.close()
+    os.replace(temp_filename, filename)
+    print(f"✓ Saved {filename}: {tweet_count} tweets, {quote_count} quotes, {thread_count} threads, "
+          f"{day_count} days", flush=True)
+    return tweet_count
+
+def parse_day(value, default):
+    """Day number (days since the epoch) of an ISO date, or default when value is empty"""
+    if not value:
+        return default
+    moment = date.fromisoformat(value)
+    return (moment - date(1970, 1, 1)).days
+
+def format_day(day):
+    return datetime.fromtimestamp(day * SECONDS_PER_DAY, timezone.utc).strftime('%Y-%m-%d')
+
+class TweetDatabase:
+    """Read-only queries over the database; each method is a fixed, parameterised statement.
+
+    sqlite3 keeps prepared statements per connection, so repeated queries skip
+    parsing. Windows are whole UTC days, start and end inclusive, given as
+    ISO dates; a missing bound means the start or end of the archive.
+    """
+
+    def __init__(self, filename=DATABASE_FILE):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f"{filename} not found, build it with tweetDatabase.py")
+        self.filename = filename
+        self.local = threading.local()
+        version = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is None or int(version[0]) != DATABASE_VERSION:
+            raise Exception(f"{filename} was written by an older version, rebuild it")
+
+    @property
+    def db(self):
+        # One connection per thread, as sqlite3 connections can't be shared between threads
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.filename}?mode=ro", uri=True, cached_statements=64)
+            self.local.connection = connection
+        return connection
+
+    def _days(self, start, end):
+        first, last = self.db.execute("SELECT MIN(day), MAX(day) FROM daily").fetchone()
+        if first is None:
+            return None
+        return max(parse_day(start, first), first), min(parse_day(end, last), last)
+
+    def _seconds(self, start, end):
+        return parse_day(start, -(1 << 40)) * SECONDS_PER_DAY, (parse_day(end, 1 << 40) + 1) * SECONDS_PER_DAY
+
+    def window_totals(self, start=None, end=None):
+        """Tweets, quotes, likes and retweets in a window: two prefix-sum lookups"""
+        totals = {'start': start, 'end': end, 'tweets': 0, 'quotes': 0, 'likes': 0, 'retweets': 0}
+        days = self._days(start, end)
+        if days is None or days[0] > days[1]:
+            return totals
+        first, last = days
+        lookup = "SELECT cum_tweets, cum_quotes, cum_likes, cum_retweets FROM daily WHERE day = ?"
+        upper = self.db.execute(lookup, (last,)).fetchone()
+        lower = self.db.execute(lookup, (first - 1,)).fetchone() or (0, 0, 0, 0)
+        for field, high, low in zip(('tweets', 'quotes', 'likes', 'retweets'), upper, lower):
+            totals[field] = high - low
+        totals.update(start=format_day(first), end=format_day(last))
+        return totals
+
+    def daily(self, start=None, end=None):
+        days = self._days(start, end)
+        if days is None:
+            return []
+        return [
+            {'day': format_day(day), 'tweets': tweets, 'quotes': quotes, 'likes': likes, 'retweets': retweets}
+            for day, tweets, quotes, likes, retweets in self.db.execute(
+                "SELECT day, tweets, quotes, likes, retweets FROM daily WHERE day BETWEEN ? AND ? ORDER BY day",
+                days)
+        ]
+
+    def top_quoted(self, start=None, end=None, limit=10):
+        """Tweets quoted most often by quotes made inside the window"""
+        rows = self.db.execute(
+            "SELECT q.quoted_id, COUNT(*) AS quotes, t.full_text, t.created_at "
+            "FROM quotes q LEFT JOIN tweets t ON t.id = q.quoted_id "
+            "WHERE q.created_at >= ? AND q.created_at < ? "
+            "GROUP BY q.quoted_id ORDER BY quotes DESC, q.quoted_id LIMIT ?",
+            (*self._seconds(start, end), limit))
+        return [
+            {'tweet_id': str(tweet_id), 'count': count, 'tweet_text': text,
+             'created_at': created_at}
+            for tweet_id, count, text, created_at in rows
+        ]
+
+    def top_tweets(self, start=None, end=None, by='likes', limit=10):
+        """Tweets written inside the window with the most likes or retweets"""
+        column = {'likes': 'favorite_count', 'retweets': 'retweet_count'}.get(by)
+        if column is None:
+            raise ValueError(f"Can't rank tweets by {by}")
+        rows = self.db.execute(
+            f"SELECT id, full_text, created_at, favorite_count, retweet_count FROM tweets "
+            f"WHERE created_at >= ? AND created_at < ? ORDER BY {column} DESC, id LIMIT ?",
+            (*self._seconds(start, end), limit))
+        return [
+            {'tweet_id': str(tweet_id), 'tweet_text': text, 'created_at': created_at,
+             'favorite_count': likes, 'retweet_count': retweets}
+            for tweet_id, text, created_at, likes, retweets in rows
+        ]
+
+    def thread_stats(self, start=None, end=None):
+        """thread_statistics.json for the threads started inside the window"""
+        window = self._seconds(start, end)
+        total, average = self.db.execute(
+            "SELECT COUNT(*), AVG(length) FROM threads WHERE created_at >= ? AND created_at < ?", window).fetchone()
+        longest = self.db.execute(
+            "SELECT start_id, length, total_likes, total_retweets FROM threads "
+            "WHERE created_at >= ? AND created_at < ? ORDER BY length DESC, start_id LIMIT 1", window).fetchone()
+        return {
+            'total_threads': total,
+            'longest_thread': {
+                'length': longest[1],
+                'thread_id': str(longest[0]),
+                'total_likes': longest[2],
+                'total_retweets': longest[3],
+            } if longest else None,
+            'average_thread_length': round(average or 0, 2),
+        }
+
+    def tweet(self, tweet_id):
+        row = self.db.execute(
+            "SELECT id, full_text, created_at, favorite_count, retweet_count, in_reply_to_status_id "
+            "FROM tweets WHERE id = ?", (int(tweet_id),)).fetchone()
+        if row is None:
+            return None
+        quoted_by = self.db.execute("SELECT COUNT(*) FROM quotes WHERE quoted_id = ?", (int(tweet_id),)).fetchone()[0]
+        replies = self.db.execute(
+            "SELECT COUNT(*) FROM tweets WHERE in_reply_to_status_id = ?", (int(tweet_id),)).fetchone()[0]
+        return {
+            'tweet_id': str(row[0]),
+            'tweet_text': row[1],
+            'created_at': row[2],
+            'favorite_count': row[3],
+            'retweet_count': row[4],
+            'in_reply_to_status_id': str(row[5]) if row[5] else None,
+            'quoted_by': quoted_by,
+            'replies': replies,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the analysed tweets into an indexed SQLite database")
+    parser.add_argument('--output', default=DATABASE_FILE)
+    args = parser.parse_args()
+
+    started = time.time()
+    records = load_records(default_tweets_file())
+    threads = load_json_file('twitter_threads.json') if os.path.exists('twitter_threads.json') else {}
+    build_database(records, threads, filename=args.output)
+    print(f"Built in {time.time() - started:.1f}s; serve it with queryServer.py", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import json
+import mmap
+import os
+import re
+from array import array
+from datetime import datetime, timezone
+import numpy as np
+
+from processTweets import (
+    SELF_QUOTE_HANDLE,
+    build_tweet_results,
+    parse_created_at,
+    quote_pattern,
+    thread_entry,
+    thread_statistics,
+)
+from threadForest import MISSING_TIME, ConversationForest
+
+STORE_DIR = 'tweet_store'
+STORE_VERSION = 1
+NULL = b'\x00'  # stored in string columns for a missing value, as opposed to ''
+FLUSH_EVERY = 65536
+INT64_MAX = np.iinfo(np.int64).max
+
+# One value per tweet (array typecode, numpy dtype)
+FIXED_COLUMNS = {
+    'id': ('q', np.int64),
+    'reply_to': ('q', np.int64),
+    'reply_to_user': ('q', np.int64),
+    'created_at': ('q', np.int64),
+    'favorite_count': ('i', np.int32),
+    'retweet_count': ('i', np.int32),
+    'retweeted': ('b', np.int8),
+}
+# Start of each tweet's rows in the url / mention tables, plus a final end offset
+RANGE_COLUMNS = ('url_start', 'mention_start')
+# Offsets into a UTF-8 blob; one row per tweet, url or mention
+STRING_COLUMNS = (
+    'text',
+    'reply_to_screen_name',
+    'url',
+    'expanded_url',
+    'display_url',
+    'mention_name',
+    'mention_screen_name',
+)
+
+def format_created_at(timestamp):
+    if timestamp == MISSING_TIME:
+        return None
+    return datetime.fromtimestamp(int(timestamp), timezone.utc).strftime('%a %b %d %H:%M:%S +0000 %Y')
+
+def to_int(value):
+    return int(value) if value not in (None, '') else 0
+
+class _ColumnWriter:
+    """Buffers one fixed-width column and appends it to disk in blocks"""
+
+    def __init__(self, path, typecode, initial=()):
+        self.f = open(path, 'wb')
+        self.values = array(typecode, initial)
+
+    def append(self, value):
+        self.values.append(value)
+        if len(self.values) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        self.values.tofile(self.f)
+        del self.values[:]
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+class _StringColumnWriter:
+    """Appends strings to a blob file and records their end offsets"""
+
+    def __init__(self, path):
+        self.blob = open(f"{path}.blob", 'wb')
+        self.offsets = _ColumnWriter(f"{path}.offsets", 'q', [0])
+        self.size = 0
+
+    def append(self, value):
+        data = NULL if value is None else value.encode('utf-8')
+        self.blob.write(data)
+        self.size += len(data)
+        self.offsets.append(self.size)
+
+    def close(self):
+        self.blob.close()
+        self.offsets.close()
+
+class TweetStoreWriter:
+    """Builds the columnar store one tweet at a time, so ingestion memory stays flat"""
+
+    def __init__(self, path=STORE_DIR):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.count = 0
+        self.url_count = 0
+        self.mention_count = 0
+        self.count_type = None
+        self.fixed = {
+            name: _ColumnWriter(os.path.join(path, f"{name}.bin"), typecode)
+            for name, (typecode, _) in FIXED_COLUMNS.items()
+        }
+        self.ranges = {
+            name: _ColumnWriter(os.path.join(path, f"{name}.bin"), 'q', [0])
+            for name in RANGE_COLUMNS
+        }
+        self.strings = {
+            name: _StringColumnWriter(os.path.join(path, name))
+            for name in STRING_COLUMNS
+        }
+
+    def write(self, tweet):
+        if 'tweet' in tweet:
+            tweet = tweet['tweet']
+        if 'id_str' not in tweet:
+            return
+        if self.count_type is None:
+            # Archives store counts as strings; remember so outputs keep the same type
+            self.count_type = 'str' if isinstance(tweet.get('favorite_count'), str) else 'int'
+
+        fixed = self.fixed
+        fixed['id'].append(int(tweet['id_str']))
+        fixed['reply_to'].append(to_int(tweet.get('in_reply_to_status_id_str')))
+        fixed['reply_to_user'].append(to_int(tweet.get('in_reply_to_user_id_str')))
+        fixed['created_at'].append(parse_created_at(tweet.get('created_at')))
+        fixed['favorite_count'].append(to_int(tweet.get('favorite_count')))
+        fixed['retweet_count'].append(to_int(tweet.get('retweet_count')))
+        fixed['retweeted'].append(1 if tweet.get('retweeted') else 0)
+
+        strings = self.strings
+        strings['text'].append(tweet.get('full_text'))
+        strings['reply_to_screen_name'].append(tweet.get('in_reply_to_screen_name'))
+
+        entities = tweet.get('entities', {})
+        for url in entities.get('urls', []):
+            strings['url'].append(url.get('url'))
+            strings['expanded_url'].append(url.get('expanded_url'))
+            strings['display_url'].append(url.get('display_url'))
+            self.url_count += 1
+        for mention in entities.get('user_mentions', []):
+            strings['mention_name'].append(mention.get('name'))
+            strings['mention_screen_name'].append(mention.get('screen_name'))
+            self.mention_count += 1
+        self.ranges['url_start'].append(self.url_count)
+        self.ranges['mention_start'].append(self.mention_count)
+        self.count += 1
+
+    def close(self):
+        for column in (*self.fixed.values(), *self.ranges.values(), *self.strings.values()):
+            column.close()
+        meta = {
+            'version': STORE_VERSION,
+            'count': self.count,
+            'url_count': self.url_count,
+            'mention_count': self.mention_count,
+            'count_type': self.count_type or 'str',
+        }
+        with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    def abort(self):
+        """Close the columns without the meta.json that would let the partial store be opened"""
+        for column in (*self.fixed.values(), *self.ranges.values(), *self.strings.values()):
+            column.close()
+        meta_file = os.path.join(self.path, 'meta.json')
+        if os.path.exists(meta_file):
+            os.remove(meta_file)
+
+def _map_array(path, dtype, length):
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(length,))
+
+def _map_blob(path):
+    if os.path.getsize(path) == 0:
+        return b''
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class StringColumn:
+    def __init__(self, path, length):
+        self.offsets = _map_array(f"{path}.offsets", np.int64, length + 1)
+        self.blob = _map_blob(f"{path}.blob")
+
+    def __getitem__(self, row):
+        data = self.blob[self.offsets[row]:self.offsets[row + 1]]
+        return None if data == NULL else data.decode('utf-8')
+
+    def rows_at(self, positions):
+        """Map byte positions in the blob back to the rows that contain them"""
+        return np.searchsorted(self.offsets, positions, side='right') - 1
+
+class TweetStore:
+    """Read-only, memory-mapped view of the columnar store"""
+
+    def __init__(self, path=STORE_DIR):
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != STORE_VERSION:
+            raise Exception(f"Tweet store in {path} was written by an older version, rebuild it")
+        self.count = meta['count']
+        self.count_type = meta['count_type']
+        for name, (_, dtype) in FIXED_COLUMNS.items():
+            setattr(self, name, _map_array(os.path.join(path, f"{name}.bin"), dtype, self.count))
+        self.url_start = _map_array(os.path.join(path, 'url_start.bin'), np.int64, self.count + 1)
+        self.mention_start = _map_array(os.path.join(path, 'mention_start.bin'), np.int64, self.count + 1)
+        row_counts = {'url': meta['url_count'], 'expanded_url': meta['url_count'], 'display_url': meta['url_count'],
+                      'mention_name': meta['mention_count'], 'mention_screen_name': meta['mention_count']}
+        self.strings = {
+            name: StringColumn(os.path.join(path, name), row_counts.get(name, self.count))
+            for name in STRING_COLUMNS
+        }
+        self._sorted_ids = None
+
+    def _id_order(self):
+        if self._sorted_ids is None:
+            order = np.argsort(self.id, kind='stable')
+            self._sorted_ids = (self.id[order], order)
+        return self._sorted_ids
+
+    def rows_for_ids(self, ids):
+        """Row of each id (the last one if duplicated), or -1 when it isn't in the archive"""
+        sorted_ids, order = self._id_order()
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(sorted_ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        positions = np.searchsorted(sorted_ids, ids, side='right') - 1
+        found = (positions >= 0) & (sorted_ids[np.maximum(positions, 0)] == ids)
+        return np.where(found, order[np.maximum(positions, 0)], -1)
+
+    def _count_value(self, value):
+        return str(int(value)) if self.count_type == 'str' else int(value)
+
+    def record(self, row):
+        """Rebuild the projected record processTweets.project_tweet would produce for a row"""
+        strings = self.strings
+        record = {
+            'id_str': str(int(self.id[row])),
+            'full_text': strings['text'][row],
+            'created_at': format_created_at(self.created_at[row]),
+            'retweeted': bool(self.retweeted[row]),
+            'favorite_count': self._count_value(self.favorite_count[row]),
+            'retweet_count': self._count_value(self.retweet_count[row]),
+            'in_reply_to_status_id_str': str(int(self.reply_to[row])) if self.reply_to[row] else None,
+            'in_reply_to_user_id_str': str(int(self.reply_to_user[row])) if self.reply_to_user[row] else None,
+            'in_reply_to_screen_name': strings['reply_to_screen_name'][row],
+        }
+        record['user_mentions'] = [
+            {
+                'name': strings['mention_name'][m],
+                'screen_name': strings['mention_screen_name'][m]
+            }
+            for m in range(self.mention_start[row], self.mention_start[row + 1])
+        ]
+        record['urls'] = [
+            {
+                'url': strings['url'][u],
+                'expanded_url': strings['expanded_url'][u],
+                'display_url': strings['display_url'][u]
+            }
+            for u in range(self.url_start[row], self.url_start[row + 1])
+        ]
+        return record
+
+    def tweet(self, row):
+        """A tweet-shaped dict with the fields the site reads from selfQuotedTweets.json"""
+        record = self.record(row)
+        return {
+            'id_str': record['id_str'],
+            'full_text': record['full_text'],
+            'created_at': record['created_at'],
+            'retweeted': record['retweeted'],
+            'favorite_count': record['favorite_count'],
+            'retweet_count': record['retweet_count'],
+            'in_reply_to_status_id_str': record['in_reply_to_status_id_str'],
+            'in_reply_to_user_id_str': record['in_reply_to_user_id_str'],
+            'in_reply_to_screen_name': record['in_reply_to_screen_name'],
+            'entities': {'urls': record['urls'], 'user_mentions': record['user_mentions']},
+        }
+
+    def url_tweet_rows(self, url_rows):
+        return np.searchsorted(self.url_start, url_rows, side='right') - 1
+
+class StoreRecords:
+    """dict-like id_str -> record lookup so the dict-based joins can run on the store"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, tweet_id, default=None):
+        if not tweet_id.isdigit() or int(tweet_id) > INT64_MAX:
+            return default
+        row = self.store.rows_for_ids([int(tweet_id)])[0]
+        return self.store.record(row) if row >= 0 else default
+
+def _url_rows(store, handle):
+    """Rows of the expanded URLs containing handle in any case, found in one pass over the blob"""
+    column = store.strings['expanded_url']
+    handle = handle.encode()
+    # Zero-width, so an occurrence straddling two URLs can't swallow one inside a URL
+    occurrences = re.compile(b'(?=' + re.escape(handle) + b')', re.IGNORECASE)
+    starts = np.fromiter((m.start() for m in occurrences.finditer(column.blob)), dtype=np.int64)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    rows = column.rows_at(starts)
+    inside = rows == column.rows_at(starts + len(handle) - 1)
+    return np.unique(rows[inside])
+
+def _url_matches(store, handle, pattern):
+    """(url row, match) of pattern searched in each expanded URL that contains handle.
+
+    Each URL is searched on its own slice of the blob, so a match can't run
+    on into the bytes of the next URL.
+    """
+    column = store.strings['expanded_url']
+    rows, matches = [], []
+    for row in _url_rows(store, handle).tolist():
+        match = pattern.search(column.blob[column.offsets[row]:column.offsets[row + 1]])
+        if match:
+            rows.append(row)
+            matches.append(match)
+    return np.asarray(rows, dtype=np.int64), matches
+
+def find_self_quotes(store, handle=SELF_QUOTE_HANDLE):
+    """Rows of tweets linking to a URL that contains the handle"""
+    print("\n=== Finding self-quoted tweets (store) ===", flush=True)
+    url_rows = _url_rows(store, handle)
+    rows = np.unique(store.url_tweet_rows(url_rows))
+    print(f"Found {len(rows)} self-quoted tweets", flush=True)
+    return rows
+
+def count_quote_tweets(store, handle=SELF_QUOTE_HANDLE):
+    print("\n=== Counting quote tweets (store) ===", flush=True)
+    url_rows, matches = _url_matches(store, handle, re.compile(quote_pattern(handle).pattern.encode(), re.IGNORECASE))
+    if len(url_rows) == 0:
+        return {"tweet_counts": []}
+    quoted_ids = np.array([match.group(1).decode() for match in matches])
+    unique_ids, first_seen, counts = np.unique(quoted_ids, return_index=True, return_counts=True)
+    # Highest count first, ties in the order they were first quoted
+    order = np.lexsort((first_seen, -counts))
+    result = {
+        "tweet_counts": [
+            {"tweet_id": str(unique_ids[i]), "count": int(counts[i])}
+            for i in order
+        ]
+    }
+    print(f"Processed {len(result['tweet_counts'])} unique quoted tweets", flush=True)
+    return result
+
+def extract_tweet_info(store, count_data):
+    print("\n=== Extracting tweet info (store) ===", flush=True)
+    return build_tweet_results(count_data, StoreRecords(store))
+
+def find_threads(store):
+    print("\n=== Finding threads (store) ===", flush=True)
+    forest = ConversationForest(store.id, store.reply_to, store.created_at,
+                                store.favorite_count, store.retweet_count)
+    thread_starts = forest.thread_starts()
+    print(f"Found {len(thread_starts)} thread starts")
+
+    threads = {}
+    for row in thread_starts.tolist():
+        thread = [store.record(r) for r in forest.main_chain(row)]
+        threads[thread[0]['id_str']] = thread_entry(thread, forest.subtree_metrics(row))
+    return threads, thread_statistics(threads)
+
+def analyse_store(path=STORE_DIR, handle=SELF_QUOTE_HANDLE):
+    """Produce the processTweets outputs from the columnar store instead of raw tweets"""
+    store = TweetStore(path)
+    print(f"✓ Opened tweet store with {store.count} tweets", flush=True)
+    self_quoted_rows = find_self_quotes(store, handle)
+    count_data = count_quote_tweets(store, handle)
+    results, not_found_tweets = extract_tweet_info(store, count_data)
+    threads, thread_stats = find_threads(store)
+    return {
+        'selfQuotedTweets.json': [store.tweet(row) for row in self_quoted_rows],
+        'countSelfQuotes.json': count_data,
+        'tweet_results.json': results,
+        'not_found_tweets.json': not_found_tweets,
+        'twitter_threads.json': threads,
+        'thread_statistics.json': thread_stats,
+    }
@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from process_all import USERNAME, build_pipeline
+from publish import PUBLIC_DIR
+from telemetry import telemetry
+
+HOST = '127.0.0.1'
+PORT = 8765
+POLL_SECONDS = 5
+COMMANDS = ('run', 'fetch', 'status', 'stop')
+
+class Watcher:
+    """Runs the pipeline again in this process whenever the archive changes or a trigger arrives.
+
+    Imports stay loaded and the analyses of the last run stay in memory, so a
+    run only parses the archive and applies the tweets it added or changed.
+    Every run goes through the same pipeline and writes the same files as a
+    cold process_all.py run; if a run fails, the next one resumes from the
+    state on disk instead.
+    """
+
+    def __init__(self, username=USERNAME, database=False, resolve=False):
+        self.username = username
+        self.archive_file = f'{username}.json'
+        self.database = database
+        self.resolve = resolve
+        self.resident = {}
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.last_run = None
+        self.seen = None
+        self.stopping = threading.Event()
+
+    def preload(self):
+        """Read the saved analysis state once, so even the first change is applied from memory"""
+        from processTweets import load_state
+        state = load_state()
+        if state is not None:
+            self.resident['state'] = state
+            print(f"✓ Loaded the state of {state['tweet_count']} tweets", flush=True)
+
+    def archive_signature(self):
+        try:
+            stat = os.stat(self.archive_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def run(self, fetch=False, reason='trigger'):
+        """Run the pipeline once, one run at a time; returns a summary of the run"""
+        with self.lock:
+            print(f"\n=== Run {self.runs + 1} ({reason}) ===", flush=True)
+            telemetry.reset()
+            started = time.perf_counter()
+            status, error = 'ok', None
+            try:
+                build_pipeline(self.username, fetch=fetch, database=self.database, resolve=self.resolve,
+                               resident=self.resident).run()
+            except Exception as e:
+                status, error = 'failed', str(e)
+                print(f"\n❌ Error: {error}", flush=True)
+            telemetry.write_report(status)
+            # A fetch rewrites the archive itself; that isn't a change to run again for
+            self.seen = self.archive_signature()
+            self.runs += 1
+            self.last_run = {
+                'run': self.runs,
+                'reason': reason,
+                'status': status,
+                'error': error,
+                'seconds': round(time.perf_counter() - started, 2),
+                'finished': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }
+            print(f"{'✓' if status == 'ok' else '❌'} Run {self.runs} {status} in {self.last_run['seconds']}s",
+                  flush=True)
+            return self.last_run
+
+    def status(self):
+        return {
+            'username': self.username,
+            'runs': self.runs,
+            'last_run': self.last_run,
+            'resident_state': 'state' in self.resident or 'analyses' in self.resident,
+            'running': self.lock.locked(),
+        }
+
+    def watch(self, interval=POLL_SECONDS):
+        """Poll the archive and run when it has changed and stopped changing"""
+        if self.seen is None:
+            self.seen = self.archive_signature()
+        pending = None
+        while not self.stopping.wait(interval):
+            signature = self.archive_signature()
+            if signature is None or signature == self.seen:
+                pending = None
+                continue
+            # Wait for one quiet interval, so an archive still being copied in isn't read half-written
+            if signature != pending:
+                pending = signature
+                continue
+            pending = None
+            self.run(reason=f"{self.archive_file} changed")
+
+class TriggerHandler(socketserver.StreamRequestHandler):
+    """One command per connection: a line with run, fetch, status or stop; the reply is one JSON line"""
+
+    def handle(self):
+        watcher = self.server.watcher
+        command = self.rfile.readline().decode('utf-8').strip()
+        if command == 'run':
+            reply = watcher.run()
+        elif command == 'fetch':
+            reply = watcher.run(fetch=True, reason='fetch')
+        elif command == 'status':
+            reply = watcher.status()
+        elif command == 'stop':
+            reply = {'status': 'stopping'}
+            watcher.stopping.set()
+        else:
+            reply = {'status': 'failed', 'error': f"unknown command {command!r}, expected one of {COMMANDS}"}
+        self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+class TriggerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def serve(watcher, host=HOST, port=PORT, interval=POLL_SECONDS):
+    server = TriggerServer((host, port), TriggerHandler)
+    server.watcher = watcher
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Watching {watcher.archive_file} every {interval}s; triggers on {host}:{port}", flush=True)
+    try:
+        watcher.watch(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("Stopped watching", flush=True)
+
+def send(command, host=HOST, port=PORT, timeout=None):
+    """Send a command to a running watch process and return its reply"""
+    with socket.create_connection((host, port), timeout=timeout) as connection:
+        connection.sendall(f"{command}\n".encode('utf-8'))
+        reply = connection.makefile('r', encoding='utf-8').readline()
+    return json.loads(reply)
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the pipeline resident and rerun it when the archive changes")
+    parser.add_argument('--username', default=USERNAME, help=f"account to watch (default: {USERNAME})")
+    parser.add_argument('--database', action='store_true', help="also rebuild tweets.db on every run")
+    parser.add_argument('--resolve', action='store_true', help="also look up quoted tweets missing from the archive")
+    parser.add_argument('--interval', type=float, default=POLL_SECONDS, help="seconds between archive checks")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--no-initial-run', action='store_true',
+                        help="wait for a change or trigger instead of running once at startup")
+    parser.add_argument('--trigger', choices=COMMANDS,
+                        help="send a command to the watch process already running and print its reply")
+    args = parser.parse_args()
+
+    if args.trigger:
+        try:
+            reply = send(args.trigger, args.host, args.port)
+        except OSError as e:
+            print(f"❌ No watch process on {args.host}:{args.port}: {str(e)}", flush=True)
+            raise SystemExit(2)
+        print(json.dumps(reply, indent=2), flush=True)
+        if reply.get('status') == 'failed':
+            raise SystemExit(1)
+        return
+
+    os.makedirs(PUBLIC_DIR, exist_ok=True)
+    watcher = Watcher(args.username, args.database, args.resolve)
+    watcher.preload()
+    if not args.no_initial_run:
+        # Catches up on an archive that changed while nothing was watching
+        watcher.run(reason='startup')
+    serve(watcher, args.host, args.port, args.interval)
+
+if __name__ == "__main__":
+    main()